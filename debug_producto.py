@@ -133,7 +133,7 @@ if form_completo.is_valid() and formset_completo.is_valid():
                 talla.save()
                 print(f"    [OK] Talla guardada: {talla.talla} (Stock: {talla.stock})")
 
-    print(f"\n    Stock total del producto: {producto.stock_total()}")
+    print(f"\n    Stock total del producto: {producto.stock_total}")
     print("    [OK] PRODUCTO CREADO CON EXITO")
 else:
     print(f"\n    [ERROR] ERROR EN LOS FORMULARIOS")
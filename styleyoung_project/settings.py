@@ -189,6 +189,47 @@ REST_FRAMEWORK = {
     ],
 }
 
+# ========================================
+# CACHÉ
+# ========================================
+# Con CACHE_DIR la caché es de archivos y la comparten todos los workers de
+# gunicorn: la versión del catálogo (facetas, fragmentos HTML, autocompletado)
+# y el resumen de pedidos se invalidan en todos los procesos. La imagen de
+# Docker y docker-compose lo definen; sin él (runserver, pruebas) se usa
+# LocMemCache, una caché por proceso.
+CACHE_DIR = os.getenv('CACHE_DIR')
+if CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+
+# ========================================
+# CATÁLOGO
+# ========================================
+# Paginación por cursor (keyset) en /productos/ en lugar de páginas numeradas
+CATALOGO_PAGINACION_KEYSET = os.getenv('CATALOGO_PAGINACION_KEYSET', 'False').lower() == 'true'
+
+# ========================================
+# CARRITO
+# ========================================
+# Minutos que las unidades agregadas al carrito quedan reservadas para el usuario
+CARRITO_RESERVA_MINUTOS = int(os.getenv('CARRITO_RESERVA_MINUTOS', '15'))
+
+# Checkout en cola: la vista solo valida y registra el pedido, y el comando
+# procesar_pedidos crea las líneas y descuenta el stock por lotes
+CHECKOUT_EN_COLA = os.getenv('CHECKOUT_EN_COLA', 'False').lower() == 'true'
+
+# Horas que se guarda la respuesta de un POST con clave de idempotencia
+# (checkout y cambios de estado de pedidos) para responder a los reintentos
+IDEMPOTENCIA_HORAS = int(os.getenv('IDEMPOTENCIA_HORAS', '24'))
+
+# Días tras los que los pedidos entregados o cancelados pasan a las tablas de
+# archivo (manage.py archivar_pedidos); los listados y reportes los siguen leyendo
+ARCHIVO_PEDIDOS_DIAS = int(os.getenv('ARCHIVO_PEDIDOS_DIAS', '365'))
+
 # ========================================
 # CORS CONFIGURATION (para que otros puedan consumir la API)
 # ========================================
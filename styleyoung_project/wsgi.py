@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'styleyoung_project.settings')
 
 application = get_wsgi_application()
+
+# Precargar el índice de autocompletado en memoria de cada worker
+try:
+    from tienda.services.autocompletado import IndiceAutocompletado
+    IndiceAutocompletado.cargar()
+except Exception as e:
+    # Sin base de datos (p. ej. antes de migrar) se cargará en la primera búsqueda
+    logging.getLogger(__name__).warning("No se pudo precargar el autocompletado: %s", e)
@@ -1,8 +1,11 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from .models import (
     Categoria, Producto, Talla, CarritoCompras, 
-    ItemCarrito, Pedido, ItemPedido, ImagenProducto
+    ItemCarrito, Pedido, ItemPedido, ImagenProducto, CambioEstadoPedido,
+    PedidoArchivado, ItemPedidoArchivado, CambioEstadoPedidoArchivado
 )
+from .services.estados_pedido import TransicionesPedido
 
 
 @admin.register(Categoria)
@@ -11,8 +14,23 @@ class CategoriaAdmin(admin.ModelAdmin):
     search_fields = ('nombre',)
 
 
+class TallaForm(forms.ModelForm):
+    """En una talla fraccionada el stock muestra y fija las unidades libres de sus fracciones"""
+
+    class Meta:
+        model = Talla
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and self.instance.fracciones:
+            self.initial['stock'] = self.instance.disponible
+            self.fields['stock'].help_text = f'Unidades libres en {self.instance.fracciones} fracciones'
+
+
 class TallaInline(admin.TabularInline):
     model = Talla
+    form = TallaForm
     extra = 5
 
 
@@ -31,7 +49,7 @@ class ProductoAdmin(admin.ModelAdmin):
     fields = ('nombre', 'descripcion', 'precio', 'marca', 'color', 'material', 'categoria', 'imagen_principal')
     
     def tiene_imagen(self, obj):
-        return bool(obj.imagen_principal or obj.imagenes.exists())
+        return bool(obj.imagen_principal or obj.imagen_resuelta)
     tiene_imagen.boolean = True
     tiene_imagen.short_description = 'Tiene imagen'
 
@@ -46,6 +64,7 @@ class ImagenProductoAdmin(admin.ModelAdmin):
 
 @admin.register(Talla)
 class TallaAdmin(admin.ModelAdmin):
+    form = TallaForm
     list_display = ('producto', 'talla', 'stock')
     list_filter = ('talla', 'producto__categoria')
     search_fields = ('producto__nombre',)
@@ -70,24 +89,93 @@ class ItemPedidoInline(admin.TabularInline):
     readonly_fields = ('calcular_subtotal',)
     extra = 0
 
+    def has_add_permission(self, request, obj=None):
+        # Las líneas se crean en el checkout, que descuenta el stock
+        return False
+
+
+class CambioEstadoPedidoInline(admin.TabularInline):
+    model = CambioEstadoPedido
+    fields = ('fecha', 'estado_anterior', 'estado_nuevo')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 
 @admin.register(Pedido)
 class PedidoAdmin(admin.ModelAdmin):
     list_display = ('id', 'usuario', 'estado', 'total', 'fecha_pedido')
     list_filter = ('estado', 'fecha_pedido')
     search_fields = ('usuario__nombre', 'usuario__email', 'id')
-    inlines = [ItemPedidoInline]
+    inlines = [ItemPedidoInline, CambioEstadoPedidoInline]
     
-    actions = ['marcar_como_procesando', 'marcar_como_enviado', 'marcar_como_entregado']
+    actions = ['marcar_como_procesando', 'marcar_como_enviado', 'marcar_como_entregado', 'marcar_como_cancelado']
+
+    def get_readonly_fields(self, request, obj=None):
+        # El estado de un pedido existente solo cambia con las acciones (ver TransicionesPedido)
+        campos = super().get_readonly_fields(request, obj)
+        return (*campos, 'estado') if obj is not None else campos
+
+    def _cambiar_estado(self, request, queryset, estado):
+        """Transición en bloque con las mismas reglas y ajustes de ventas que el panel"""
+        resultado = TransicionesPedido.aplicar(queryset.values_list('pk', flat=True), estado)
+        self.message_user(request, f'{len(resultado["actualizados"])} pedido(s) actualizados.')
+        for pedido_id, motivo in resultado['rechazados'].items():
+            self.message_user(request, f'Pedido #{pedido_id}: {motivo}', level=messages.WARNING)
     
     def marcar_como_procesando(self, request, queryset):
-        queryset.update(estado='procesando')
+        self._cambiar_estado(request, queryset, 'procesando')
     marcar_como_procesando.short_description = "Marcar como procesando"
     
     def marcar_como_enviado(self, request, queryset):
-        queryset.update(estado='enviado')
+        self._cambiar_estado(request, queryset, 'enviado')
     marcar_como_enviado.short_description = "Marcar como enviado"
     
     def marcar_como_entregado(self, request, queryset):
-        queryset.update(estado='entregado')
+        self._cambiar_estado(request, queryset, 'entregado')
     marcar_como_entregado.short_description = "Marcar como entregado"
+
+    def marcar_como_cancelado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'cancelado')
+    marcar_como_cancelado.short_description = "Cancelar (devuelve el stock)"
+
+
+class ItemPedidoArchivadoInline(admin.TabularInline):
+    model = ItemPedidoArchivado
+    fields = ('producto', 'talla', 'cantidad', 'precio_unitario', 'calcular_subtotal')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class CambioEstadoPedidoArchivadoInline(admin.TabularInline):
+    model = CambioEstadoPedidoArchivado
+    fields = ('fecha', 'estado_anterior', 'estado_nuevo')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PedidoArchivado)
+class PedidoArchivadoAdmin(admin.ModelAdmin):
+    """Solo lectura: los pedidos llegan aquí con manage.py archivar_pedidos"""
+    list_display = ('id', 'usuario', 'estado', 'total', 'fecha_pedido', 'fecha_archivado')
+    list_filter = ('estado',)
+    search_fields = ('usuario__nombre', 'usuario__email', 'id')
+    readonly_fields = ('id', 'usuario', 'total', 'estado', 'fecha_pedido', 'direccion_entrega', 'fecha_archivado')
+    inlines = [ItemPedidoArchivadoInline, CambioEstadoPedidoArchivadoInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
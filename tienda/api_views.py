@@ -7,11 +7,12 @@ y también la usamos nosotros mismos para demostrar que funciona
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.db.models import Sum
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Producto, Categoria
+from .models import Producto, ProductoCatalogo, Categoria
 from .serializers import (
     ProductoSerializer,
-    ProductoListSerializer,
+    ProductoCatalogoSerializer,
     CategoriaSerializer
 )
 
@@ -46,14 +47,21 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
         completo para detalle
         """
         if self.action == 'list':
-            return ProductoListSerializer
+            return ProductoCatalogoSerializer
         return ProductoSerializer
 
     def get_queryset(self):
         """
         Filtros personalizados via query params
+
+        El listado se lee del modelo de lectura ProductoCatalogo (una sola
+        tabla); el detalle y las acciones que devuelven tallas e imágenes
+        anidadas siguen usando Producto.
         """
-        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = ProductoCatalogo.objects.all()
+        else:
+            queryset = super().get_queryset()
 
         # Filtro por categoría
         categoria_id = self.request.query_params.get('categoria', None)
@@ -88,9 +96,7 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
         Retorna solo productos que tienen stock disponible
         """
         # Obtener productos que tienen al menos una talla con stock
-        productos_con_stock = self.queryset.filter(
-            talla__stock__gt=0
-        ).distinct()
+        productos_con_stock = self.queryset.filter(en_stock=True)
 
         page = self.paginate_queryset(productos_con_stock)
         if page is not None:
@@ -119,9 +125,10 @@ class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
 
         Retorna estadísticas generales de productos
         """
-        total_productos = self.queryset.count()
-        productos_con_stock = self.queryset.filter(talla__stock__gt=0).distinct().count()
-        total_vendidos = sum(p.total_vendidos for p in self.queryset)
+        catalogo = ProductoCatalogo.objects.all()
+        total_productos = catalogo.count()
+        productos_con_stock = catalogo.filter(en_stock=True).count()
+        total_vendidos = catalogo.aggregate(total=Sum('total_vendidos'))['total'] or 0
 
         stats = {
             'total_productos': total_productos,
@@ -155,12 +162,12 @@ class CategoriaViewSet(viewsets.ReadOnlyModelViewSet):
         Retorna todos los productos de una categoría específica
         """
         categoria = self.get_object()
-        productos = categoria.producto_set.all()
+        productos = ProductoCatalogo.objects.filter(categoria=categoria).order_by('pk')
 
         page = self.paginate_queryset(productos)
         if page is not None:
-            serializer = ProductoListSerializer(page, many=True, context={'request': request})
+            serializer = ProductoCatalogoSerializer(page, many=True, context={'request': request})
             return self.get_paginated_response(serializer.data)
 
-        serializer = ProductoListSerializer(productos, many=True, context={'request': request})
+        serializer = ProductoCatalogoSerializer(productos, many=True, context={'request': request})
         return Response(serializer.data)
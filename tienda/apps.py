@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TiendaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tienda'
+
+    def ready(self):
+        # Registrar señales que mantienen los datos desnormalizados
+        from . import signals  # noqa: F401
@@ -0,0 +1,46 @@
+"""
+Mover al archivo los pedidos entregados o cancelados antiguos
+
+Pensado para cron fuera de horas pico. Cada lote es una transacción, así que
+se puede cortar en cualquier momento y la siguiente ejecución continúa con
+los pedidos que quedaron:
+    python manage.py archivar_pedidos
+    python manage.py archivar_pedidos --dias 180 --lote 200 --pausa 0.5 --max-lotes 50
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tienda.services.archivo_pedidos import ArchivoPedidos
+
+
+class Command(BaseCommand):
+    help = 'Mueve por lotes a las tablas de archivo los pedidos cerrados más antiguos que ARCHIVO_PEDIDOS_DIAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias', type=int, default=settings.ARCHIVO_PEDIDOS_DIAS,
+            help=f'Antigüedad mínima en días (default: {settings.ARCHIVO_PEDIDOS_DIAS})'
+        )
+        parser.add_argument(
+            '--lote', type=int, default=ArchivoPedidos.TAMANO_LOTE,
+            help=f'Pedidos por transacción (default: {ArchivoPedidos.TAMANO_LOTE})'
+        )
+        parser.add_argument(
+            '--pausa', type=float, default=0,
+            help='Segundos de espera entre lotes para no saturar la base de datos'
+        )
+        parser.add_argument(
+            '--max-lotes', type=int, default=None,
+            help='Terminar tras esta cantidad de lotes (el resto queda para la próxima ejecución)'
+        )
+
+    def handle(self, *args, **options):
+        resultado = ArchivoPedidos.archivar(
+            dias=options['dias'],
+            tamano_lote=options['lote'],
+            pausa=options['pausa'],
+            max_lotes=options['max_lotes'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{resultado["archivados"]} pedidos archivados en {resultado["lotes"]} lotes '
+            f'({resultado["segundos"]:.2f}s); quedan {resultado["restantes"]} por archivar'
+        ))
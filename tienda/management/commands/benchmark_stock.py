@@ -0,0 +1,100 @@
+"""
+Comparar la venta concurrente sobre una talla con y sin fracciones
+
+Crea un producto temporal, lanza varios hilos que venden de a una unidad
+y muestra operaciones por segundo, errores y si el stock final cuadra. Los
+dos casos ejecutan solo el descuento del checkout, sin señales ni libro de
+movimientos: el UPDATE condicional sobre la fila de la talla contra
+StockFraccionado.descontar, así la diferencia es la contención de la fila.
+Los números solo son representativos sobre PostgreSQL; SQLite serializa
+todas las escrituras:
+    python manage.py benchmark_stock
+    python manage.py benchmark_stock --hilos 16 --operaciones 200 --fracciones 16
+"""
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from tienda.models import Categoria, FraccionStock, Producto, Talla
+from tienda.services.fracciones import StockFraccionado
+
+
+class Command(BaseCommand):
+    help = 'Mide la venta concurrente de una talla con un contador único y con contadores fraccionados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Hilos concurrentes (default: 8)')
+        parser.add_argument('--operaciones', type=int, default=100, help='Ventas por hilo (default: 100)')
+        parser.add_argument(
+            '--fracciones', type=int, default=StockFraccionado.FRACCIONES,
+            help=f'Fracciones de la talla (default: {StockFraccionado.FRACCIONES})'
+        )
+
+    def handle(self, *args, **options):
+        hilos, operaciones = options['hilos'], options['operaciones']
+        stock_inicial = hilos * operaciones
+        categoria = Categoria.objects.create(nombre='benchmark_stock', descripcion='')
+        producto = Producto.objects.create(
+            nombre='benchmark_stock', descripcion='', precio=1, categoria=categoria
+        )
+        try:
+            def una_fila(talla_id):
+                with transaction.atomic():
+                    # Mismo UPDATE que ServicioCheckout para una talla sin reserva
+                    return Talla.objects.filter(
+                        pk=talla_id, stock__gte=F('reservado') + 1
+                    ).update(stock=F('stock') - 1)
+
+            def fraccionada(talla_id):
+                with transaction.atomic():
+                    return StockFraccionado.descontar(talla_id, options['fracciones'], 1)
+
+            for nombre, vender, fraccionar in (('Una fila', una_fila, False), ('Fraccionado', fraccionada, True)):
+                talla = Talla.objects.create(producto=producto, talla='M', stock=stock_inicial)
+                if fraccionar:
+                    StockFraccionado.activar(talla.pk, options['fracciones'])
+                vendidas, errores, segundos = self._medir(vender, talla.pk, hilos, operaciones)
+                if fraccionar:
+                    final = FraccionStock.objects.filter(talla=talla).aggregate(total=Sum('stock'))['total']
+                else:
+                    final = Talla.objects.get(pk=talla.pk).stock
+                cuadra = final == stock_inicial - vendidas
+                estilo = self.style.SUCCESS if cuadra and not errores else self.style.WARNING
+                self.stdout.write(estilo(
+                    f'{nombre}: {vendidas / segundos:.0f} ventas/s ({vendidas} en {segundos:.2f}s), '
+                    f'errores: {errores}, stock final: {final} ({"cuadra" if cuadra else "NO cuadra"})'
+                ))
+                talla.delete()
+        finally:
+            producto.delete()
+            categoria.delete()
+
+    @staticmethod
+    def _medir(vender, talla_id, hilos, operaciones):
+        """Ejecutar `vender` en paralelo; devuelve (vendidas, errores, segundos)"""
+        resultados = {'vendidas': 0, 'errores': 0}
+        candado = threading.Lock()
+
+        def trabajar():
+            vendidas = errores = 0
+            try:
+                for _ in range(operaciones):
+                    try:
+                        if vender(talla_id):
+                            vendidas += 1
+                    except Exception:
+                        errores += 1
+            finally:
+                connection.close()
+            with candado:
+                resultados['vendidas'] += vendidas
+                resultados['errores'] += errores
+
+        trabajadores = [threading.Thread(target=trabajar) for _ in range(hilos)]
+        inicio = time.monotonic()
+        for trabajador in trabajadores:
+            trabajador.start()
+        for trabajador in trabajadores:
+            trabajador.join()
+        return resultados['vendidas'], resultados['errores'], max(time.monotonic() - inicio, 1e-9)
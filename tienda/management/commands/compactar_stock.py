@@ -0,0 +1,54 @@
+"""
+Compactar el libro de movimientos de stock
+
+Pensado para ejecutarse cada minuto desde cron (las reposiciones y
+cancelaciones quedan a la venta al compactarse):
+    python manage.py compactar_stock
+    python manage.py compactar_stock --lote 5000 --consolidar-dias 90 --reconciliar
+"""
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tienda.services.inventario import InventarioStock
+
+
+class Command(BaseCommand):
+    help = 'Suma a Talla.stock las entradas pendientes del libro de movimientos y, opcionalmente, lo consolida y revisa'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=InventarioStock.TAMANO_LOTE,
+            help=f'Movimientos por transacción (default: {InventarioStock.TAMANO_LOTE})'
+        )
+        parser.add_argument(
+            '--consolidar-dias', type=int, default=None,
+            help='Resumir en un saldo por talla los movimientos con más de estos días'
+        )
+        parser.add_argument(
+            '--reconciliar', action='store_true',
+            help='Repetir el libro y listar las tallas cuyo stock no cuadra'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        compactados = InventarioStock.compactar(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Movimientos compactados: {compactados} en {time.monotonic() - inicio:.2f}s'
+        ))
+
+        if options['consolidar_dias'] is not None:
+            inicio = time.monotonic()
+            consolidados = InventarioStock.consolidar(timezone.now() - timedelta(days=options['consolidar_dias']))
+            self.stdout.write(self.style.SUCCESS(
+                f'Movimientos consolidados: {consolidados} en {time.monotonic() - inicio:.2f}s'
+            ))
+
+        if options['reconciliar']:
+            inicio = time.monotonic()
+            diferencias = InventarioStock.reconciliar()
+            for talla_id, stock, libro in diferencias:
+                self.stdout.write(self.style.WARNING(f'Talla {talla_id}: stock {stock}, libro {libro}'))
+            self.stdout.write(self.style.SUCCESS(
+                f'Tallas que no cuadran: {len(diferencias)} ({time.monotonic() - inicio:.2f}s)'
+            ))
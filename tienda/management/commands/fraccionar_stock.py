@@ -0,0 +1,35 @@
+"""
+Fraccionar (o volver a unificar) el stock de tallas con mucha demanda
+
+Se puede ejecutar en línea, por ejemplo antes y después de un lanzamiento:
+    python manage.py fraccionar_stock 12 15 --fracciones 16
+    python manage.py fraccionar_stock 12 15 --desactivar
+"""
+from django.core.management.base import BaseCommand
+from tienda.services.fracciones import StockFraccionado
+
+
+class Command(BaseCommand):
+    help = 'Reparte el stock libre de las tallas indicadas en varias filas para repartir los bloqueos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tallas', nargs='+', type=int, help='Ids de las tallas')
+        parser.add_argument(
+            '--fracciones', type=int, default=StockFraccionado.FRACCIONES,
+            help=f'Filas por talla (default: {StockFraccionado.FRACCIONES})'
+        )
+        parser.add_argument(
+            '--desactivar', action='store_true',
+            help='Volver a guardar el stock en la fila de la talla'
+        )
+
+    def handle(self, *args, **options):
+        for talla_id in options['tallas']:
+            if options['desactivar']:
+                cambiada = StockFraccionado.desactivar(talla_id)
+                mensaje = 'unificada' if cambiada else 'no estaba fraccionada'
+            else:
+                cambiada = StockFraccionado.activar(talla_id, options['fracciones'])
+                mensaje = f'fraccionada en {options["fracciones"]}' if cambiada else 'ya estaba fraccionada'
+            estilo = self.style.SUCCESS if cambiada else self.style.WARNING
+            self.stdout.write(estilo(f'Talla {talla_id}: {mensaje}'))
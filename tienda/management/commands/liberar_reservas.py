@@ -0,0 +1,26 @@
+"""
+Liberar las reservas de stock vencidas
+
+Pensado para ejecutarse cada minuto desde cron:
+    python manage.py liberar_reservas
+    python manage.py liberar_reservas --reconciliar
+"""
+from django.core.management.base import BaseCommand
+from tienda.services.reservas import ReservasStock
+
+
+class Command(BaseCommand):
+    help = 'Devuelve a la disponibilidad las unidades de las reservas de carrito vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconciliar', action='store_true',
+            help='Recalcular además Talla.reservado desde las reservas existentes'
+        )
+
+    def handle(self, *args, **options):
+        liberadas = ReservasStock.liberar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Unidades liberadas: {liberadas}'))
+        if options['reconciliar']:
+            tallas = ReservasStock.reconciliar()
+            self.stdout.write(self.style.SUCCESS(f'Tallas reconciliadas: {tallas}'))
@@ -0,0 +1,16 @@
+"""
+Borrar las respuestas idempotentes vencidas
+
+Pensado para ejecutarse cada hora desde cron:
+    python manage.py limpiar_idempotencia
+"""
+from django.core.management.base import BaseCommand
+from tienda.services.idempotencia import ServicioIdempotencia
+
+
+class Command(BaseCommand):
+    help = 'Borra las respuestas guardadas para claves de idempotencia cuyo plazo ya pasó'
+
+    def handle(self, *args, **options):
+        borradas = ServicioIdempotencia.limpiar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'Respuestas borradas: {borradas}'))
@@ -0,0 +1,49 @@
+"""
+Worker del checkout en cola (CHECKOUT_EN_COLA)
+
+Procesa los pedidos pendientes por lotes; se pueden correr varios a la vez:
+    python manage.py procesar_pedidos
+    python manage.py procesar_pedidos --lote 200 --intervalo 0.5
+    python manage.py procesar_pedidos --una-vez   # vaciar la cola y salir
+"""
+import time
+from django.core.management.base import BaseCommand
+from tienda.services.cola_pedidos import ColaPedidos
+
+
+class Command(BaseCommand):
+    help = 'Crea las líneas, descuenta el stock y suma las ventas de los pedidos en cola'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=ColaPedidos.TAMANO_LOTE,
+            help=f'Pedidos por transacción (default: {ColaPedidos.TAMANO_LOTE})'
+        )
+        parser.add_argument(
+            '--intervalo', type=float, default=1.0,
+            help='Segundos de espera cuando la cola está vacía (default: 1.0)'
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help='Salir en cuanto la cola quede vacía'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                inicio = time.monotonic()
+                completados, fallidos = ColaPedidos.procesar_lote(options['lote'])
+                if completados or fallidos:
+                    metricas = ColaPedidos.estadisticas()
+                    self.stdout.write(
+                        f'Lote: {completados} completados, {fallidos} fallidos en '
+                        f'{time.monotonic() - inicio:.3f}s | en cola: {metricas["profundidad"]} | '
+                        f'latencia media: {metricas["latencia_media_s"]}s, p95: {metricas["latencia_p95_s"]}s'
+                    )
+                    continue
+                if options['una_vez']:
+                    break
+                time.sleep(options['intervalo'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Worker detenido'))
@@ -0,0 +1,31 @@
+"""
+Recalcular Producto.total_vendidos desde los pedidos entregados
+
+Pensado para cron (el modo incremental solo revisa los productos de pedidos
+que cambiaron de estado desde la ejecución anterior):
+    python manage.py recalcular_ventas --incremental
+    python manage.py recalcular_ventas --lote 5000
+"""
+from django.core.management.base import BaseCommand
+from tienda.services.recalculo_ventas import RecalculoVentas
+
+
+class Command(BaseCommand):
+    help = 'Recalcula con un GROUP BY los contadores de ventas y escribe solo los que cambiaron'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=RecalculoVentas.TAMANO_LOTE,
+            help=f'Productos por lote de lectura y escritura (default: {RecalculoVentas.TAMANO_LOTE})'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Solo los productos de pedidos con cambios de estado desde la última ejecución'
+        )
+
+    def handle(self, *args, **options):
+        resultado = RecalculoVentas.recalcular(incremental=options['incremental'], tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recálculo {resultado["modo"]}: {resultado["revisados"]} productos revisados, '
+            f'{resultado["actualizados"]} actualizados en {resultado["segundos"]:.2f}s'
+        ))
@@ -0,0 +1,30 @@
+"""
+Reconstruir el modelo de lectura del catálogo
+
+Uso:
+    python manage.py reconstruir_catalogo
+    python manage.py reconstruir_catalogo --lote 1000
+"""
+import time
+from django.core.management.base import BaseCommand
+from tienda.models import ProductoCatalogo
+from tienda.services.cache_catalogo import VersionCatalogo
+
+
+class Command(BaseCommand):
+    help = 'Regenera por lotes la tabla ProductoCatalogo a partir de Producto, Talla e ImagenProducto'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote', type=int, default=500,
+            help='Cantidad de productos por lote (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.monotonic()
+        total = ProductoCatalogo.reconstruir(tamano_lote=options['lote'])
+        # Las cachés del catálogo se construyeron con los datos anteriores
+        VersionCatalogo.incrementar()
+        self.stdout.write(self.style.SUCCESS(
+            f'Catálogo reconstruido: {total} productos en {time.monotonic() - inicio:.2f}s'
+        ))
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:24
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_stock_inicial(apps, schema_editor):
+    """Rellenar stock_total y en_stock a partir de las tallas existentes"""
+    Producto = apps.get_model('tienda', 'Producto')
+    Talla = apps.get_model('tienda', 'Talla')
+    suma_tallas = Talla.objects.filter(
+        producto=OuterRef('pk')
+    ).order_by().values('producto').annotate(total=Sum('stock')).values('total')
+    Producto.objects.update(
+        stock_total=Coalesce(Subquery(suma_tallas), Value(0)),
+        en_stock=Exists(Talla.objects.filter(producto=OuterRef('pk'), stock__gt=0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0004_alter_talla_producto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='en_stock',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='stock_total',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['en_stock', '-fecha_creacion'], name='producto_stock_fecha_idx'),
+        ),
+        migrations.RunPython(calcular_stock_inicial, migrations.RunPython.noop),
+    ]
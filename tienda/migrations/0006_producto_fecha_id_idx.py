@@ -0,0 +1,17 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0005_producto_stock_total'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['-fecha_creacion', '-id'], name='producto_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+import unicodedata
+from django.db import OperationalError, migrations, transaction
+
+# Estructura del índice congelada en la migración (ver services/busqueda.py)
+CREAR_SQLITE = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS tienda_producto_fts '
+    'USING fts5(nombre, marca, descripcion, categoria, color, material, tokenize="unicode61 remove_diacritics 2")',
+]
+CREAR_POSTGRES = [
+    'CREATE TABLE IF NOT EXISTS tienda_producto_busqueda ('
+    'producto_id bigint PRIMARY KEY, documento tsvector NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS tienda_producto_busqueda_gin ON tienda_producto_busqueda USING GIN (documento)',
+]
+INSERTAR_SQLITE = (
+    'INSERT INTO tienda_producto_fts (rowid, nombre, marca, descripcion, categoria, color, material) '
+    'VALUES (%s, %s, %s, %s, %s, %s, %s)'
+)
+INSERTAR_POSTGRES = (
+    'INSERT INTO tienda_producto_busqueda (producto_id, documento) VALUES (%s, '
+    "setweight(to_tsvector('spanish', %s), 'A') || setweight(to_tsvector('spanish', %s), 'A') || "
+    "setweight(to_tsvector('spanish', %s), 'C') || setweight(to_tsvector('spanish', %s), 'B') || "
+    "setweight(to_tsvector('spanish', %s), 'B') || setweight(to_tsvector('spanish', %s), 'B')) "
+    'ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento'
+)
+TABLAS = {'sqlite': 'tienda_producto_fts', 'postgresql': 'tienda_producto_busqueda'}
+
+
+def normalizar(texto):
+    """Pasar a minúsculas y quitar tildes: 'Pantalón' -> 'pantalon'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def crear_indice_busqueda(apps, schema_editor):
+    """Crear el índice de texto completo y cargar los productos existentes"""
+    conexion = schema_editor.connection
+    if conexion.vendor not in TABLAS:
+        return
+    if conexion.vendor == 'sqlite':
+        crear, insertar = CREAR_SQLITE, INSERTAR_SQLITE
+    else:
+        crear, insertar = CREAR_POSTGRES, INSERTAR_POSTGRES
+    Producto = apps.get_model('tienda', 'Producto')
+    filas = [
+        (fila[0], *[normalizar(valor) for valor in fila[1:]])
+        for fila in Producto.objects.values_list(
+            'id', 'nombre', 'marca', 'descripcion', 'categoria__nombre', 'color', 'material'
+        ).iterator()
+    ]
+    try:
+        with transaction.atomic(using=conexion.alias), conexion.cursor() as cursor:
+            for sql in crear:
+                cursor.execute(sql)
+    except OperationalError:
+        # SQLite compilado sin FTS5: sin índice la búsqueda usa icontains
+        return
+    if filas:
+        with conexion.cursor() as cursor:
+            cursor.executemany(insertar, filas)
+
+
+def eliminar_indice_busqueda(apps, schema_editor):
+    tabla = TABLAS.get(schema_editor.connection.vendor)
+    if tabla:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {tabla}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0006_producto_fecha_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice_busqueda, eliminar_indice_busqueda),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:32
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_imagen_inicial(apps, schema_editor):
+    """Rellenar imagen_resuelta a partir de las imágenes adicionales existentes"""
+    Producto = apps.get_model('tienda', 'Producto')
+    ImagenProducto = apps.get_model('tienda', 'ImagenProducto')
+    imagen = ImagenProducto.objects.filter(
+        producto=OuterRef('pk')
+    ).order_by('-es_principal', 'orden', '-fecha_subida').values('imagen')[:1]
+    Producto.objects.update(imagen_resuelta=Coalesce(Subquery(imagen), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0007_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='imagen_resuelta',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(calcular_imagen_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:33
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0008_producto_imagen_resuelta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carritocompras',
+            index=models.Index(fields=['usuario', 'activo'], name='carrito_usuario_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'fecha_pedido'], name='pedido_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-fecha_pedido'], name='pedido_usuario_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['-fecha_pedido'], name='pedido_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('total_vendidos__gt', 0)), fields=['-total_vendidos'], name='producto_vendidos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['precio'], name='producto_precio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('color'), name='producto_color_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(django.db.models.functions.text.Lower('marca'), name='producto_marca_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='talla',
+            index=models.Index(fields=['stock'], name='talla_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+
+
+def llenar_catalogo(apps, schema_editor):
+    """Crear las filas del modelo de lectura para los productos existentes"""
+    Producto = apps.get_model('tienda', 'Producto')
+    Talla = apps.get_model('tienda', 'Talla')
+    ImagenProducto = apps.get_model('tienda', 'ImagenProducto')
+    ProductoCatalogo = apps.get_model('tienda', 'ProductoCatalogo')
+
+    tallas = {}
+    for producto_id, talla, stock in Talla.objects.filter(stock__gt=0).values_list('producto_id', 'talla', 'stock'):
+        tallas.setdefault(producto_id, {})[talla] = stock
+
+    imagen_adicional = ImagenProducto.objects.filter(
+        producto=OuterRef('pk')
+    ).order_by('-es_principal', 'orden', '-fecha_subida').values('imagen')[:1]
+    filas = []
+    for producto in Producto.objects.select_related('categoria').annotate(imagen_adicional=Subquery(imagen_adicional)):
+        imagen = producto.imagen_principal.name or producto.imagen_adicional
+        filas.append(ProductoCatalogo(
+            producto_id=producto.pk,
+            nombre=producto.nombre,
+            descripcion=producto.descripcion,
+            precio=producto.precio,
+            marca=producto.marca,
+            color=producto.color,
+            material=producto.material,
+            categoria_id=producto.categoria_id,
+            categoria_nombre=producto.categoria.nombre,
+            stock_total=producto.stock_total,
+            en_stock=producto.en_stock,
+            tallas=tallas.get(producto.pk, {}),
+            imagen_url=default_storage.url(imagen) if imagen else '',
+            total_vendidos=producto.total_vendidos,
+            fecha_creacion=producto.fecha_creacion,
+        ))
+    ProductoCatalogo.objects.bulk_create(filas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0009_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductoCatalogo',
+            fields=[
+                ('producto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalogo', serialize=False, to='tienda.producto')),
+                ('nombre', models.CharField(max_length=100)),
+                ('descripcion', models.TextField()),
+                ('precio', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('marca', models.CharField(max_length=50)),
+                ('color', models.CharField(max_length=30)),
+                ('material', models.CharField(max_length=50)),
+                ('categoria_nombre', models.CharField(max_length=50)),
+                ('stock_total', models.IntegerField(default=0)),
+                ('en_stock', models.BooleanField(default=False)),
+                ('tallas', models.JSONField(default=dict)),
+                ('imagen_url', models.CharField(blank=True, default='', max_length=255)),
+                ('total_vendidos', models.IntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField()),
+                ('categoria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='tienda.categoria')),
+            ],
+            options={
+                'verbose_name': 'Producto del catálogo',
+                'verbose_name_plural': 'Productos del catálogo',
+                'indexes': [models.Index(fields=['en_stock', '-fecha_creacion'], name='catalogo_stock_fecha_idx'), models.Index(fields=['-fecha_creacion', '-producto'], name='catalogo_fecha_id_idx'), models.Index(condition=models.Q(('total_vendidos__gt', 0)), fields=['-total_vendidos'], name='catalogo_vendidos_idx'), models.Index(fields=['precio'], name='catalogo_precio_idx'), models.Index(django.db.models.functions.text.Lower('color'), name='catalogo_color_lower_idx'), models.Index(django.db.models.functions.text.Lower('marca'), name='catalogo_marca_lower_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_catalogo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:38
+
+from django.db import migrations, models
+from django.db.models import Case, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+def calcular_mascara_inicial(apps, schema_editor):
+    """Rellenar tallas_mascara en Producto y en el modelo de lectura"""
+    Producto = apps.get_model('tienda', 'Producto')
+    Talla = apps.get_model('tienda', 'Talla')
+    ProductoCatalogo = apps.get_model('tienda', 'ProductoCatalogo')
+    bits = {'XS': 1, 'S': 2, 'M': 4, 'L': 8, 'XL': 16}
+    mascara = Talla.objects.filter(
+        producto=OuterRef('pk'), stock__gt=0
+    ).order_by().values('producto').annotate(mascara=Sum(Case(
+        *[When(talla=talla, then=Value(bit)) for talla, bit in bits.items()],
+        default=Value(0),
+    ))).values('mascara')
+    Producto.objects.update(tallas_mascara=Coalesce(Subquery(mascara), Value(0)))
+    ProductoCatalogo.objects.update(tallas_mascara=Subquery(
+        Producto.objects.filter(pk=OuterRef('pk')).values('tallas_mascara')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0010_producto_catalogo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='tallas_mascara',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productocatalogo',
+            name='tallas_mascara',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['tallas_mascara'], name='producto_tallas_mascara_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productocatalogo',
+            index=models.Index(fields=['tallas_mascara'], name='catalogo_tallas_mascara_idx'),
+        ),
+        migrations.RunPython(calcular_mascara_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0011_tallas_mascara'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='talla',
+            name='reservado',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expira_en', models.DateTimeField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('carrito', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='tienda.carritocompras')),
+                ('talla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='tienda.talla')),
+            ],
+            options={
+                'verbose_name': 'Reserva de Stock',
+                'verbose_name_plural': 'Reservas de Stock',
+                'indexes': [models.Index(fields=['expira_en'], name='reserva_expira_idx'), models.Index(fields=['talla', 'expira_en'], name='reserva_talla_expira_idx')],
+                'unique_together': {('carrito', 'talla')},
+            },
+        ),
+    ]
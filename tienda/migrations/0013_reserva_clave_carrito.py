@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def copiar_clave_carrito(apps, schema_editor):
+    """Las reservas existentes pasan a identificarse con la clave 'carrito:<id>'"""
+    ReservaStock = apps.get_model('tienda', 'ReservaStock')
+    ReservaStock.objects.update(
+        clave_carrito=Concat(Value('carrito:'), Cast('carrito_id', CharField()), output_field=CharField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0012_reservas_stock'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='reservastock',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='reservastock',
+            name='clave_carrito',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copiar_clave_carrito, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='reservastock',
+            name='carrito',
+        ),
+        migrations.AlterUniqueTogether(
+            name='reservastock',
+            unique_together={('clave_carrito', 'talla')},
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0013_reserva_clave_carrito'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RespuestaIdempotente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(max_length=64)),
+                ('clave', models.CharField(max_length=64)),
+                ('huella', models.CharField(help_text='SHA-256 de la ruta y los datos de la solicitud', max_length=64)),
+                ('estado_http', models.PositiveSmallIntegerField()),
+                ('ubicacion', models.CharField(blank=True, help_text='Cabecera Location de las redirecciones', max_length=500)),
+                ('tipo_contenido', models.CharField(blank=True, max_length=100)),
+                ('contenido', models.TextField(blank=True)),
+                ('expira_en', models.DateTimeField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Respuesta Idempotente',
+                'verbose_name_plural': 'Respuestas Idempotentes',
+                'indexes': [models.Index(fields=['expira_en'], name='idempotencia_expira_idx')],
+                'unique_together': {('ambito', 'clave')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0014_respuesta_idempotente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lineas', models.JSONField(help_text='[[producto_id, talla_id, cantidad, precio], ...]')),
+                ('clave_reservas', models.CharField(blank=True, max_length=64)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('completado', 'Completado'), ('fallido', 'Fallido')], default='pendiente', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_proceso', models.DateTimeField(blank=True, null=True)),
+                ('pedido', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trabajo', to='tienda.pedido')),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Pedido',
+                'verbose_name_plural': 'Trabajos de Pedidos',
+                'indexes': [models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_estado_fecha_idx'), models.Index(fields=['-fecha_proceso'], name='trabajo_proceso_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def registrar_stock_inicial(apps, schema_editor):
+    """El libro arranca con el stock actual de cada talla como movimiento inicial"""
+    Talla = apps.get_model('tienda', 'Talla')
+    MovimientoStock = apps.get_model('tienda', 'MovimientoStock')
+    MovimientoStock.objects.bulk_create(
+        (
+            MovimientoStock(talla_id=talla_id, tipo='inicial', cantidad=stock)
+            for talla_id, stock in Talla.objects.exclude(stock=0).values_list('pk', 'stock').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0015_trabajo_pedido'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('inicial', 'Stock inicial'), ('venta', 'Venta'), ('reposicion', 'Reposición'), ('ajuste', 'Ajuste'), ('cancelacion', 'Cancelación de pedido'), ('saldo', 'Saldo consolidado')], max_length=20)),
+                ('cantidad', models.IntegerField(help_text='Unidades con signo: positivas entran, negativas salen')),
+                ('aplicado', models.BooleanField(default=True, help_text='Ya está sumado en Talla.stock')),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pedido', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='tienda.pedido')),
+                ('talla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='tienda.talla')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'indexes': [models.Index(fields=['aplicado', 'talla'], name='movimiento_aplicado_idx'), models.Index(fields=['talla', 'fecha'], name='movimiento_talla_fecha_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_stock_inicial, migrations.RunPython.noop),
+    ]
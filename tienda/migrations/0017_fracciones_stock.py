@@ -0,0 +1,33 @@
+# Generated by Django 4.2.15 on 2026-10-18 16:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0016_movimiento_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='talla',
+            name='fracciones',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='FraccionStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField(default=0)),
+                ('talla', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='partes_stock', to='tienda.talla')),
+            ],
+            options={
+                'verbose_name': 'Fracción de Stock',
+                'verbose_name_plural': 'Fracciones de Stock',
+                'unique_together': {('talla', 'indice')},
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.15 on 2026-10-18 17:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def registrar_estados_actuales(apps, schema_editor):
+    """
+    El historial arranca con el estado actual de cada pedido y las ventas se
+    alinean con los pedidos entregados (antes el checkout sumaba al vender)
+    """
+    from django.db.models import OuterRef, Subquery, Sum, Value
+    from django.db.models.functions import Coalesce
+
+    Pedido = apps.get_model('tienda', 'Pedido')
+    CambioEstadoPedido = apps.get_model('tienda', 'CambioEstadoPedido')
+    ItemPedido = apps.get_model('tienda', 'ItemPedido')
+    Producto = apps.get_model('tienda', 'Producto')
+    ProductoCatalogo = apps.get_model('tienda', 'ProductoCatalogo')
+
+    CambioEstadoPedido.objects.bulk_create(
+        (
+            CambioEstadoPedido(pedido_id=pk, estado_anterior='', estado_nuevo=estado, fecha=fecha)
+            for pk, estado, fecha in Pedido.objects.values_list('pk', 'estado', 'fecha_pedido').iterator()
+        ),
+        batch_size=1000,
+    )
+    entregadas = ItemPedido.objects.filter(
+        producto=OuterRef('pk'), pedido__estado='entregado'
+    ).order_by().values('producto').annotate(total=Sum('cantidad')).values('total')
+    Producto.objects.update(total_vendidos=Coalesce(Subquery(entregadas), Value(0)))
+    ProductoCatalogo.objects.update(total_vendidos=Subquery(
+        Producto.objects.filter(pk=OuterRef('pk')).values('total_vendidos')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0017_fracciones_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioEstadoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(blank=True, choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], max_length=20)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cambios_estado', to='tienda.pedido')),
+            ],
+            options={
+                'verbose_name': 'Cambio de Estado de Pedido',
+                'verbose_name_plural': 'Cambios de Estado de Pedidos',
+                'indexes': [models.Index(fields=['pedido', 'fecha'], name='cambio_estado_pedido_idx')],
+            },
+        ),
+        migrations.RunPython(registrar_estados_actuales, migrations.RunPython.noop),
+    ]
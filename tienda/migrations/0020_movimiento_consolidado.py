@@ -0,0 +1,18 @@
+# Generated by Django 4.2.15 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda', '0019_archivo_pedidos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientostock',
+            name='consolidado',
+            field=models.BooleanField(default=False, help_text='Incluido en una fila de saldo posterior'),
+        ),
+    ]
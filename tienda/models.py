@@ -1,5 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Lower
 from django.conf import settings
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -40,6 +43,26 @@ class Producto(models.Model):
     )
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     total_vendidos = models.IntegerField(default=0)
+    # Totales de inventario desnormalizados (mantenidos por las señales de Talla)
+    stock_total = models.IntegerField(default=0, editable=False)
+    en_stock = models.BooleanField(default=False, editable=False)
+    # Tallas con stock codificadas como bits (ver Talla.BITS)
+    tallas_mascara = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Ruta de la imagen adicional a mostrar si no hay imagen_principal
+    # (mantenida por ImagenProducto.save/delete)
+    imagen_resuelta = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    # Columnas mantenidas con UPDATE desde las señales; save() no las sobrescribe
+    CAMPOS_DESNORMALIZADOS = ('stock_total', 'en_stock', 'tallas_mascara', 'imagen_resuelta')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Una instancia cargada antes de un cambio de tallas tendría valores viejos
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in self.CAMPOS_DESNORMALIZADOS
+            ]
+        super().save(*args, **kwargs)
     
     def obtener_detalles(self):
         """Obtener detalles completos del producto"""
@@ -54,21 +77,55 @@ class Producto(models.Model):
             'tallas_disponibles': self.tallas.all()
         }
 
-    def stock_total(self):
-        """Calcular stock total sumando todas las tallas"""
-        return sum(talla.stock for talla in self.tallas.all())
+    def recalcular_stock(self):
+        """Recalcular stock_total y en_stock desde las tallas en la base de datos"""
+        Producto.recalcular_stock_de(self.pk)
+        self.refresh_from_db(fields=['stock_total', 'en_stock', 'tallas_mascara'])
+        return self.stock_total
+
+    @staticmethod
+    def _totales_stock():
+        """Expresiones de stock_total, en_stock y tallas_mascara calculadas desde las tallas"""
+        tallas = Talla.objects.filter(producto=OuterRef('pk')).annotate(fisico=Talla.stock_fisico())
+        suma_tallas = tallas.order_by().values('producto').annotate(total=Sum('fisico')).values('total')
+        # Cada talla aparece una vez por producto, así que sumar los bits equivale a OR
+        mascara = tallas.filter(fisico__gt=0).order_by().values('producto').annotate(mascara=Sum(Case(
+            *[When(talla=talla, then=Value(bit)) for talla, bit in Talla.BITS.items()],
+            default=Value(0),
+        ))).values('mascara')
+        return {
+            'stock_total': Coalesce(Subquery(suma_tallas), Value(0)),
+            'en_stock': Exists(tallas.filter(fisico__gt=0)),
+            'tallas_mascara': Coalesce(Subquery(mascara), Value(0)),
+        }
+
+    @classmethod
+    def recalcular_stock_de(cls, *producto_ids):
+        """
+        Recalcular los totales de inventario de varios productos en un solo UPDATE
+
+        La suma, el indicador y la máscara de tallas se calculan con subconsultas
+        dentro de la misma sentencia, por lo que el resultado es consistente
+        aunque haya escrituras concurrentes sobre las tallas.
+        """
+        return cls.objects.filter(pk__in=producto_ids).update(**cls._totales_stock())
+
+    @classmethod
+    def cambia_stock(cls, *producto_ids):
+        """Si recalcular el stock cambiaría stock_total, en_stock o tallas_mascara de alguno de los productos"""
+        totales = cls._totales_stock()
+        return cls.objects.filter(pk__in=producto_ids).annotate(
+            nuevo_stock=totales['stock_total'], nuevo_en_stock=totales['en_stock'], nueva_mascara=totales['tallas_mascara']
+        ).exclude(
+            stock_total=F('nuevo_stock'), en_stock=F('nuevo_en_stock'), tallas_mascara=F('nueva_mascara')
+        ).exists()
     
     def actualizar_ventas(self):
-        """Actualizar el contador de productos vendidos basado en pedidos entregados"""
-        from django.db.models import Sum
-        total = ItemPedido.objects.filter(
-            producto=self,
-            pedido__estado='entregado'
-        ).aggregate(Sum('cantidad'))['cantidad__sum'] or 0
-        
-        self.total_vendidos = total
-        self.save()
-        return total
+        """Recalcular el contador de productos vendidos basado en pedidos entregados"""
+        from .services.recalculo_ventas import RecalculoVentas
+        RecalculoVentas.recalcular(producto_ids=[self.pk])
+        self.refresh_from_db(fields=['total_vendidos'])
+        return self.total_vendidos
     
     @classmethod
     def get_top_vendidos(cls, limit=3):
@@ -77,33 +134,60 @@ class Producto(models.Model):
     
     @classmethod
     def actualizar_todas_las_ventas(cls):
-        """Actualizar contadores de ventas para todos los productos"""
-        productos_actualizados = 0
-        for producto in cls.objects.all():
-            producto.actualizar_ventas()
-            productos_actualizados += 1
-        return productos_actualizados
+        """
+        Recalcular los contadores de ventas de todos los productos
+
+        Returns:
+            int: Productos cuyo contador cambió
+        """
+        from .services.recalculo_ventas import RecalculoVentas
+        return RecalculoVentas.recalcular()['actualizados']
     
     def __str__(self):
         return f"{self.nombre} - {self.marca}"
     
     def obtener_imagen_principal(self):
-        """Obtener la imagen principal o la primera imagen disponible"""
+        """Obtener la imagen principal o la primera imagen disponible (sin consultas)"""
         if self.imagen_principal:
             return self.imagen_principal.url
-        # Si no tiene imagen principal, buscar en imágenes adicionales
-        primera_imagen = self.imagenes.filter(es_principal=True).first()
-        if primera_imagen:
-            return primera_imagen.imagen.url
-        # Si no hay imagen principal marcada, tomar la primera
-        primera_imagen = self.imagenes.first()
-        if primera_imagen:
-            return primera_imagen.imagen.url
+        # Si las imágenes adicionales vienen con prefetch_related, resolver en memoria
+        if 'imagenes' in getattr(self, '_prefetched_objects_cache', {}):
+            imagenes = list(self.imagenes.all())
+            # La marcada como principal; si no hay, la primera según el orden del modelo
+            imagen = next((i for i in imagenes if i.es_principal), imagenes[0] if imagenes else None)
+            return imagen.imagen.url if imagen else None
+        # Si no, usar la imagen ya resuelta guardada en el producto
+        if self.imagen_resuelta:
+            return ImagenProducto._meta.get_field('imagen').storage.url(self.imagen_resuelta)
         return None
+
+    @classmethod
+    def recalcular_imagen_de(cls, *producto_ids):
+        """Recalcular imagen_resuelta de varios productos en un solo UPDATE"""
+        imagen = ImagenProducto.objects.filter(
+            producto=OuterRef('pk')
+        ).order_by('-es_principal', 'orden', '-fecha_subida').values('imagen')[:1]
+        return cls.objects.filter(pk__in=producto_ids).update(
+            imagen_resuelta=Coalesce(Subquery(imagen), Value(''))
+        )
     
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            models.Index(fields=['en_stock', '-fecha_creacion'], name='producto_stock_fecha_idx'),
+            models.Index(fields=['-fecha_creacion', '-id'], name='producto_fecha_id_idx'),
+            # Más vendidos: solo interesan los productos con ventas
+            models.Index(
+                fields=['-total_vendidos'], name='producto_vendidos_idx',
+                condition=models.Q(total_vendidos__gt=0),
+            ),
+            models.Index(fields=['precio'], name='producto_precio_idx'),
+            models.Index(fields=['tallas_mascara'], name='producto_tallas_mascara_idx'),
+            # Filtros de color y marca sin distinguir mayúsculas
+            models.Index(Lower('color'), name='producto_color_lower_idx'),
+            models.Index(Lower('marca'), name='producto_marca_lower_idx'),
+        ]
 
 
 class ImagenProducto(models.Model):
@@ -115,10 +199,18 @@ class ImagenProducto(models.Model):
     fecha_subida = models.DateTimeField(auto_now_add=True)
     
     def save(self, *args, **kwargs):
-        # Si se marca como principal, desmarcar otras imágenes del mismo producto
-        if self.es_principal:
-            ImagenProducto.objects.filter(producto=self.producto, es_principal=True).update(es_principal=False)
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Si se marca como principal, desmarcar otras imágenes del mismo producto
+            if self.es_principal:
+                ImagenProducto.objects.filter(producto=self.producto, es_principal=True).update(es_principal=False)
+            super().save(*args, **kwargs)
+            Producto.recalcular_imagen_de(self.producto_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            Producto.recalcular_imagen_de(self.producto_id)
+        return resultado
     
     def __str__(self):
         return f"Imagen de {self.producto.nombre} - {self.descripcion or 'Sin descripción'}"
@@ -138,20 +230,125 @@ class Talla(models.Model):
         ('XL', 'Extra Large'),
     ]
 
+    # Bit de cada talla en Producto.tallas_mascara: XS=1, S=2, M=4, L=8, XL=16
+    BITS = {talla: 1 << posicion for posicion, (talla, _) in enumerate(OPCIONES_TALLA)}
+
     talla = models.CharField(max_length=10, choices=OPCIONES_TALLA)
     stock = models.IntegerField(default=0)
     producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='tallas')
+    # Unidades retenidas por reservas de carritos (mantenido por ReservasStock)
+    reservado = models.IntegerField(default=0, editable=False)
+    # Cantidad de fracciones del contador de stock (0 = sin fraccionar; ver FraccionStock)
+    fracciones = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Columnas mantenidas con UPDATE; save() no las sobrescribe
+    CAMPOS_DESNORMALIZADOS = ('reservado', 'fracciones')
+
+    def save(self, *args, **kwargs):
+        libres = None
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Una instancia cargada antes de una reserva tendría el contador viejo.
+            # En una talla fraccionada el stock vive en sus fracciones.
+            excluidos = self.CAMPOS_DESNORMALIZADOS + (('stock',) if self.fracciones else ())
+            kwargs['update_fields'] = [
+                campo.name for campo in self._meta.concrete_fields
+                if not campo.primary_key and campo.name not in excluidos
+            ]
+            if self.fracciones and self.stock != getattr(self, '_stock_guardado', self.stock):
+                # El stock asignado a una talla fraccionada son sus nuevas unidades libres
+                libres = self.stock
+        with transaction.atomic():
+            if libres is not None:
+                from .services.fracciones import StockFraccionado
+                StockFraccionado.fijar(self.pk, libres)
+                # Igual que en la base de datos: la columna sigue en 0
+                self.stock = self._stock_guardado = 0
+            super().save(*args, **kwargs)
+
+    @staticmethod
+    def _suma_fracciones():
+        """Subconsulta con las unidades libres en las fracciones de cada talla"""
+        return FraccionStock.objects.filter(
+            talla=OuterRef('pk')
+        ).order_by().values('talla').annotate(total=Sum('stock')).values('total')
+
+    @classmethod
+    def stock_fisico(cls):
+        """
+        Expresión con el stock real de cada talla
+
+        En una talla fraccionada Talla.stock y Talla.reservado quedan en 0: las
+        unidades libres están en sus fracciones y las retenidas en sus reservas.
+        """
+        reservas = ReservaStock.objects.filter(
+            talla=OuterRef('pk')
+        ).order_by().values('talla').annotate(total=Sum('cantidad')).values('total')
+        return F('stock') + Case(
+            When(fracciones__gt=0, then=Coalesce(Subquery(cls._suma_fracciones()), Value(0)) + Coalesce(Subquery(reservas), Value(0))),
+            default=Value(0),
+            output_field=models.IntegerField(),
+        )
+
+    @classmethod
+    def stock_libre(cls):
+        """Expresión con las unidades que se pueden agregar a un carrito (igual que `disponible`)"""
+        return Case(
+            When(fracciones__gt=0, then=Coalesce(Subquery(cls._suma_fracciones()), Value(0))),
+            default=F('stock') - F('reservado'),
+            output_field=models.IntegerField(),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Stock leído de la base de datos, para registrar los ajustes en MovimientoStock
+        instancia._stock_guardado = instancia.__dict__.get('stock')
+        return instancia
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        if fields is None or 'stock' in fields:
+            self._stock_guardado = self.stock
+            self.__dict__.pop('libres', None)
+
+    @property
+    def disponible(self):
+        """
+        Unidades que se pueden agregar a un carrito (stock menos reservas)
+
+        En una talla fraccionada usa la anotación `libres` (stock_libre) si la
+        consulta la trajo, para no sumar las fracciones talla por talla.
+        """
+        if self.fracciones:
+            if 'libres' in self.__dict__:
+                return self.libres
+            return self.partes_stock.aggregate(total=Coalesce(Sum('stock'), Value(0)))['total']
+        return max(self.stock - self.reservado, 0)
     
     def verificar_stock(self, cantidad=1):
-        """Verificar si hay stock disponible"""
+        """Verificar si hay stock disponible (en una talla fraccionada, en sus fracciones)"""
+        if self.fracciones:
+            return self.disponible >= cantidad
         return self.stock >= cantidad
     
     def reducir_stock(self, cantidad):
         """Reducir stock después de una compra"""
-        if self.verificar_stock(cantidad):
-            self.stock -= cantidad
-            self.save()
-            return True
+        with transaction.atomic():
+            if self.fracciones:
+                from .services.fracciones import StockFraccionado
+                if not StockFraccionado.descontar(self.pk, self.fracciones, cantidad):
+                    return False
+                MovimientoStock.objects.create(talla=self, tipo='venta', cantidad=-cantidad)
+                # Sin cambiar el stock de la fila: solo recalcula el producto y el catálogo
+                self.save()
+                return True
+            if self.verificar_stock(cantidad):
+                MovimientoStock.objects.create(talla=self, tipo='venta', cantidad=-cantidad)
+                # Ya registrado como venta: la señal no lo anota otra vez como ajuste
+                self.stock = self._stock_guardado = self.stock - cantidad
+                # post_save recalcula el stock del producto dentro de esta transacción
+                self.save()
+                return True
         return False
     
     def __str__(self):
@@ -161,6 +358,137 @@ class Talla(models.Model):
         verbose_name = "Talla"
         verbose_name_plural = "Tallas"
         unique_together = ['producto', 'talla']
+        indexes = [
+            # Alertas de stock bajo en el dashboard
+            models.Index(fields=['stock'], name='talla_stock_idx'),
+        ]
+
+
+class ProductoCatalogo(models.Model):
+    """
+    Modelo de lectura del catálogo: una fila por producto con los datos ya resueltos
+
+    Las vistas públicas y la API leen de esta tabla sin JOIN con Categoria,
+    Talla ni ImagenProducto. Se mantiene desde las señales de escritura
+    (ver signals.py) y se reconstruye con `manage.py reconstruir_catalogo`.
+    """
+    producto = models.OneToOneField(Producto, on_delete=models.CASCADE, primary_key=True, related_name='catalogo')
+    nombre = models.CharField(max_length=100)
+    descripcion = models.TextField()
+    precio = models.DecimalField(max_digits=10, decimal_places=2)
+    marca = models.CharField(max_length=50)
+    color = models.CharField(max_length=30)
+    material = models.CharField(max_length=50)
+    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='+')
+    categoria_nombre = models.CharField(max_length=50)
+    stock_total = models.IntegerField(default=0)
+    en_stock = models.BooleanField(default=False)
+    # Tallas con stock y sus unidades: {'S': 4, 'M': 2}
+    tallas = models.JSONField(default=dict)
+    tallas_mascara = models.PositiveSmallIntegerField(default=0)
+    imagen_url = models.CharField(max_length=255, blank=True, default='')
+    total_vendidos = models.IntegerField(default=0)
+    fecha_creacion = models.DateTimeField()
+
+    def obtener_imagen_principal(self):
+        """URL de la imagen ya resuelta (misma interfaz que Producto)"""
+        return self.imagen_url or None
+
+    def tallas_disponibles(self):
+        """Lista [(talla, stock)] en el orden de Talla.OPCIONES_TALLA"""
+        return [(talla, self.tallas[talla]) for talla, _ in Talla.OPCIONES_TALLA if talla in self.tallas]
+
+    @classmethod
+    def sincronizar(cls, *producto_ids):
+        """
+        Regenerar las filas de los productos indicados
+
+        Lee los productos y sus tallas con stock en dos consultas y escribe
+        todas las filas con un único upsert. Los productos que ya no existen
+        se quitan de la tabla.
+        """
+        if not producto_ids:
+            return 0
+        imagen_adicional = ImagenProducto.objects.filter(
+            producto=OuterRef('pk')
+        ).order_by('-es_principal', 'orden', '-fecha_subida').values('imagen')[:1]
+        productos = Producto.objects.filter(pk__in=producto_ids).annotate(
+            imagen_adicional=Subquery(imagen_adicional)
+        ).values(
+            'pk', 'nombre', 'descripcion', 'precio', 'marca', 'color', 'material', 'categoria_id',
+            'categoria__nombre', 'stock_total', 'en_stock', 'tallas_mascara', 'total_vendidos', 'fecha_creacion',
+            'imagen_principal', 'imagen_adicional',
+        )
+
+        tallas = {}
+        for producto_id, talla, stock in Talla.objects.filter(producto_id__in=producto_ids).annotate(
+            fisico=Talla.stock_fisico()
+        ).filter(fisico__gt=0).values_list('producto_id', 'talla', 'fisico'):
+            tallas.setdefault(producto_id, {})[talla] = stock
+
+        storage = ImagenProducto._meta.get_field('imagen').storage
+        filas = []
+        for datos in productos:
+            imagen = datos['imagen_principal'] or datos['imagen_adicional']
+            filas.append(cls(
+                producto_id=datos['pk'],
+                nombre=datos['nombre'],
+                descripcion=datos['descripcion'],
+                precio=datos['precio'],
+                marca=datos['marca'],
+                color=datos['color'],
+                material=datos['material'],
+                categoria_id=datos['categoria_id'],
+                categoria_nombre=datos['categoria__nombre'],
+                stock_total=datos['stock_total'],
+                en_stock=datos['en_stock'],
+                tallas=tallas.get(datos['pk'], {}),
+                tallas_mascara=datos['tallas_mascara'],
+                imagen_url=storage.url(imagen) if imagen else '',
+                total_vendidos=datos['total_vendidos'],
+                fecha_creacion=datos['fecha_creacion'],
+            ))
+
+        if filas:
+            cls.objects.bulk_create(
+                filas, update_conflicts=True, unique_fields=['producto'],
+                update_fields=[campo.name for campo in cls._meta.concrete_fields if not campo.primary_key],
+            )
+        existentes = {fila.producto_id for fila in filas}
+        faltantes = [pk for pk in producto_ids if pk not in existentes]
+        if faltantes:
+            cls.objects.filter(producto_id__in=faltantes).delete()
+        return len(filas)
+
+    @classmethod
+    def reconstruir(cls, tamano_lote=500):
+        """Regenerar la tabla completa por lotes de productos"""
+        cls.objects.filter(~Exists(Producto.objects.filter(pk=OuterRef('pk')))).delete()
+        ids = list(Producto.objects.order_by('pk').values_list('pk', flat=True))
+        total = 0
+        for inicio in range(0, len(ids), tamano_lote):
+            with transaction.atomic():
+                total += cls.sincronizar(*ids[inicio:inicio + tamano_lote])
+        return total
+
+    def __str__(self):
+        return f"{self.nombre} - {self.marca} (catálogo)"
+
+    class Meta:
+        verbose_name = "Producto del catálogo"
+        verbose_name_plural = "Productos del catálogo"
+        indexes = [
+            models.Index(fields=['en_stock', '-fecha_creacion'], name='catalogo_stock_fecha_idx'),
+            models.Index(fields=['-fecha_creacion', '-producto'], name='catalogo_fecha_id_idx'),
+            models.Index(
+                fields=['-total_vendidos'], name='catalogo_vendidos_idx',
+                condition=models.Q(total_vendidos__gt=0),
+            ),
+            models.Index(fields=['precio'], name='catalogo_precio_idx'),
+            models.Index(fields=['tallas_mascara'], name='catalogo_tallas_mascara_idx'),
+            models.Index(Lower('color'), name='catalogo_color_lower_idx'),
+            models.Index(Lower('marca'), name='catalogo_marca_lower_idx'),
+        ]
 
 
 class CarritoCompras(models.Model):
@@ -169,32 +497,27 @@ class CarritoCompras(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     activo = models.BooleanField(default=True)
     
-    def agregar_producto(self, producto, talla, cantidad=1):
-        """Agregar producto al carrito"""
-        item, created = ItemCarrito.objects.get_or_create(
-            carrito=self,
-            producto=producto,
-            talla=talla,
-            defaults={'cantidad': cantidad}
-        )
-        if not created:
-            item.cantidad += cantidad
-            item.save()
-        self.calcular_total()
-    
     def calcular_total(self):
-        """Calcular total del carrito"""
-        items = self.itemcarrito_set.all()
-        total = sum(item.calcular_subtotal() for item in items)
-        self.total = total
-        self.save()
-        return total
-    
+        """Recalcular el total desde cero con un SUM(cantidad * precio) en SQL"""
+        self.total = self.itemcarrito_set.aggregate(total=Coalesce(
+            Sum(F('cantidad') * F('producto__precio'), output_field=DecimalField(max_digits=10, decimal_places=2)),
+            Value(Decimal('0.00')),
+        ))['total']
+        CarritoCompras.objects.filter(pk=self.pk).update(total=self.total)
+        return self.total
+
+    @property
+    def clave_reservas(self):
+        """Clave de las reservas de stock de este carrito (ver ReservaStock)"""
+        return f'carrito:{self.pk}'
+
     def vaciar_carrito(self):
-        """Vaciar todos los items del carrito"""
+        """Vaciar todos los items del carrito y liberar sus reservas de stock"""
+        from .services.reservas import ReservasStock
+        ReservasStock.liberar(self.clave_reservas)
         self.itemcarrito_set.all().delete()
         self.total = Decimal('0.00')
-        self.save()
+        self.save(update_fields=['total'])
     
     def __str__(self):
         return f"Carrito de {self.usuario.nombre} - Total: ${self.total}"
@@ -202,6 +525,9 @@ class CarritoCompras(models.Model):
     class Meta:
         verbose_name = "Carrito de Compras"
         verbose_name_plural = "Carritos de Compras"
+        indexes = [
+            models.Index(fields=['usuario', 'activo'], name='carrito_usuario_activo_idx'),
+        ]
 
 
 class ItemCarrito(models.Model):
@@ -224,6 +550,99 @@ class ItemCarrito(models.Model):
         unique_together = ['carrito', 'producto', 'talla']
 
 
+class FraccionStock(models.Model):
+    """
+    Parte del stock libre de una talla con mucha demanda
+
+    Al fraccionar una talla (ver services/fracciones.py) sus unidades libres
+    se reparten en Talla.fracciones filas; cada venta descuenta de una fila
+    elegida al azar, así los checkouts concurrentes no esperan por el mismo
+    bloqueo. El stock libre es la suma de las fracciones.
+    """
+    talla = models.ForeignKey(Talla, on_delete=models.CASCADE, related_name='partes_stock')
+    indice = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.talla} [{self.indice}]: {self.stock}"
+
+    class Meta:
+        verbose_name = "Fracción de Stock"
+        verbose_name_plural = "Fracciones de Stock"
+        unique_together = ['talla', 'indice']
+
+
+class MovimientoStock(models.Model):
+    """
+    Libro de movimientos de inventario (solo se agregan filas)
+
+    Cada cambio de Talla.stock queda como una fila con la cantidad con signo.
+    Las ventas y los ajustes se aplican a Talla.stock en la misma transacción
+    (aplicado=True). Las reposiciones y devoluciones solo insertan la fila
+    (aplicado=False) y la compactación las suma a Talla.stock por lotes.
+    La consolidación resume los movimientos antiguos en una fila de saldo y
+    los marca como consolidados, sin borrarlos. Ver services/inventario.py.
+    """
+    TIPOS = [
+        ('inicial', 'Stock inicial'),
+        ('venta', 'Venta'),
+        ('reposicion', 'Reposición'),
+        ('ajuste', 'Ajuste'),
+        ('cancelacion', 'Cancelación de pedido'),
+        ('saldo', 'Saldo consolidado'),
+    ]
+
+    talla = models.ForeignKey(Talla, on_delete=models.CASCADE, related_name='movimientos')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    cantidad = models.IntegerField(help_text="Unidades con signo: positivas entran, negativas salen")
+    pedido = models.ForeignKey('Pedido', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    aplicado = models.BooleanField(default=True, help_text="Ya está sumado en Talla.stock")
+    consolidado = models.BooleanField(default=False, help_text="Incluido en una fila de saldo posterior")
+    fecha = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} - {self.talla}"
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        indexes = [
+            # Movimientos pendientes de compactar y réplica por talla
+            models.Index(fields=['aplicado', 'talla'], name='movimiento_aplicado_idx'),
+            # Historial de una talla y consolidación de movimientos antiguos
+            models.Index(fields=['talla', 'fecha'], name='movimiento_talla_fecha_idx'),
+        ]
+
+
+class ReservaStock(models.Model):
+    """
+    Unidades de una talla retenidas por un carrito hasta que vence la reserva
+
+    El carrito se identifica por una clave: 'sesion:<uuid>' para el carrito en
+    sesión (CarritoSesion) o 'carrito:<id>' para un CarritoCompras guardado.
+    La suma de las reservas de cada talla se mantiene en Talla.reservado para
+    no tener que recorrer esta tabla al calcular la disponibilidad.
+    """
+    clave_carrito = models.CharField(max_length=64)
+    talla = models.ForeignKey(Talla, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    expira_en = models.DateTimeField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.cantidad}x {self.talla} hasta {self.expira_en:%H:%M}"
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+        unique_together = ['clave_carrito', 'talla']
+        indexes = [
+            # Barrido de reservas vencidas
+            models.Index(fields=['expira_en'], name='reserva_expira_idx'),
+            models.Index(fields=['talla', 'expira_en'], name='reserva_talla_expira_idx'),
+        ]
+
+
 class Pedido(models.Model):
     ESTADOS_PEDIDO = [
         ('pendiente', 'Pendiente'),
@@ -232,40 +651,74 @@ class Pedido(models.Model):
         ('entregado', 'Entregado'),
         ('cancelado', 'Cancelado'),
     ]
+    # Estados a los que puede pasar cada estado (ver services/estados_pedido.py)
+    TRANSICIONES = {
+        'pendiente': ('procesando', 'enviado', 'entregado', 'cancelado'),
+        'procesando': ('enviado', 'entregado', 'cancelado'),
+        'enviado': ('entregado', 'cancelado'),
+        'entregado': ('cancelado',),  # devolución
+        'cancelado': (),
+    }
     
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     estado = models.CharField(max_length=20, choices=ESTADOS_PEDIDO, default='pendiente')
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     direccion_entrega = models.CharField(max_length=255)
+
+    def save(self, *args, **kwargs):
+        anterior = getattr(self, '_estado_guardado', None)
+        campos = kwargs.get('update_fields')
+        if (self._state.adding or anterior is None or self.estado == anterior
+                or (campos is not None and 'estado' not in campos)):
+            return super().save(*args, **kwargs)
+        # El cambio de estado pasa por TransicionesPedido (validación, stock de
+        # las cancelaciones, historial); el resto de campos se guarda aparte
+        nuevo_estado = self.estado
+        kwargs['update_fields'] = [
+            campo.name for campo in self._meta.concrete_fields
+            if not campo.primary_key and campo.name != 'estado' and (campos is None or campo.name in campos)
+        ]
+        with transaction.atomic():
+            self.estado = anterior
+            if kwargs['update_fields']:
+                super().save(*args, **kwargs)
+            self.actualizar_estado(nuevo_estado)
     
     def procesar_pedido(self):
-        """Procesar el pedido"""
-        self.estado = 'procesando'
-        self.save()
-        
-        # Crear items del pedido desde el carrito activo
+        """
+        Procesar el pedido con el carrito activo del usuario
+
+        Usa el mismo motor que el checkout: crea los items, descuenta stock y
+        suma las ventas en una transacción, o lanza StockInsuficiente sin
+        guardar nada.
+        """
+        from .services.checkout import ServicioCheckout
         carrito = CarritoCompras.objects.get(usuario=self.usuario, activo=True)
-        for item_carrito in carrito.itemcarrito_set.all():
-            ItemPedido.objects.create(
-                pedido=self,
-                producto=item_carrito.producto,
-                talla=item_carrito.talla,
-                cantidad=item_carrito.cantidad,
-                precio_unitario=item_carrito.producto.precio
-            )
-            # Reducir stock
-            item_carrito.talla.reducir_stock(item_carrito.cantidad)
-        
-        # Marcar carrito como inactivo
-        carrito.activo = False
-        carrito.save()
+        ServicioCheckout.confirmar(carrito, pedido=self)
     
     def actualizar_estado(self, nuevo_estado):
-        """Actualizar estado del pedido"""
-        if nuevo_estado in dict(self.ESTADOS_PEDIDO):
-            self.estado = nuevo_estado
-            self.save()
+        """
+        Actualizar estado del pedido
+
+        Al cancelarlo sus unidades vuelven al inventario y al entrar o salir de
+        'entregado' se ajustan las ventas de sus productos.
+
+        Raises:
+            TransicionInvalida: El estado no existe o la transición no está permitida
+        """
+        from .services.estados_pedido import TransicionInvalida, TransicionesPedido
+        resultado = TransicionesPedido.aplicar([self.pk], nuevo_estado)
+        if self.pk in resultado['rechazados']:
+            raise TransicionInvalida(resultado['rechazados'][self.pk])
+        self.estado = self._estado_guardado = nuevo_estado
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Estado leído de la base de datos, para registrar los cambios hechos con save()
+        instancia._estado_guardado = instancia.__dict__.get('estado')
+        return instancia
     
     def __str__(self):
         return f"Pedido #{self.id} - {self.usuario.nombre} - {self.get_estado_display()}"
@@ -273,6 +726,39 @@ class Pedido(models.Model):
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
+        indexes = [
+            # Ventas del mes: estado='entregado' AND fecha_pedido >= ...
+            models.Index(fields=['estado', 'fecha_pedido'], name='pedido_estado_fecha_idx'),
+            # Historial del usuario ordenado por fecha
+            models.Index(fields=['usuario', '-fecha_pedido'], name='pedido_usuario_fecha_idx'),
+            # Pedidos recientes en dashboard y panel de pedidos
+            models.Index(fields=['-fecha_pedido'], name='pedido_fecha_idx'),
+        ]
+
+
+class CambioEstadoPedido(models.Model):
+    """
+    Historial de estados de un pedido (solo se agregan filas)
+
+    Cada creación y cambio de estado de un Pedido deja una fila, escrita en
+    la misma transacción que el cambio; el contador de ventas se actualiza
+    a partir de estos eventos (ver services/eventos_pedido.py).
+    """
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='cambios_estado')
+    # Vacío en el evento de creación del pedido
+    estado_anterior = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO, blank=True)
+    estado_nuevo = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id}: {self.estado_anterior or '-'} -> {self.estado_nuevo}"
+
+    class Meta:
+        verbose_name = "Cambio de Estado de Pedido"
+        verbose_name_plural = "Cambios de Estado de Pedidos"
+        indexes = [
+            models.Index(fields=['pedido', 'fecha'], name='cambio_estado_pedido_idx'),
+        ]
 
 
 class ItemPedido(models.Model):
@@ -292,3 +778,140 @@ class ItemPedido(models.Model):
     class Meta:
         verbose_name = "Item del Pedido"
         verbose_name_plural = "Items del Pedido"
+
+
+class PedidoArchivado(models.Model):
+    """
+    Pedido entregado o cancelado trasladado al archivo
+
+    Misma forma y mismo id que el Pedido original. `manage.py archivar_pedidos`
+    mueve por lotes los pedidos cerrados con más de ARCHIVO_PEDIDOS_DIAS para
+    que las tablas de pedidos en uso se mantengan chicas; el historial, el
+    panel y los reportes los leen cuando el rango de fechas llega hasta aquí
+    (ver services/archivo_pedidos.py).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pedidos_archivados')
+    total = models.DecimalField(max_digits=10, decimal_places=2)
+    estado = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO)
+    fecha_pedido = models.DateTimeField()
+    direccion_entrega = models.CharField(max_length=255)
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Pedido archivado #{self.id} - {self.get_estado_display()}"
+
+    class Meta:
+        verbose_name = "Pedido Archivado"
+        verbose_name_plural = "Pedidos Archivados"
+        indexes = [
+            models.Index(fields=['estado', 'fecha_pedido'], name='archivado_estado_fecha_idx'),
+            models.Index(fields=['usuario', '-fecha_pedido'], name='archivado_usuario_fecha_idx'),
+            models.Index(fields=['-fecha_pedido'], name='archivado_fecha_idx'),
+        ]
+
+
+class ItemPedidoArchivado(models.Model):
+    """Línea de un PedidoArchivado (misma forma y mismo id que el ItemPedido original)"""
+    id = models.BigIntegerField(primary_key=True)
+    # Mismo nombre de relación que en Pedido: las plantillas sirven para ambos
+    pedido = models.ForeignKey(PedidoArchivado, on_delete=models.CASCADE, related_name='itempedido_set')
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    talla = models.ForeignKey(Talla, on_delete=models.CASCADE, related_name='+')
+    cantidad = models.IntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def calcular_subtotal(self):
+        """Calcular subtotal del item del pedido"""
+        return self.precio_unitario * self.cantidad
+
+    def __str__(self):
+        return f"{self.cantidad}x {self.producto.nombre} - Pedido archivado #{self.pedido_id}"
+
+    class Meta:
+        verbose_name = "Item de Pedido Archivado"
+        verbose_name_plural = "Items de Pedidos Archivados"
+
+
+class CambioEstadoPedidoArchivado(models.Model):
+    """Historial de estados de un PedidoArchivado (mismas filas que CambioEstadoPedido)"""
+    id = models.BigIntegerField(primary_key=True)
+    pedido = models.ForeignKey(PedidoArchivado, on_delete=models.CASCADE, related_name='cambios_estado')
+    estado_anterior = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO, blank=True)
+    estado_nuevo = models.CharField(max_length=20, choices=Pedido.ESTADOS_PEDIDO)
+    fecha = models.DateTimeField()
+
+    def __str__(self):
+        return f"Pedido archivado #{self.pedido_id}: {self.estado_anterior or '-'} -> {self.estado_nuevo}"
+
+    class Meta:
+        verbose_name = "Cambio de Estado de Pedido Archivado"
+        verbose_name_plural = "Cambios de Estado de Pedidos Archivados"
+
+
+class TrabajoPedido(models.Model):
+    """
+    Pedido pendiente de materializar por el worker (modo CHECKOUT_EN_COLA)
+
+    El checkout crea el Pedido en estado 'pendiente' y esta fila con sus
+    líneas; `manage.py procesar_pedidos` las aplica por lotes (ver
+    services/cola_pedidos.py).
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('completado', 'Completado'),
+        ('fallido', 'Fallido'),
+    ]
+
+    pedido = models.OneToOneField(Pedido, on_delete=models.CASCADE, related_name='trabajo')
+    lineas = models.JSONField(help_text="[[producto_id, talla_id, cantidad, precio], ...]")
+    clave_reservas = models.CharField(max_length=64, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_proceso = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Trabajo del pedido #{self.pedido_id} - {self.estado}"
+
+    class Meta:
+        verbose_name = "Trabajo de Pedido"
+        verbose_name_plural = "Trabajos de Pedidos"
+        indexes = [
+            # El worker toma los pendientes más antiguos
+            models.Index(fields=['estado', 'fecha_creacion'], name='trabajo_estado_fecha_idx'),
+            # Latencia de los últimos procesados
+            models.Index(fields=['-fecha_proceso'], name='trabajo_proceso_idx'),
+        ]
+
+
+class RespuestaIdempotente(models.Model):
+    """
+    Respuesta guardada de un POST enviado con clave de idempotencia
+
+    Un reintento con la misma clave (cabecera Idempotency-Key o campo
+    clave_idempotencia) recibe esta respuesta en lugar de repetir la
+    operación. El ámbito separa las claves de cada usuario o sesión
+    ('usuario:<id>' o 'sesion:<clave>'). Ver services/idempotencia.py.
+    """
+    ambito = models.CharField(max_length=64)
+    clave = models.CharField(max_length=64)
+    huella = models.CharField(max_length=64, help_text="SHA-256 de la ruta y los datos de la solicitud")
+    estado_http = models.PositiveSmallIntegerField()
+    ubicacion = models.CharField(max_length=500, blank=True, help_text="Cabecera Location de las redirecciones")
+    tipo_contenido = models.CharField(max_length=100, blank=True)
+    contenido = models.TextField(blank=True)
+    expira_en = models.DateTimeField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.ambito} {self.clave} -> {self.estado_http}"
+
+    class Meta:
+        verbose_name = "Respuesta Idempotente"
+        verbose_name_plural = "Respuestas Idempotentes"
+        unique_together = ['ambito', 'clave']
+        indexes = [
+            # Limpieza de respuestas vencidas
+            models.Index(fields=['expira_en'], name='idempotencia_expira_idx'),
+        ]
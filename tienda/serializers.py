@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Producto, Categoria, Talla, ImagenProducto
+from .models import Producto, ProductoCatalogo, Categoria, Talla, ImagenProducto
 
 
 class CategoriaSerializer(serializers.ModelSerializer):
@@ -29,7 +29,6 @@ class ProductoSerializer(serializers.ModelSerializer):
     tallas = TallaSerializer(many=True, read_only=True)
     imagenes = ImagenProductoSerializer(many=True, read_only=True)
     imagen_principal_url = serializers.SerializerMethodField()
-    stock_total = serializers.SerializerMethodField()
 
     class Meta:
         model = Producto
@@ -47,10 +46,11 @@ class ProductoSerializer(serializers.ModelSerializer):
             'tallas',
             'imagenes',
             'stock_total',
+            'en_stock',
             'total_vendidos',
             'fecha_creacion'
         ]
-        read_only_fields = ['fecha_creacion', 'total_vendidos']
+        read_only_fields = ['fecha_creacion', 'total_vendidos', 'stock_total', 'en_stock']
 
     def get_imagen_principal_url(self, obj):
         """Obtener la URL de la imagen principal"""
@@ -60,22 +60,19 @@ class ProductoSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(imagen_url)
         return imagen_url
 
-    def get_stock_total(self, obj):
-        """Obtener el stock total del producto"""
-        return obj.stock_total()
 
-
-class ProductoListSerializer(serializers.ModelSerializer):
+class ProductoCatalogoSerializer(serializers.ModelSerializer):
     """
     Serializer simplificado para listados de productos
-    (menos datos para mejorar performance)
+
+    Se lee desde el modelo de lectura ProductoCatalogo, sin consultar
+    Categoria ni las imágenes.
     """
-    categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
-    stock_total = serializers.SerializerMethodField()
+    id = serializers.IntegerField(source='pk', read_only=True)
     imagen_url = serializers.SerializerMethodField()
 
     class Meta:
-        model = Producto
+        model = ProductoCatalogo
         fields = [
             'id',
             'nombre',
@@ -85,16 +82,13 @@ class ProductoListSerializer(serializers.ModelSerializer):
             'categoria_nombre',
             'imagen_url',
             'stock_total',
+            'en_stock',
             'total_vendidos'
         ]
-
-    def get_stock_total(self, obj):
-        return obj.stock_total()
+        read_only_fields = fields
 
     def get_imagen_url(self, obj):
         request = self.context.get('request')
-        if obj.imagen_principal and request:
-            return request.build_absolute_uri(obj.imagen_principal.url)
-        elif obj.imagen_principal:
-            return obj.imagen_principal.url
-        return None
\ No newline at end of file
+        if obj.imagen_url and request:
+            return request.build_absolute_uri(obj.imagen_url)
+        return obj.imagen_url or None
@@ -0,0 +1,260 @@
+"""
+Archivo de pedidos cerrados
+
+Los pedidos entregados o cancelados con más de ARCHIVO_PEDIDOS_DIAS se
+mueven a PedidoArchivado / ItemPedidoArchivado / CambioEstadoPedidoArchivado
+(misma forma y mismos ids) para que Pedido e ItemPedido solo tengan los
+pedidos en uso:
+
+- `archivar` procesa lotes de los pedidos más antiguos. Cada lote copia y
+  borra en una transacción, así que un corte a mitad de camino no deja
+  pedidos a medias y la siguiente ejecución sigue desde el primer pedido
+  pendiente. `pausa` y `max_lotes` limitan la carga sobre la base de datos.
+- Mover un pedido no es eliminarlo: se borra con delete() (las cascadas y
+  SET_NULL del ORM siguen aplicando) marcando sus ids con `moviendo`, y la
+  señal que descuenta las ventas de un pedido eliminado los ignora. Las
+  ventas siguen contando sus líneas archivadas (ver services/recalculo_ventas.py).
+- Las lecturas consultan el archivo solo si el rango de fechas llega a la
+  frontera (fecha del pedido archivado más reciente, cacheada):
+  `incluir_archivo`, `totales` y `ListadoConArchivo` para listados paginados.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from decimal import Decimal
+from itertools import chain
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+from ..models import (
+    CambioEstadoPedido, CambioEstadoPedidoArchivado, ItemPedido, ItemPedidoArchivado, Pedido, PedidoArchivado,
+)
+
+# Ids de los pedidos que el lote en curso está moviendo al archivo
+_moviendo = ContextVar('pedidos_moviendo_al_archivo', default=frozenset())
+
+
+class ArchivoPedidos:
+    """
+    Traslado por lotes al archivo y lectura a través de él
+
+    Ejemplo de uso:
+        resultado = ArchivoPedidos.archivar(dias=365, pausa=0.5, max_lotes=20)
+        resultado['archivados'], resultado['restantes']
+
+        ventas = ArchivoPedidos.totales(desde=primer_dia_mes, estado='entregado')
+    """
+
+    TAMANO_LOTE = 500
+    ESTADOS = ('entregado', 'cancelado')
+    CACHE_KEY = 'archivo_pedidos_frontera'
+    CACHE_TIMEOUT = 600  # 10 minutos; cada lote archivado la descarta
+
+    @staticmethod
+    def limite(dias=None):
+        """Fecha antes de la cual un pedido cerrado se archiva"""
+        dias = settings.ARCHIVO_PEDIDOS_DIAS if dias is None else dias
+        return timezone.now() - timedelta(days=dias)
+
+    @classmethod
+    def pendientes(cls, limite):
+        """Pedidos cerrados anteriores a `limite` que siguen en la tabla en uso"""
+        return Pedido.objects.filter(estado__in=cls.ESTADOS, fecha_pedido__lt=limite)
+
+    @classmethod
+    def archivar(cls, dias=None, tamano_lote=None, pausa=0, max_lotes=None):
+        """
+        Mover al archivo los pedidos cerrados con más de `dias`
+
+        Args:
+            dias: Antigüedad mínima (por defecto ARCHIVO_PEDIDOS_DIAS)
+            pausa: Segundos de espera entre lotes
+            max_lotes: Cortar tras esta cantidad de lotes (None: hasta terminar)
+
+        Returns:
+            dict: archivados, lotes, restantes (pendientes al terminar) y segundos
+        """
+        inicio = time.monotonic()
+        tamano_lote = tamano_lote or cls.TAMANO_LOTE
+        limite = cls.limite(dias)
+        archivados = lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            movidos = cls.archivar_lote(limite, tamano_lote)
+            archivados += movidos
+            lotes += 1 if movidos else 0
+            if movidos < tamano_lote:
+                break
+            if pausa and (max_lotes is None or lotes < max_lotes):
+                time.sleep(pausa)
+        return {
+            'archivados': archivados,
+            'lotes': lotes,
+            'restantes': cls.pendientes(limite).count(),
+            'segundos': round(time.monotonic() - inicio, 3),
+        }
+
+    @classmethod
+    def archivar_lote(cls, limite, tamano_lote):
+        """
+        Copiar al archivo y borrar un lote de los pedidos pendientes más antiguos
+
+        Returns:
+            int: Cantidad de pedidos movidos (0 si no quedaban)
+        """
+        with transaction.atomic():
+            pedidos = list(
+                cls.pendientes(limite).select_for_update().order_by('fecha_pedido', 'pk').values_list(
+                    'pk', 'usuario_id', 'total', 'estado', 'fecha_pedido', 'direccion_entrega'
+                )[:tamano_lote]
+            )
+            if not pedidos:
+                return 0
+            ids = [pedido[0] for pedido in pedidos]
+            ahora = timezone.now()
+
+            PedidoArchivado.objects.bulk_create([
+                PedidoArchivado(
+                    id=pk, usuario_id=usuario_id, total=total, estado=estado,
+                    fecha_pedido=fecha, direccion_entrega=direccion, fecha_archivado=ahora,
+                )
+                for pk, usuario_id, total, estado, fecha, direccion in pedidos
+            ])
+            ItemPedidoArchivado.objects.bulk_create([
+                ItemPedidoArchivado(
+                    id=pk, pedido_id=pedido_id, producto_id=producto_id, talla_id=talla_id,
+                    cantidad=cantidad, precio_unitario=precio,
+                )
+                for pk, pedido_id, producto_id, talla_id, cantidad, precio in ItemPedido.objects.filter(
+                    pedido_id__in=ids
+                ).values_list('pk', 'pedido_id', 'producto_id', 'talla_id', 'cantidad', 'precio_unitario')
+            ])
+            CambioEstadoPedidoArchivado.objects.bulk_create([
+                CambioEstadoPedidoArchivado(
+                    id=pk, pedido_id=pedido_id, estado_anterior=anterior, estado_nuevo=nuevo, fecha=fecha,
+                )
+                for pk, pedido_id, anterior, nuevo, fecha in CambioEstadoPedido.objects.filter(
+                    pedido_id__in=ids
+                ).values_list('pk', 'pedido_id', 'estado_anterior', 'estado_nuevo', 'fecha')
+            ])
+
+            # Líneas, historial y trabajo se borran en cascada; los movimientos quedan sin pedido
+            with cls._marcar(ids):
+                Pedido.objects.filter(pk__in=ids).delete()
+
+        cache.delete(cls.CACHE_KEY)
+        return len(ids)
+
+    @staticmethod
+    @contextmanager
+    def _marcar(ids):
+        token = _moviendo.set(frozenset(ids))
+        try:
+            yield
+        finally:
+            _moviendo.reset(token)
+
+    @staticmethod
+    def moviendo(pedido_id):
+        """Si el pedido se está borrando para moverlo al archivo (no es una baja)"""
+        return pedido_id in _moviendo.get()
+
+    @classmethod
+    def frontera(cls):
+        """Fecha del pedido archivado más reciente (None si el archivo está vacío)"""
+        datos = cache.get(cls.CACHE_KEY)
+        if datos is None:
+            datos = {'fecha': PedidoArchivado.objects.aggregate(fecha=Max('fecha_pedido'))['fecha']}
+            cache.set(cls.CACHE_KEY, datos, cls.CACHE_TIMEOUT)
+        return datos['fecha']
+
+    @classmethod
+    def incluir_archivo(cls, desde=None, estado=None):
+        """
+        Si un rango de fechas que empieza en `desde` (None: sin límite) llega a pedidos archivados
+
+        Con `estado` solo se consulta el archivo para los estados archivables.
+        """
+        if estado and estado not in cls.ESTADOS:
+            return False
+        frontera = cls.frontera()
+        return frontera is not None and (desde is None or desde <= frontera)
+
+    @classmethod
+    def totales(cls, desde=None, estado=None, **filtros):
+        """
+        Cantidad de pedidos y suma de sus totales, activos y archivados
+
+        Args:
+            desde: Fecha mínima del pedido (None: sin límite)
+            estado: Filtrar por estado
+            filtros: Otros filtros de campos comunes a Pedido y PedidoArchivado
+
+        Returns:
+            dict: pedidos y total
+        """
+        if desde is not None:
+            filtros['fecha_pedido__gte'] = desde
+        if estado:
+            filtros['estado'] = estado
+        modelos = [Pedido, PedidoArchivado] if cls.incluir_archivo(desde, estado) else [Pedido]
+        pedidos, total = 0, Decimal('0.00')
+        for modelo in modelos:
+            datos = modelo.objects.filter(**filtros).aggregate(pedidos=Count('pk'), total=Sum('total'))
+            pedidos += datos['pedidos']
+            total += datos['total'] or 0
+        return {'pedidos': pedidos, 'total': total}
+
+
+class ListadoConArchivo:
+    """
+    Pedidos activos y archivados como una sola lista por fecha descendente
+
+    Se usa como object_list de Paginator. count() suma los dos conteos; cada
+    página lee solo (fecha, id) de las primeras filas de cada tabla, las
+    mezcla y carga después los pedidos de la página con sus prefetch. Sin
+    archivo (archivados=None) equivale al queryset de activos.
+
+    Ejemplo de uso:
+        listado = ListadoConArchivo(pedidos, archivados if ArchivoPedidos.incluir_archivo() else None)
+        Paginator(listado, 10).page(2)
+    """
+
+    def __init__(self, activos, archivados=None):
+        self.activos = activos
+        self.archivados = archivados
+
+    @cached_property
+    def _conteos(self):
+        return self.activos.count(), self.archivados.count() if self.archivados is not None else 0
+
+    def count(self):
+        return sum(self._conteos)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, indice):
+        if not isinstance(indice, slice):
+            return self[indice:indice + 1][0]
+        inicio, fin = indice.start or 0, indice.stop
+        if not self._conteos[1]:
+            return list(self.activos[inicio:fin])
+
+        fuentes = (self.activos, self.archivados)
+        claves = sorted(
+            chain.from_iterable(
+                ((fecha, pk, origen) for fecha, pk in fuente.prefetch_related(None).values_list('fecha_pedido', 'pk')[:fin])
+                for origen, fuente in enumerate(fuentes)
+            ),
+            reverse=True,
+        )[inicio:fin]
+        cargados = {}
+        for origen, fuente in enumerate(fuentes):
+            ids = [pk for _, pk, de in claves if de == origen]
+            if ids:
+                cargados.update(((origen, pedido.pk), pedido) for pedido in fuente.filter(pk__in=ids))
+        return [cargados[(origen, pk)] for _, pk, origen in claves]
@@ -0,0 +1,214 @@
+"""
+Índice de autocompletado en memoria para la búsqueda en tiempo real
+
+Cada proceso (worker de gunicorn) mantiene un índice de prefijos de palabra
+construido a partir del nombre, la marca, la categoría y el color de cada
+producto (leídos de ProductoCatalogo), junto con la respuesta JSON ya preparada. Las consultas del cuadro
+de búsqueda se resuelven con búsquedas en diccionarios, sin tocar la base de
+datos.
+
+- Se precarga al arrancar (ver wsgi.py) o en la primera consulta.
+- Las señales de Producto, Talla y Categoria lo actualizan de forma incremental
+  en el proceso que hace la escritura.
+- Los demás procesos detectan el cambio por la versión del catálogo
+  (VersionCatalogo) cada INTERVALO_VERIFICACION segundos y se reconstruyen.
+"""
+import sys
+import threading
+import time
+from .busqueda import terminos
+from .cache_catalogo import VersionCatalogo
+
+
+class IndiceAutocompletado:
+    """
+    Índice de prefijos en memoria con estadísticas de uso
+
+    Ejemplo de uso:
+        resultados = IndiceAutocompletado.buscar('pantal', limite=10)
+        IndiceAutocompletado.estadisticas()  # tamaño y tasa de aciertos
+    """
+
+    LONGITUD_MINIMA = 2
+    LONGITUD_MAXIMA_PREFIJO = 15
+    INTERVALO_VERIFICACION = 30  # segundos entre comprobaciones de versión
+
+    _lock = threading.Lock()
+    _productos = None   # id -> (payload, palabras_nombre, palabras_todas)
+    _prefijos = {}      # prefijo -> set(ids)
+    _version = None
+    _cargado_en = None
+    _verificado_en = 0.0
+    _consultas = 0
+    _aciertos = 0
+
+    # ------------------------------------------------------------------
+    # Construcción
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _filas(**filtros):
+        from ..models import ProductoCatalogo
+        return ProductoCatalogo.objects.filter(**filtros).values_list(
+            'producto_id', 'nombre', 'marca', 'precio', 'categoria_nombre', 'color', 'stock_total'
+        )
+
+    @classmethod
+    def _entrada(cls, fila):
+        """Payload precalculado y palabras normalizadas de un producto"""
+        pk, nombre, marca, precio, categoria, color, stock_total = fila
+        payload = {
+            'id': pk,
+            'nombre': nombre,
+            'marca': marca,
+            'precio': str(precio),
+            'categoria': categoria,
+            'color': color,
+            'stock_total': stock_total,
+            'url': f'/producto/{pk}/',
+        }
+        palabras_nombre = frozenset(terminos(nombre))
+        palabras = palabras_nombre | frozenset(terminos(f'{marca} {categoria} {color}'))
+        return payload, palabras_nombre, palabras
+
+    @classmethod
+    def _prefijos_de(cls, palabras):
+        for palabra in palabras:
+            for largo in range(cls.LONGITUD_MINIMA, min(len(palabra), cls.LONGITUD_MAXIMA_PREFIJO) + 1):
+                yield palabra[:largo]
+
+    @classmethod
+    def cargar(cls):
+        """Construir el índice completo (una consulta) y reemplazar el actual"""
+        version = VersionCatalogo.obtener()
+        productos, prefijos = {}, {}
+        for fila in cls._filas():
+            entrada = cls._entrada(fila)
+            productos[fila[0]] = entrada
+            for prefijo in cls._prefijos_de(entrada[2]):
+                prefijos.setdefault(prefijo, set()).add(fila[0])
+        with cls._lock:
+            cls._productos, cls._prefijos = productos, prefijos
+            cls._version = version
+            cls._cargado_en = cls._verificado_en = time.time()
+
+    @classmethod
+    def _quitar(cls, pk):
+        entrada = cls._productos.pop(pk, None)
+        if entrada is None:
+            return
+        for prefijo in cls._prefijos_de(entrada[2]):
+            ids = cls._prefijos.get(prefijo)
+            if ids is not None:
+                ids.discard(pk)
+                if not ids:
+                    del cls._prefijos[prefijo]
+
+    @classmethod
+    def actualizar(cls, *producto_ids):
+        """Reindexar productos concretos (solo si el índice ya está cargado)"""
+        if cls._productos is None or not producto_ids:
+            return
+        filas = list(cls._filas(producto_id__in=producto_ids))
+        with cls._lock:
+            for pk in producto_ids:
+                cls._quitar(pk)
+            for fila in filas:
+                entrada = cls._entrada(fila)
+                cls._productos[fila[0]] = entrada
+                for prefijo in cls._prefijos_de(entrada[2]):
+                    cls._prefijos.setdefault(prefijo, set()).add(fila[0])
+            cls._version = VersionCatalogo.obtener()
+
+    @classmethod
+    def eliminar(cls, *producto_ids):
+        """Quitar productos del índice"""
+        if cls._productos is None:
+            return
+        with cls._lock:
+            for pk in producto_ids:
+                cls._quitar(pk)
+            cls._version = VersionCatalogo.obtener()
+
+    @classmethod
+    def _asegurar_vigente(cls):
+        """Cargar el índice si no existe o si otro proceso cambió el catálogo"""
+        if cls._productos is None:
+            cls.cargar()
+            return False
+        ahora = time.time()
+        if ahora - cls._verificado_en >= cls.INTERVALO_VERIFICACION:
+            cls._verificado_en = ahora
+            if VersionCatalogo.obtener() != cls._version:
+                cls.cargar()
+                return False
+        return True
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def buscar(cls, texto, limite=10):
+        """
+        Productos cuyas palabras empiezan por cada término buscado
+
+        Los productos que coinciden en el nombre aparecen primero.
+
+        Returns:
+            list: Payloads listos para serializar a JSON
+        """
+        palabras = terminos(texto)
+        if not palabras:
+            return []
+
+        acierto = cls._asegurar_vigente()
+        cls._consultas += 1
+        if acierto:
+            cls._aciertos += 1
+
+        productos, prefijos = cls._productos, cls._prefijos
+        candidatos = None
+        for palabra in palabras:
+            ids = prefijos.get(palabra[:cls.LONGITUD_MAXIMA_PREFIJO], set())
+            if len(palabra) > cls.LONGITUD_MAXIMA_PREFIJO:
+                ids = {pk for pk in ids if any(p.startswith(palabra) for p in productos[pk][2])}
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+
+        def puntaje(pk):
+            palabras_nombre = productos[pk][1]
+            en_nombre = sum(1 for palabra in palabras if any(p.startswith(palabra) for p in palabras_nombre))
+            return (-en_nombre, -pk)
+
+        return [productos[pk][0] for pk in sorted(candidatos, key=puntaje)[:limite]]
+
+    @classmethod
+    def estadisticas(cls):
+        """Tamaño aproximado del índice y tasa de aciertos en memoria"""
+        productos, prefijos = cls._productos or {}, cls._prefijos
+        bytes_aprox = sys.getsizeof(productos) + sys.getsizeof(prefijos) + sum(
+            sys.getsizeof(prefijo) + sys.getsizeof(ids) for prefijo, ids in prefijos.items()
+        )
+        return {
+            'cargado': cls._productos is not None,
+            'productos': len(productos),
+            'prefijos': len(prefijos),
+            'entradas': sum(len(ids) for ids in prefijos.values()),
+            'bytes_aproximados': bytes_aprox,
+            'consultas': cls._consultas,
+            'aciertos': cls._aciertos,
+            'tasa_aciertos': round(cls._aciertos / cls._consultas, 4) if cls._consultas else None,
+            'version': cls._version,
+            'cargado_en': cls._cargado_en,
+        }
+
+    @classmethod
+    def reiniciar(cls):
+        """Descartar el índice y las estadísticas (se recarga en la próxima consulta)"""
+        with cls._lock:
+            cls._productos, cls._prefijos = None, {}
+            cls._version = cls._cargado_en = None
+            cls._verificado_en = 0.0
+            cls._consultas = cls._aciertos = 0
@@ -0,0 +1,198 @@
+"""
+Índice de búsqueda de texto completo para productos
+
+Reemplaza los seis icontains con comodín inicial (que obligan a recorrer la
+tabla completa) por un índice de texto real:
+
+- SQLite: tabla virtual FTS5 (tienda_producto_fts) con ranking BM25.
+- PostgreSQL: tabla con columna tsvector y índice GIN (tienda_producto_busqueda)
+  con ranking ts_rank.
+
+Los textos se normalizan en Python (minúsculas y sin tildes) tanto al indexar
+como al buscar, así "pantalon" encuentra "Pantalón" en ambos motores. Cada
+término se busca como prefijo, de modo que "pantal" también coincide.
+
+El índice se actualiza de forma incremental desde las señales de Producto y
+Categoria. Si el motor de base de datos no está soportado o el índice no
+existe, la búsqueda cae de vuelta a icontains.
+"""
+import re
+import unicodedata
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+TABLA_SQLITE = 'tienda_producto_fts'
+TABLA_POSTGRES = 'tienda_producto_busqueda'
+
+# Campos indexados y su peso en el ranking (nombre y marca pesan más)
+CAMPOS = ('nombre', 'marca', 'descripcion', 'categoria', 'color', 'material')
+PESOS_SQLITE = (10.0, 5.0, 1.0, 3.0, 2.0, 2.0)
+PESOS_POSTGRES = ('A', 'A', 'C', 'B', 'B', 'B')
+
+
+def normalizar(texto):
+    """Pasar a minúsculas y quitar tildes: 'Pantalón' -> 'pantalon'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def terminos(texto):
+    """Separar el texto normalizado en palabras (sin operadores del motor)"""
+    return re.findall(r'\w+', normalizar(texto))
+
+
+def indexar_filas(conexion, filas):
+    """
+    Insertar o reemplazar filas en el índice
+
+    Args:
+        filas: Iterable de tuplas (producto_id, nombre, marca, descripcion,
+               categoria, color, material)
+    """
+    filas = [(fila[0], *[normalizar(valor) for valor in fila[1:]]) for fila in filas]
+    if not filas:
+        return
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {TABLA_SQLITE} WHERE rowid = %s', [(f[0],) for f in filas])
+            columnas = ', '.join(CAMPOS)
+            marcadores = ', '.join(['%s'] * (len(CAMPOS) + 1))
+            cursor.executemany(
+                f'INSERT INTO {TABLA_SQLITE} (rowid, {columnas}) VALUES ({marcadores})', filas
+            )
+        elif conexion.vendor == 'postgresql':
+            documento = ' || '.join(
+                f"setweight(to_tsvector('spanish', %s), '{peso}')" for peso in PESOS_POSTGRES
+            )
+            cursor.executemany(
+                f'INSERT INTO {TABLA_POSTGRES} (producto_id, documento) VALUES (%s, {documento}) '
+                f'ON CONFLICT (producto_id) DO UPDATE SET documento = EXCLUDED.documento',
+                filas
+            )
+
+
+class IndiceBusqueda:
+    """
+    Búsqueda de productos sobre el índice de texto completo
+
+    Ejemplo de uso:
+        productos = IndiceBusqueda.filtrar(Producto.objects.all(), 'pantalon gris')
+        productos = IndiceBusqueda.por_relevancia(productos, 'pantalon gris')
+        ids = IndiceBusqueda.buscar_ids('pantalon', limite=10)  # ordenados por relevancia
+    """
+
+    _disponible = {}
+
+    @classmethod
+    def disponible(cls):
+        """Indica si el motor actual tiene el índice creado"""
+        alias = connection.alias
+        if alias not in cls._disponible:
+            tabla = {'sqlite': TABLA_SQLITE, 'postgresql': TABLA_POSTGRES}.get(connection.vendor)
+            cls._disponible[alias] = bool(tabla) and tabla in connection.introspection.table_names()
+        return cls._disponible[alias]
+
+    @classmethod
+    def _coincidencias(cls, texto):
+        """
+        Partes SQL de la búsqueda, o None si no se puede usar el índice
+
+        Returns:
+            (columna_id, expresion_rango, parametros_rango, from_where, parametros_where)
+        """
+        palabras = terminos(texto)
+        if not palabras or not cls.disponible():
+            return None
+        if connection.vendor == 'sqlite':
+            consulta = ' '.join(f'"{palabra}"*' for palabra in palabras)
+            pesos = ', '.join(str(peso) for peso in PESOS_SQLITE)
+            # bm25 devuelve valores negativos: menor es más relevante
+            return (
+                'rowid', f'bm25({TABLA_SQLITE}, {pesos})', [],
+                f'{TABLA_SQLITE} WHERE {TABLA_SQLITE} MATCH %s', [consulta],
+            )
+        consulta = ' & '.join(f'{palabra}:*' for palabra in palabras)
+        return (
+            'producto_id', "-ts_rank(documento, to_tsquery('spanish', %s))", [consulta],
+            f"{TABLA_POSTGRES} WHERE documento @@ to_tsquery('spanish', %s)", [consulta],
+        )
+
+    @classmethod
+    def filtrar(cls, queryset, texto):
+        """Filtrar un queryset de Producto por el texto buscado"""
+        partes = cls._coincidencias(texto)
+        if partes is None:
+            return cls._filtrar_icontains(queryset, texto)
+        columna_id, _, _, from_where, parametros = partes
+        return queryset.filter(pk__in=RawSQL(f'SELECT {columna_id} FROM {from_where}', parametros))
+
+    @classmethod
+    def por_relevancia(cls, queryset, texto, desempate=('-fecha_creacion', '-pk')):
+        """
+        Ordenar un queryset ya filtrado por `texto` del más al menos relevante
+
+        El rango se calcula con una subconsulta correlacionada sobre el índice,
+        solo para las filas que quedan tras el filtro. Sin índice se ordena
+        por `desempate`.
+        """
+        partes = cls._coincidencias(texto)
+        if partes is None:
+            return queryset.order_by(*desempate)
+        columna_id, rango, parametros_rango, from_where, parametros_where = partes
+        opciones, nombre = queryset.model._meta, connection.ops.quote_name
+        return queryset.annotate(rango=RawSQL(
+            f'SELECT {rango} FROM {from_where} AND {columna_id} = {nombre(opciones.db_table)}.{nombre(opciones.pk.column)}',
+            parametros_rango + parametros_where,
+        )).order_by('rango', *desempate)
+
+    @classmethod
+    def buscar_ids(cls, texto, limite=None):
+        """IDs de productos que coinciden, ordenados por relevancia"""
+        partes = cls._coincidencias(texto)
+        if partes is None:
+            from ..models import Producto
+            queryset = cls._filtrar_icontains(Producto.objects.order_by('-fecha_creacion'), texto)
+            return list(queryset.values_list('id', flat=True)[:limite])
+        columna_id, rango, parametros_rango, from_where, parametros_where = partes
+        sql = f'SELECT {columna_id}, {rango} AS rango FROM {from_where} ORDER BY rango'
+        parametros = parametros_rango + parametros_where
+        if limite:
+            sql += ' LIMIT %s'
+            parametros = parametros + [limite]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, parametros)
+            return [fila[0] for fila in cursor.fetchall()]
+
+    @staticmethod
+    def _filtrar_icontains(queryset, texto):
+        """Búsqueda sin índice (motores no soportados)"""
+        return queryset.filter(
+            Q(nombre__icontains=texto) |
+            Q(marca__icontains=texto) |
+            Q(descripcion__icontains=texto) |
+            Q(categoria__nombre__icontains=texto) |
+            Q(color__icontains=texto) |
+            Q(material__icontains=texto)
+        )
+
+    @classmethod
+    def indexar(cls, *producto_ids):
+        """Actualizar en el índice los productos indicados"""
+        if not cls.disponible() or not producto_ids:
+            return
+        from ..models import Producto
+        filas = Producto.objects.filter(pk__in=producto_ids).values_list(
+            'id', 'nombre', 'marca', 'descripcion', 'categoria__nombre', 'color', 'material'
+        )
+        indexar_filas(connection, list(filas))
+
+    @classmethod
+    def eliminar(cls, *producto_ids):
+        """Quitar productos del índice"""
+        if not cls.disponible() or not producto_ids:
+            return
+        tabla, columna = (TABLA_SQLITE, 'rowid') if connection.vendor == 'sqlite' else (TABLA_POSTGRES, 'producto_id')
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {tabla} WHERE {columna} = %s', [(pk,) for pk in producto_ids])
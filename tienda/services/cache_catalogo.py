@@ -0,0 +1,68 @@
+"""
+Versión del catálogo para invalidar cachés derivadas
+
+En lugar de borrar claves una por una, cada caché del catálogo incluye el
+número de versión en su clave. Las señales de los modelos incrementan la
+versión y las entradas anteriores simplemente dejan de usarse hasta expirar.
+"""
+import time
+from django.core.cache import cache
+from django.utils import translation
+
+
+class VersionCatalogo:
+    """Contador de versión del catálogo guardado en la caché de Django"""
+
+    CACHE_KEY = 'catalogo_version'
+
+    @classmethod
+    def obtener(cls):
+        """Obtener la versión actual (la inicializa si no existe)"""
+        version = cache.get(cls.CACHE_KEY)
+        if version is None:
+            # Partir de la hora actual para no reutilizar versiones de una
+            # caché anterior si la clave fue desalojada
+            cache.add(cls.CACHE_KEY, int(time.time()), None)
+            version = cache.get(cls.CACHE_KEY)
+        return version
+
+    @classmethod
+    def incrementar(cls):
+        """Invalidar todas las cachés del catálogo"""
+        try:
+            return cache.incr(cls.CACHE_KEY)
+        except ValueError:
+            version = int(time.time())
+            cache.set(cls.CACHE_KEY, version, None)
+            return version
+
+    @classmethod
+    def clave(cls, prefijo, *partes):
+        """Construir una clave de caché ligada a la versión actual"""
+        return ':'.join([prefijo, f'v{cls.obtener()}', *[str(p) for p in partes]])
+
+
+class CacheFragmentos:
+    """
+    Caché de fragmentos HTML del catálogo ligada a la versión del catálogo
+
+    Ejemplo de uso:
+        grid = CacheFragmentos.obtener('grid_productos', [firma, pagina], renderizar)
+
+    renderizar() solo se ejecuta si no hay entrada para la versión actual,
+    así que en un acierto no se consulta la base de datos ni se renderiza la
+    plantilla. Tras cualquier cambio en productos, tallas, imágenes o
+    categorías la versión cambia y la entrada vieja deja de usarse.
+    """
+
+    CACHE_TIMEOUT = 600  # 10 minutos
+
+    @classmethod
+    def obtener(cls, nombre, partes, renderizar, timeout=None):
+        idioma = translation.get_language() or ''
+        cache_key = VersionCatalogo.clave(f'fragmento_{nombre}', idioma, *partes)
+        fragmento = cache.get(cache_key)
+        if fragmento is None:
+            fragmento = renderizar()
+            cache.set(cache_key, fragmento, timeout or cls.CACHE_TIMEOUT)
+        return fragmento
@@ -0,0 +1,259 @@
+"""
+Carrito de compras guardado en la sesión
+
+Las líneas del carrito viven en request.session, tanto para visitantes como
+para usuarios autenticados. Navegar y agregar productos no crea ni reescribe
+filas de CarritoCompras/ItemCarrito: el carrito solo se guarda en la base de
+datos al confirmar la compra, al cerrar sesión o al llamar a guardar().
+
+Al iniciar sesión, el carrito anónimo se completa con las líneas del carrito
+guardado del usuario (ver fusionar y la señal user_logged_in en signals.py).
+
+Las unidades agregadas se siguen reservando por unos minutos (ver
+services/reservas.py) con la clave del carrito en sesión.
+"""
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from ..models import CarritoCompras, ItemCarrito, ProductoCatalogo, Talla
+from .checkout import ServicioCheckout
+from .cola_pedidos import ColaPedidos
+from .reservas import ReservasStock
+
+
+class LineaCarrito:
+    """Línea del carrito con la misma interfaz que ItemCarrito en las plantillas"""
+
+    def __init__(self, producto, talla, cantidad):
+        self.producto = producto
+        self.talla = talla
+        self.cantidad = cantidad
+
+    @property
+    def precio_unitario(self):
+        return self.producto.precio
+
+    def calcular_subtotal(self):
+        return self.producto.precio * self.cantidad
+
+    def como_dict(self):
+        """Datos de la línea para las respuestas JSON del carrito"""
+        return {
+            'talla_id': self.talla.pk,
+            'producto_id': self.producto.pk,
+            'nombre': self.producto.nombre,
+            'talla': self.talla.talla,
+            'cantidad': self.cantidad,
+            'precio_unitario': float(self.precio_unitario),
+            'subtotal': float(self.calcular_subtotal()),
+            'disponible': self.talla.disponible,
+        }
+
+
+class CarritoSesion:
+    """
+    Carrito de la sesión actual
+
+    En la sesión se guarda {'clave': <uuid>, 'lineas': {talla_id: [producto_id, cantidad]}}.
+
+    Ejemplo de uso:
+        carrito = CarritoSesion(request)
+        if not carrito.agregar(talla, 2):
+            messages.error(request, 'No hay unidades disponibles')
+        pedido = carrito.confirmar(direccion)
+    """
+
+    CLAVE_SESION = 'carrito'
+
+    def __init__(self, request):
+        self.request = request
+        datos = request.session.get(self.CLAVE_SESION) or {}
+        self.clave = datos.get('clave')
+        self.lineas = {int(talla_id): tuple(linea) for talla_id, linea in datos.get('lineas', {}).items()}
+        self._items = None
+
+    @property
+    def clave_reservas(self):
+        """Clave de las reservas de stock de este carrito (se crea al primer uso)"""
+        if not self.clave:
+            self.clave = uuid.uuid4().hex
+        return f'sesion:{self.clave}'
+
+    def _guardar_sesion(self):
+        self._items = None
+        self.request.session[self.CLAVE_SESION] = {
+            'clave': self.clave,
+            'lineas': {str(talla_id): list(linea) for talla_id, linea in self.lineas.items()},
+        }
+
+    def __len__(self):
+        return len(self.lineas)
+
+    def __bool__(self):
+        return bool(self.lineas)
+
+    # ------------------------------------------------------------------
+    # Modificación
+    # ------------------------------------------------------------------
+
+    def agregar(self, talla, cantidad=1):
+        """
+        Reservar las unidades y agregarlas al carrito
+
+        Returns:
+            bool: False si no hay unidades disponibles (el carrito no cambia)
+        """
+        if not ReservasStock.reservar(self.clave_reservas, talla, cantidad):
+            return False
+        _, actual = self.lineas.get(talla.pk, (talla.producto_id, 0))
+        self.lineas[talla.pk] = (talla.producto_id, actual + cantidad)
+        self._guardar_sesion()
+        return True
+
+    def actualizar(self, talla, cantidad):
+        """
+        Fijar la cantidad de una línea, reservando o devolviendo la diferencia
+
+        Una cantidad de 0 o menos quita la línea.
+
+        Returns:
+            bool: False si no hay unidades para subir la cantidad (el carrito no cambia)
+        """
+        if cantidad <= 0:
+            self.quitar(talla.pk)
+            return True
+        _, actual = self.lineas.get(talla.pk, (talla.producto_id, 0))
+        if cantidad > actual:
+            if not ReservasStock.reservar(self.clave_reservas, talla, cantidad - actual):
+                return False
+        elif cantidad < actual:
+            ReservasStock.devolver(self.clave_reservas, talla.pk, actual - cantidad)
+        self.lineas[talla.pk] = (talla.producto_id, cantidad)
+        self._guardar_sesion()
+        return True
+
+    def quitar(self, talla_id):
+        """Quitar una línea y liberar sus unidades reservadas"""
+        if self.lineas.pop(talla_id, None) is not None:
+            ReservasStock.liberar(self.clave_reservas, talla_ids=[talla_id])
+            self._guardar_sesion()
+
+    def vaciar(self, liberar_reservas=True):
+        """Vaciar el carrito (las reservas ya convertidas en venta no se liberan)"""
+        if liberar_reservas and self.clave:
+            ReservasStock.liberar(self.clave_reservas)
+        self.lineas = {}
+        self.clave = None
+        self._guardar_sesion()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    def items(self):
+        """Líneas con su producto (ProductoCatalogo) y talla (con sus unidades libres), en dos consultas"""
+        if self._items is None:
+            tallas = Talla.objects.annotate(libres=Talla.stock_libre()).in_bulk(list(self.lineas))
+            productos = ProductoCatalogo.objects.in_bulk({producto_id for producto_id, _ in self.lineas.values()})
+            self._items = [
+                LineaCarrito(productos[producto_id], tallas[talla_id], cantidad)
+                for talla_id, (producto_id, cantidad) in self.lineas.items()
+                if talla_id in tallas and producto_id in productos
+            ]
+        return self._items
+
+    def linea(self, talla_id):
+        """Línea de una talla (None si no está en el carrito)"""
+        return next((item for item in self.items() if item.talla.pk == talla_id), None)
+
+    @property
+    def total(self):
+        return sum((item.calcular_subtotal() for item in self.items()), Decimal('0.00'))
+
+    def resumen(self):
+        """Totales del carrito para las respuestas JSON y el contador del menú"""
+        return {
+            'lineas': len(self.items()),
+            'unidades': sum(item.cantidad for item in self.items()),
+            'total': float(self.total),
+        }
+
+    # ------------------------------------------------------------------
+    # Persistencia
+    # ------------------------------------------------------------------
+
+    def guardar(self, usuario=None):
+        """
+        Guardar las líneas en el CarritoCompras activo del usuario
+
+        Reemplaza los items del carrito guardado por los de la sesión.
+
+        Returns:
+            CarritoCompras: El carrito activo del usuario
+        """
+        usuario = usuario or self.request.user
+        with transaction.atomic():
+            carrito, _ = CarritoCompras.objects.get_or_create(usuario=usuario, activo=True)
+            carrito.itemcarrito_set.all().delete()
+            # Solo las líneas cuyo producto y talla siguen existiendo
+            ItemCarrito.objects.bulk_create([
+                ItemCarrito(carrito=carrito, producto_id=item.producto.pk, talla=item.talla, cantidad=item.cantidad)
+                for item in self.items()
+            ])
+            carrito.total = self.total
+            carrito.save(update_fields=['total'])
+        return carrito
+
+    def confirmar(self, direccion):
+        """
+        Guardar el carrito y convertirlo en pedido, consumiendo sus reservas
+
+        Si el checkout falla (ErrorCheckout) no se guarda nada y la sesión
+        conserva el carrito. Con CHECKOUT_EN_COLA el pedido queda 'pendiente'
+        hasta que lo procese el worker (ver services/cola_pedidos.py).
+        """
+        if settings.CHECKOUT_EN_COLA:
+            # Solo se registra el pedido; el worker crea las líneas y descuenta el stock
+            lineas = [
+                (item.producto.pk, item.talla.pk, item.cantidad, item.producto.precio)
+                for item in self.items()
+            ]
+            pedido = ColaPedidos.encolar(self.request.user, lineas, direccion, self.clave_reservas)
+        else:
+            with transaction.atomic():
+                carrito = self.guardar()
+                pedido = ServicioCheckout.confirmar(carrito, direccion=direccion, clave_reservas=self.clave_reservas)
+        self.vaciar(liberar_reservas=False)
+        return pedido
+
+    @classmethod
+    def fusionar(cls, request, usuario):
+        """
+        Completar el carrito de la sesión con las líneas del carrito guardado del usuario
+
+        Se llama al iniciar sesión; solo lee el carrito guardado. Cada talla
+        queda con la mayor de las dos cantidades, así iniciar sesión otra vez
+        con la misma sesión no duplica las líneas. Las unidades que se agregan
+        se reservan como en agregar(), hasta las que haya disponibles.
+        """
+        carrito = cls(request)
+        faltan = {}
+        guardadas = ItemCarrito.objects.filter(
+            carrito__usuario=usuario, carrito__activo=True
+        ).values_list('talla_id', 'cantidad')
+        for talla_id, cantidad in guardadas:
+            _, actual = carrito.lineas.get(talla_id, (None, 0))
+            if cantidad > actual:
+                faltan[talla_id] = max(faltan.get(talla_id, 0), cantidad - actual)
+
+        agregadas = False
+        for talla_id, talla in Talla.objects.in_bulk(list(faltan)).items():
+            cantidad = min(faltan[talla_id], talla.disponible)
+            if cantidad > 0 and ReservasStock.reservar(carrito.clave_reservas, talla, cantidad):
+                _, actual = carrito.lineas.get(talla_id, (talla.producto_id, 0))
+                carrito.lineas[talla_id] = (talla.producto_id, actual + cantidad)
+                agregadas = True
+        if agregadas:
+            carrito._guardar_sesion()
+        return carrito
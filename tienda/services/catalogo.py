@@ -0,0 +1,151 @@
+"""
+Filtros del catálogo de productos
+
+Normaliza los parámetros GET del catálogo y los aplica sobre un queryset de
+Producto o del modelo de lectura ProductoCatalogo. La misma normalización se usa como firma para las claves de caché,
+de modo que dos URLs equivalentes (orden de parámetros, mayúsculas, valores
+vacíos) comparten la misma entrada.
+"""
+import hashlib
+from urllib.parse import urlencode
+from decimal import Decimal, InvalidOperation
+from django.db.models.functions import Lower
+from ..models import Talla
+from .busqueda import IndiceBusqueda, normalizar
+from .tallas import MascaraTallas
+
+
+class FiltrosCatalogo:
+    """
+    Conjunto normalizado de filtros del catálogo
+
+    Ejemplo de uso:
+        filtros = FiltrosCatalogo.desde_parametros(request.GET)
+        productos = filtros.aplicar(Producto.objects.all())
+    """
+
+    PARAMETROS = ('categoria', 'precio_min', 'precio_max', 'color', 'marca', 'talla', 'solo_stock', 'busqueda')
+
+    # Filtros que se muestran como facetas en la barra lateral
+    FACETAS = ('categoria', 'color', 'marca', 'talla')
+
+    TALLAS_VALIDAS = [opcion[0] for opcion in Talla.OPCIONES_TALLA]
+
+    def __init__(self, valores=None):
+        self.valores = valores or {}
+
+    @classmethod
+    def desde_parametros(cls, parametros):
+        """
+        Construir los filtros a partir de un QueryDict (request.GET) o dict
+
+        Los valores vacíos o inválidos se descartan en lugar de provocar errores.
+        """
+        valores = {}
+
+        categoria = (parametros.get('categoria') or '').strip()
+        if categoria.isdigit():
+            valores['categoria'] = int(categoria)
+
+        for clave in ('precio_min', 'precio_max'):
+            precio = (parametros.get(clave) or '').strip()
+            if precio:
+                try:
+                    valores[clave] = Decimal(precio)
+                except InvalidOperation:
+                    pass
+
+        for clave in ('color', 'marca'):
+            valor = (parametros.get(clave) or '').strip()
+            if valor:
+                valores[clave] = valor
+
+        # Una o varias tallas (?talla=M&talla=L o ?talla=M,L), en orden canónico
+        mascara = MascaraTallas.desde_parametros(parametros)
+        if mascara:
+            valores['talla'] = ','.join(MascaraTallas.tallas(mascara))
+
+        if parametros.get('solo_stock'):
+            valores['solo_stock'] = True
+
+        busqueda = ' '.join((parametros.get('busqueda') or '').split())
+        if busqueda:
+            valores['busqueda'] = busqueda
+
+        return cls(valores)
+
+    def get(self, clave, default=None):
+        return self.valores.get(clave, default)
+
+    def mascara_tallas(self):
+        """Máscara de las tallas filtradas (0 si no hay filtro de talla)"""
+        return MascaraTallas.desde_tallas(self.get('talla', '').split(','))
+
+    def sin(self, *claves):
+        """Copia de los filtros sin las claves indicadas"""
+        return FiltrosCatalogo({k: v for k, v in self.valores.items() if k not in claves})
+
+    def querystring(self):
+        """Parámetros normalizados para construir enlaces (sin página ni cursor)"""
+        parametros = []
+        for clave in self.PARAMETROS:
+            if clave in self.valores:
+                valor = self.valores[clave]
+                parametros.append((clave, 'on' if valor is True else str(valor)))
+        return urlencode(parametros)
+
+    def firma(self):
+        """
+        Firma estable de los filtros para usar en claves de caché
+
+        Los textos se comparan igual que en aplicar(): sin distinguir mayúsculas.
+        """
+        partes = []
+        for clave in self.PARAMETROS:
+            if clave not in self.valores:
+                continue
+            valor = self.valores[clave]
+            if clave == 'busqueda':
+                # La búsqueda ignora tildes, así que la firma también
+                valor = normalizar(valor)
+            elif isinstance(valor, str):
+                valor = valor.lower()
+            elif isinstance(valor, Decimal):
+                valor = valor.normalize()
+            partes.append(f'{clave}={valor}')
+        return hashlib.md5('&'.join(partes).encode('utf-8')).hexdigest()
+
+    def aplicar(self, queryset):
+        """Aplicar los filtros a un queryset de Producto o ProductoCatalogo"""
+        valores = self.valores
+
+        if 'categoria' in valores:
+            queryset = queryset.filter(categoria_id=valores['categoria'])
+
+        # Filtro por rango de precio
+        if 'precio_min' in valores:
+            queryset = queryset.filter(precio__gte=valores['precio_min'])
+        if 'precio_max' in valores:
+            queryset = queryset.filter(precio__lte=valores['precio_max'])
+
+        # Comparación con LOWER() para usar los índices funcionales de color y marca
+        if 'color' in valores:
+            queryset = queryset.alias(color_lower=Lower('color')).filter(color_lower=valores['color'].lower())
+        if 'marca' in valores:
+            queryset = queryset.alias(marca_lower=Lower('marca')).filter(marca_lower=valores['marca'].lower())
+
+        # Productos con alguna de las tallas disponible, por la máscara indexada
+        if 'talla' in valores:
+            queryset = queryset.filter(MascaraTallas.filtro(self.mascara_tallas()))
+
+        if valores.get('solo_stock'):
+            queryset = queryset.filter(en_stock=True)
+
+        # Búsqueda de texto sobre el índice de texto completo
+        if 'busqueda' in valores:
+            queryset = IndiceBusqueda.filtrar(queryset, valores['busqueda'])
+
+        return queryset
+
+    def __bool__(self):
+        return bool(self.valores)
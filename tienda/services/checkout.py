@@ -0,0 +1,225 @@
+"""
+Confirmación de pedidos a partir del carrito
+
+Todo el checkout ocurre en una única transacción y con un número fijo de
+consultas, sin importar cuántas líneas tenga el carrito:
+
+1. Se desactiva el carrito con un UPDATE condicional (evita pedidos dobles).
+2. Se bloquean con un solo SELECT ... FOR UPDATE las tallas que no están
+   cubiertas por reservas del carrito (ver services/reservas.py).
+3. Se crean las líneas del pedido con bulk_create.
+4. Se descuenta el stock y se liberan las reservas convertidas en venta con
+   UPDATE ... F() condicionales.
+5. Las salidas quedan en el libro MovimientoStock (ver services/inventario.py).
+
+Producto.total_vendidos cuenta solo pedidos entregados y se ajusta al
+cambiar de estado (ver services/estados_pedido.py), no aquí.
+
+Las tallas fraccionadas (ver services/fracciones.py) no se bloquean: las
+unidades no reservadas se descuentan de sus fracciones.
+
+Si alguna talla no tiene unidades suficientes se lanza StockInsuficiente y la
+transacción se revierte completa: no queda pedido, ni líneas, ni stock
+descontado.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Q
+from ..models import CarritoCompras, ItemPedido, Pedido, Producto, ProductoCatalogo, ReservaStock, Talla
+from .autocompletado import IndiceAutocompletado
+from .cache_catalogo import VersionCatalogo
+from .expresiones import valor_por_pk
+from .fracciones import StockFraccionado
+from .inventario import InventarioStock
+from .reservas import ReservasStock
+
+
+class ErrorCheckout(Exception):
+    """Error de negocio al confirmar un pedido (el mensaje se muestra al usuario)"""
+
+
+class CarritoVacio(ErrorCheckout):
+    def __init__(self):
+        super().__init__('Tu carrito está vacío.')
+
+
+class StockInsuficiente(ErrorCheckout):
+    """
+    Una o más tallas no tienen las unidades pedidas
+
+    Attributes:
+        faltantes: Lista de (talla, cantidad_pedida, stock_disponible)
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = ', '.join(
+            f'{talla.producto.nombre} talla {talla.talla} (quedan {disponible})'
+            for talla, _, disponible in faltantes
+        )
+        super().__init__(f'No hay stock suficiente para: {detalle}.')
+
+
+class ServicioCheckout:
+    """
+    Motor de checkout compartido por la vista y Pedido.procesar_pedido
+
+    Ejemplo de uso:
+        try:
+            pedido = ServicioCheckout.confirmar(carrito, direccion='Calle 10 # 5-20')
+        except ErrorCheckout as error:
+            messages.error(request, str(error))
+    """
+
+    @classmethod
+    def confirmar(cls, carrito, direccion=None, pedido=None, estado='procesando', clave_reservas=None):
+        """
+        Convertir el carrito en un pedido
+
+        Args:
+            carrito: CarritoCompras activo del usuario
+            direccion: Dirección de entrega del pedido nuevo
+            pedido: Pedido ya creado a completar (en lugar de crear uno)
+            estado: Estado en que queda el pedido
+            clave_reservas: Clave de las reservas a convertir en venta (por
+                defecto las del propio carrito; ver CarritoSesion)
+
+        Returns:
+            Pedido: El pedido con sus líneas creadas
+
+        Raises:
+            CarritoVacio: El carrito no tiene líneas o ya fue procesado
+            StockInsuficiente: Alguna talla no alcanza; no se guarda nada
+        """
+        with transaction.atomic():
+            # Un segundo envío del mismo carrito no encuentra el carrito activo
+            if not CarritoCompras.objects.filter(pk=carrito.pk, activo=True).update(activo=False):
+                raise CarritoVacio()
+
+            lineas = list(carrito.itemcarrito_set.values_list(
+                'producto_id', 'talla_id', 'cantidad', 'producto__precio'
+            ))
+            if not lineas:
+                raise CarritoVacio()
+
+            cantidades = {}
+            for _, talla_id, cantidad, _ in lineas:
+                cantidades[talla_id] = cantidades.get(talla_id, 0) + cantidad
+
+            clave_reservas = clave_reservas or carrito.clave_reservas
+            retenidas = ReservasStock.retenidas(clave_reservas)
+            sobrantes = [talla_id for talla_id in retenidas if talla_id not in cantidades]
+            if sobrantes:
+                # Reservas de líneas que ya no están en el carrito
+                ReservasStock.liberar(clave_reservas, talla_ids=sobrantes)
+                retenidas = {t: c for t, c in retenidas.items() if t in cantidades}
+            cls._descontar_stock(cantidades, retenidas)
+            if retenidas:
+                ReservaStock.objects.filter(clave_carrito=clave_reservas).delete()
+
+            total = sum((precio * cantidad for _, _, cantidad, precio in lineas), Decimal('0.00'))
+            if pedido is None:
+                pedido = Pedido.objects.create(
+                    usuario_id=carrito.usuario_id,
+                    total=total,
+                    estado=estado,
+                    direccion_entrega=direccion or '',
+                )
+            else:
+                pedido.estado = estado
+                pedido.save(update_fields=['estado'])
+
+            InventarioStock.registrar_ventas({pedido.pk: cantidades})
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    pedido=pedido,
+                    producto_id=producto_id,
+                    talla_id=talla_id,
+                    cantidad=cantidad,
+                    precio_unitario=precio,
+                )
+                for producto_id, talla_id, cantidad, precio in lineas
+            ])
+
+            cls.refrescar_productos(*{producto_id for producto_id, _, _, _ in lineas})
+        return pedido
+
+    @classmethod
+    def _descontar_stock(cls, cantidades, retenidas):
+        """
+        Descontar las unidades vendidas, o lanzar StockInsuficiente
+
+        Las unidades que el carrito tiene reservadas ya están apartadas, así que
+        las líneas cubiertas por completo no se vuelven a leer. El resto de
+        tallas se bloquea en orden de id (para que dos checkouts concurrentes no
+        se bloqueen mutuamente) y se comprueba su disponibilidad. El UPDATE además
+        exige disponibilidad en cada fila, así que tampoco se vende de más en
+        motores sin FOR UPDATE.
+        """
+        fraccionadas = StockFraccionado.fraccionadas(cantidades)
+        sin_reserva = [
+            talla_id for talla_id, cantidad in cantidades.items()
+            if retenidas.get(talla_id, 0) < cantidad and talla_id not in fraccionadas
+        ]
+        if sin_reserva:
+            tallas = Talla.objects.select_for_update(of=('self',)).filter(pk__in=sin_reserva).order_by('pk')
+            faltantes = cls._faltantes(tallas, cantidades, retenidas)
+            if faltantes:
+                raise StockInsuficiente(faltantes)
+
+        for talla_id, fracciones in fraccionadas.items():
+            # Las unidades reservadas ya salieron de las fracciones
+            faltan = cantidades[talla_id] - retenidas.get(talla_id, 0)
+            if faltan < 0:
+                StockFraccionado.sumar(talla_id, fracciones, -faltan)
+            elif faltan and not StockFraccionado.descontar(talla_id, fracciones, faltan):
+                tallas = Talla.objects.filter(pk=talla_id).select_related('producto')
+                raise StockInsuficiente(cls._faltantes(tallas, cantidades, retenidas))
+        cantidades = {t: c for t, c in cantidades.items() if t not in fraccionadas}
+        retenidas = {t: c for t, c in retenidas.items() if t not in fraccionadas}
+        if not cantidades:
+            return
+
+        # stock - (reservado - retenida) >= cantidad, y las reservas del carrito se liberan
+        suficiente = Q()
+        for talla_id, cantidad in cantidades.items():
+            suficiente |= Q(pk=talla_id, stock__gte=F('reservado') - retenidas.get(talla_id, 0) + cantidad)
+        actualizadas = Talla.objects.filter(suficiente).update(
+            stock=F('stock') - valor_por_pk(cantidades),
+            reservado=F('reservado') - valor_por_pk(retenidas),
+        )
+        if actualizadas != len(cantidades):
+            tallas = Talla.objects.filter(pk__in=cantidades).select_related('producto')
+            raise StockInsuficiente(cls._faltantes(tallas, cantidades, retenidas))
+
+    @staticmethod
+    def _faltantes(tallas, cantidades, retenidas):
+        """Lista de (talla, cantidad_pedida, disponible_para_el_carrito) que no alcanzan"""
+        faltantes = []
+        for talla in tallas:
+            libres = talla.disponible if talla.fracciones else talla.stock - talla.reservado
+            disponible = libres + retenidas.get(talla.pk, 0)
+            if disponible < cantidades[talla.pk]:
+                faltantes.append((talla, cantidades[talla.pk], max(disponible, 0)))
+        return faltantes
+
+    @staticmethod
+    def refrescar_productos(*producto_ids):
+        """
+        Actualizar los datos derivados de los productos tras un UPDATE masivo
+
+        QuerySet.update() no dispara las señales de Talla ni de Producto, así que
+        se recalculan aquí los totales de stock, el modelo de lectura y el índice
+        de autocompletado.
+
+        La versión de las cachés del catálogo (grillas, facetas, conteos) sube
+        si cambia el stock de algún producto, igual que al guardar una talla:
+        las grillas y el autocompletado muestran stock_total. Un lote que no
+        cambia ningún total (p. ej. una compactación) no las invalida.
+        """
+        cambia = Producto.cambia_stock(*producto_ids)
+        Producto.recalcular_stock_de(*producto_ids)
+        ProductoCatalogo.sincronizar(*producto_ids)
+        IndiceAutocompletado.actualizar(*producto_ids)
+        if cambia:
+            VersionCatalogo.incrementar()
@@ -0,0 +1,267 @@
+"""
+Checkout en cola procesado por un worker local
+
+Con CHECKOUT_EN_COLA activo, el checkout solo valida las líneas contra la
+disponibilidad, crea el Pedido en estado 'pendiente' y una fila de
+TrabajoPedido, y responde. El comando `manage.py procesar_pedidos` toma los
+trabajos pendientes por lotes y, en una transacción por lote:
+
+1. Bloquea los trabajos (SKIP LOCKED, así pueden correr varios workers), sus
+   pedidos, sus reservas y las tallas involucradas, cada grupo con un solo
+   SELECT.
+2. Descarta los trabajos cuyo pedido ya salió de 'pendiente' (p. ej. lo
+   canceló un administrador mientras esperaba) y decide en memoria, en orden
+   de llegada, qué pedidos alcanzan stock. Las reservas de cada pedido se
+   liberan tanto si se vende como si falla o se descarta.
+3. Aplica todo con operaciones en bloque: un bulk_create de ItemPedido y otro
+   de MovimientoStock, un UPDATE de Talla, uno por estado de Pedido y un
+   bulk_create del historial de estados.
+
+En las tallas fraccionadas (ver services/fracciones.py) se bloquean sus
+fracciones en lugar de la fila y, al final del lote, se reparten las
+unidades libres que quedan.
+
+No necesita un broker: la cola es la propia tabla de trabajos.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from ..models import CarritoCompras, ItemPedido, Pedido, ReservaStock, Talla, TrabajoPedido
+from .checkout import CarritoVacio, ServicioCheckout, StockInsuficiente
+from .expresiones import valor_por_pk
+from .fracciones import StockFraccionado
+from .eventos_pedido import EventosPedido
+from .historial_pedidos import HistorialPedidos
+from .inventario import InventarioStock
+from .reservas import ReservasStock
+
+
+class ColaPedidos:
+    """
+    Registro y procesamiento por lotes de pedidos en cola
+
+    Ejemplo de uso:
+        pedido = ColaPedidos.encolar(usuario, lineas, 'Calle 10 # 5-20', carrito.clave_reservas)
+        ColaPedidos.procesar_lote()  # desde el comando procesar_pedidos
+    """
+
+    TAMANO_LOTE = 100
+
+    @staticmethod
+    def _cantidades(lineas):
+        cantidades = {}
+        for _, talla_id, cantidad, _ in lineas:
+            cantidades[talla_id] = cantidades.get(talla_id, 0) + cantidad
+        return cantidades
+
+    @classmethod
+    def encolar(cls, usuario, lineas, direccion, clave_reservas=''):
+        """
+        Validar las líneas y registrar el pedido para el worker
+
+        La validación lee la disponibilidad sin bloquear; el worker la vuelve
+        a comprobar con las tallas bloqueadas. Las reservas del carrito se
+        renuevan para que sigan apartando las unidades mientras el pedido
+        espera en la cola.
+
+        Args:
+            lineas: Lista de (producto_id, talla_id, cantidad, precio_unitario)
+
+        Returns:
+            Pedido: El pedido en estado 'pendiente'
+
+        Raises:
+            CarritoVacio: No hay líneas
+            StockInsuficiente: Alguna talla ya no alcanza
+        """
+        if not lineas:
+            raise CarritoVacio()
+        cantidades = cls._cantidades(lineas)
+        retenidas = dict(ReservaStock.objects.filter(
+            clave_carrito=clave_reservas
+        ).values_list('talla_id', 'cantidad')) if clave_reservas else {}
+        faltantes = ServicioCheckout._faltantes(
+            Talla.objects.filter(pk__in=cantidades).select_related('producto'), cantidades, retenidas
+        )
+        if faltantes:
+            raise StockInsuficiente(faltantes)
+
+        with transaction.atomic():
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                total=sum((Decimal(precio) * cantidad for _, _, cantidad, precio in lineas), Decimal('0.00')),
+                estado='pendiente',
+                direccion_entrega=direccion or '',
+            )
+            TrabajoPedido.objects.create(
+                pedido=pedido,
+                lineas=[[producto_id, talla_id, cantidad, str(precio)] for producto_id, talla_id, cantidad, precio in lineas],
+                clave_reservas=clave_reservas,
+            )
+            if retenidas:
+                ReservaStock.objects.filter(clave_carrito=clave_reservas).update(
+                    expira_en=timezone.now() + ReservasStock.duracion()
+                )
+            CarritoCompras.objects.filter(usuario=usuario, activo=True).update(activo=False)
+        return pedido
+
+    @classmethod
+    def procesar_lote(cls, tamano=None):
+        """
+        Materializar un lote de pedidos pendientes
+
+        Returns:
+            tuple: (pedidos completados, pedidos fallidos o descartados); (0, 0)
+            si la cola está vacía
+        """
+        with transaction.atomic():
+            trabajos = list(
+                TrabajoPedido.objects.select_for_update(skip_locked=True)
+                .filter(estado='pendiente').order_by('fecha_creacion', 'pk')[:tamano or cls.TAMANO_LOTE]
+            )
+            if not trabajos:
+                return 0, 0
+            # Bloquear los pedidos: un cambio de estado concurrente espera al lote o se ve aquí
+            estados = dict(
+                Pedido.objects.select_for_update().filter(pk__in=[trabajo.pedido_id for trabajo in trabajos])
+                .order_by('pk').values_list('pk', 'estado')
+            )
+
+            claves = {trabajo.clave_reservas for trabajo in trabajos if trabajo.clave_reservas}
+            reservas = {}
+            for clave, talla_id, cantidad in ReservaStock.objects.select_for_update().filter(
+                clave_carrito__in=claves
+            ).values_list('clave_carrito', 'talla_id', 'cantidad'):
+                reservas.setdefault(clave, {})[talla_id] = cantidad
+
+            talla_ids = {linea[1] for trabajo in trabajos for linea in trabajo.lineas}
+            talla_ids.update(talla_id for retenidas in reservas.values() for talla_id in retenidas)
+            tallas = {
+                talla.pk: talla for talla in Talla.objects.select_for_update(of=('self',))
+                .filter(pk__in=talla_ids).select_related('producto').order_by('pk')
+            }
+            stock = {pk: talla.stock for pk, talla in tallas.items()}
+            reservado = {pk: talla.reservado for pk, talla in tallas.items()}
+            fraccionadas = {pk: talla.fracciones for pk, talla in tallas.items() if talla.fracciones}
+            if fraccionadas:
+                # Unidades libres de las fracciones más las que retienen los pedidos del lote
+                libres = StockFraccionado.libres(fraccionadas, bloquear=True)
+                for talla_id in fraccionadas:
+                    retenidas = sum(reservas_talla.get(talla_id, 0) for reservas_talla in reservas.values())
+                    stock[talla_id] = libres.get(talla_id, 0) + retenidas
+                    reservado[talla_id] = retenidas
+
+            vendidas, liberadas, vendidos = {}, {}, set()
+            completados, fallidos, descartados = [], [], []
+            for trabajo in trabajos:
+                # Las reservas del pedido dejan de apartar unidades, se venda o no
+                for talla_id, cantidad in reservas.get(trabajo.clave_reservas, {}).items():
+                    reservado[talla_id] -= cantidad
+                    liberadas[talla_id] = liberadas.get(talla_id, 0) + cantidad
+
+                estado = estados.get(trabajo.pedido_id)
+                if estado != 'pendiente':
+                    # El pedido ya no espera al worker: no se vende ni se cambia su estado
+                    trabajo.error = f'El pedido ya no está pendiente (estado: {estado}).'
+                    descartados.append(trabajo)
+                    continue
+                cantidades = cls._cantidades(trabajo.lineas)
+                if any(talla_id not in tallas for talla_id in cantidades):
+                    trabajo.error = 'Una de las tallas del pedido ya no existe.'
+                    fallidos.append(trabajo)
+                    continue
+                faltantes = [
+                    (tallas[talla_id], cantidad, max(stock[talla_id] - reservado[talla_id], 0))
+                    for talla_id, cantidad in cantidades.items()
+                    if stock[talla_id] - reservado[talla_id] < cantidad
+                ]
+                if faltantes:
+                    trabajo.error = str(StockInsuficiente(faltantes))
+                    fallidos.append(trabajo)
+                    continue
+
+                for talla_id, cantidad in cantidades.items():
+                    stock[talla_id] -= cantidad
+                    vendidas[talla_id] = vendidas.get(talla_id, 0) + cantidad
+                vendidos.update(producto_id for producto_id, _, _, _ in trabajo.lineas)
+                completados.append(trabajo)
+
+            for talla_id, fracciones in fraccionadas.items():
+                StockFraccionado.repartir(talla_id, fracciones, stock[talla_id] - reservado[talla_id])
+            vendidas = {t: c for t, c in vendidas.items() if t not in fraccionadas}
+            liberadas = {t: c for t, c in liberadas.items() if t not in fraccionadas}
+            if vendidas or liberadas:
+                Talla.objects.filter(pk__in=set(vendidas) | set(liberadas)).update(
+                    stock=F('stock') - valor_por_pk(vendidas),
+                    reservado=F('reservado') - valor_por_pk(liberadas),
+                )
+            if claves:
+                ReservaStock.objects.filter(clave_carrito__in=claves).delete()
+
+            InventarioStock.registrar_ventas({
+                trabajo.pedido_id: cls._cantidades(trabajo.lineas) for trabajo in completados
+            })
+            ItemPedido.objects.bulk_create([
+                ItemPedido(
+                    pedido_id=trabajo.pedido_id,
+                    producto_id=producto_id,
+                    talla_id=talla_id,
+                    cantidad=cantidad,
+                    precio_unitario=Decimal(precio),
+                )
+                for trabajo in completados
+                for producto_id, talla_id, cantidad, precio in trabajo.lineas
+            ])
+
+            Pedido.objects.filter(
+                pk__in=[trabajo.pedido_id for trabajo in completados], estado='pendiente'
+            ).update(estado='procesando')
+            Pedido.objects.filter(
+                pk__in=[trabajo.pedido_id for trabajo in fallidos], estado='pendiente'
+            ).update(estado='cancelado')
+            EventosPedido.registrar(
+                [(trabajo.pedido_id, 'pendiente', 'procesando') for trabajo in completados]
+                + [(trabajo.pedido_id, 'pendiente', 'cancelado') for trabajo in fallidos]
+            )
+            if fallidos:
+                HistorialPedidos.invalidar_pedidos([trabajo.pedido_id for trabajo in fallidos])
+            ahora = timezone.now()
+            for trabajo in trabajos:
+                trabajo.estado = 'fallido' if trabajo.error else 'completado'
+                trabajo.fecha_proceso = ahora
+            TrabajoPedido.objects.bulk_update(trabajos, ['estado', 'error', 'fecha_proceso'])
+
+            if vendidos:
+                ServicioCheckout.refrescar_productos(*vendidos)
+        return len(completados), len(fallidos) + len(descartados)
+
+    @staticmethod
+    def estadisticas(muestra=100):
+        """
+        Métricas de la cola
+
+        Returns:
+            dict: profundidad (pendientes), espera del más antiguo, latencia
+            (creación -> proceso) media y p95 de los últimos `muestra`
+            procesados, y total de fallidos
+        """
+        ahora = timezone.now()
+        pendientes = TrabajoPedido.objects.filter(estado='pendiente').aggregate(
+            profundidad=Count('pk'), mas_antiguo=Min('fecha_creacion')
+        )
+        latencias = sorted(
+            (procesado - creado).total_seconds()
+            for creado, procesado in TrabajoPedido.objects.exclude(fecha_proceso=None)
+            .order_by('-fecha_proceso').values_list('fecha_creacion', 'fecha_proceso')[:muestra]
+        )
+        return {
+            'profundidad': pendientes['profundidad'],
+            'espera_maxima_s': round((ahora - pendientes['mas_antiguo']).total_seconds(), 3)
+            if pendientes['mas_antiguo'] else 0.0,
+            'latencia_media_s': round(sum(latencias) / len(latencias), 3) if latencias else 0.0,
+            'latencia_p95_s': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 3)
+            if latencias else 0.0,
+            'muestra': len(latencias),
+            'fallidos': TrabajoPedido.objects.filter(estado='fallido').count(),
+        }
@@ -0,0 +1,103 @@
+"""
+Cambios de estado de pedidos, de a uno o en bloque
+
+Todas las transiciones pasan por `TransicionesPedido.aplicar` (también las
+hechas con Pedido.save() y las acciones del admin), que en una transacción:
+
+1. Bloquea los pedidos con un solo SELECT ... FOR UPDATE y valida cada
+   transición contra Pedido.TRANSICIONES.
+2. Cambia el estado de los pedidos válidos con un UPDATE.
+3. Registra como entradas pendientes el stock de los pedidos cancelados
+   (ver services/inventario.py).
+4. Registra los cambios en el historial de estados, que a su vez ajusta
+   Producto.total_vendidos con un UPDATE agrupado (ver
+   services/eventos_pedido.py).
+
+Así el personal de bodega puede cerrar cientos de pedidos en una solicitud
+con un número fijo de consultas.
+"""
+from django.db import transaction
+from ..models import Pedido, PedidoArchivado
+from .eventos_pedido import EventosPedido
+from .historial_pedidos import HistorialPedidos
+from .inventario import InventarioStock
+
+
+class TransicionInvalida(Exception):
+    """El pedido no puede pasar al estado pedido (el mensaje se muestra al usuario)"""
+
+
+class TransicionesPedido:
+    """
+    Validación y aplicación de cambios de estado
+
+    Ejemplo de uso:
+        resultado = TransicionesPedido.aplicar([12, 13, 14], 'entregado')
+        resultado['actualizados']  # [12, 14]
+        resultado['rechazados']    # {13: 'No se puede pasar de Cancelado a Entregado.'}
+    """
+
+    MAXIMO_PEDIDOS = 1000
+
+    @staticmethod
+    def motivo_rechazo(estado_actual, nuevo_estado):
+        """Mensaje si la transición no está permitida (None si lo está)"""
+        if nuevo_estado in Pedido.TRANSICIONES.get(estado_actual, ()):
+            return None
+        nombres = dict(Pedido.ESTADOS_PEDIDO)
+        return f'No se puede pasar de {nombres[estado_actual]} a {nombres[nuevo_estado]}.'
+
+    @classmethod
+    def aplicar(cls, pedido_ids, nuevo_estado):
+        """
+        Cambiar el estado de los pedidos indicados
+
+        Los pedidos que no existen, están archivados o cuya transición no
+        está permitida se informan en `rechazados` y no se tocan; los que ya están en
+        `nuevo_estado` se ignoran.
+
+        Returns:
+            dict: actualizados (ids), sin_cambios (ids) y rechazados ({id: motivo})
+
+        Raises:
+            TransicionInvalida: El estado no existe o hay demasiados pedidos
+        """
+        if nuevo_estado not in dict(Pedido.ESTADOS_PEDIDO):
+            raise TransicionInvalida('Estado inválido.')
+        pedido_ids = sorted(set(pedido_ids))
+        if len(pedido_ids) > cls.MAXIMO_PEDIDOS:
+            raise TransicionInvalida(f'Se pueden cambiar hasta {cls.MAXIMO_PEDIDOS} pedidos por solicitud.')
+
+        with transaction.atomic():
+            pedidos = {
+                pk: (estado, usuario_id) for pk, estado, usuario_id in Pedido.objects.select_for_update()
+                .filter(pk__in=pedido_ids).order_by('pk').values_list('pk', 'estado', 'usuario_id')
+            }
+            faltantes = [pk for pk in pedido_ids if pk not in pedidos]
+            archivados = set(
+                PedidoArchivado.objects.filter(pk__in=faltantes).values_list('pk', flat=True)
+            ) if faltantes else set()
+            actualizados, sin_cambios, rechazados = [], [], {}
+            for pk in pedido_ids:
+                if pk not in pedidos:
+                    rechazados[pk] = 'El pedido está archivado.' if pk in archivados else 'El pedido no existe.'
+                    continue
+                estado = pedidos[pk][0]
+                if estado == nuevo_estado:
+                    sin_cambios.append(pk)
+                    continue
+                motivo = cls.motivo_rechazo(estado, nuevo_estado)
+                if motivo:
+                    rechazados[pk] = motivo
+                    continue
+                actualizados.append(pk)
+
+            if actualizados:
+                Pedido.objects.filter(pk__in=actualizados).update(estado=nuevo_estado)
+                if nuevo_estado == 'cancelado':
+                    # Entradas pendientes: se suman a Talla.stock al compactar
+                    InventarioStock.devolver_pedidos(actualizados)
+                EventosPedido.registrar([(pk, pedidos[pk][0], nuevo_estado) for pk in actualizados])
+                HistorialPedidos.invalidar(*(pedidos[pk][1] for pk in actualizados))
+
+        return {'actualizados': actualizados, 'sin_cambios': sin_cambios, 'rechazados': rechazados}
@@ -0,0 +1,83 @@
+"""
+Historial de estados de pedidos y contador de ventas
+
+Cada creación o cambio de estado de un Pedido pasa por `EventosPedido.registrar`,
+en la misma transacción que el cambio:
+
+- Pedido.save() lo llama desde la señal post_save (compara con el estado
+  leído de la base de datos).
+- Los UPDATE en bloque (TransicionesPedido, el worker de la cola) lo llaman
+  directamente con los cambios que aplicaron.
+
+`registrar` agrega las filas de CambioEstadoPedido y pasa los mismos eventos
+a `actualizar_ventas`, el único lugar que modifica Producto.total_vendidos:
+suma las unidades de los pedidos que entran a 'entregado' y resta las de los
+que salen, con un SELECT agrupado y un UPDATE. Así el contador siempre
+coincide con las líneas de pedidos entregados sin recalcularlo completo.
+"""
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.utils import timezone
+from ..models import CambioEstadoPedido, ItemPedido, Producto, ProductoCatalogo
+from .cache_catalogo import VersionCatalogo
+from .expresiones import valor_por_pk
+
+
+class EventosPedido:
+    """
+    Registro de cambios de estado y su efecto en las ventas
+
+    Ejemplo de uso:
+        Pedido.objects.filter(pk__in=ids).update(estado='entregado')
+        EventosPedido.registrar([(pk, 'enviado', 'entregado') for pk in ids])
+    """
+
+    @classmethod
+    def registrar(cls, cambios, fecha=None):
+        """
+        Guardar los cambios de estado y actualizar las ventas
+
+        Args:
+            cambios: Lista de (pedido_id, estado_anterior, estado_nuevo);
+                estado_anterior es '' al crear el pedido
+        """
+        if not cambios:
+            return
+        fecha = fecha or timezone.now()
+        CambioEstadoPedido.objects.bulk_create([
+            CambioEstadoPedido(pedido_id=pedido_id, estado_anterior=anterior, estado_nuevo=nuevo, fecha=fecha)
+            for pedido_id, anterior, nuevo in cambios
+        ])
+        cls.actualizar_ventas(cambios)
+
+    @staticmethod
+    def actualizar_ventas(cambios):
+        """
+        Ajustar Producto.total_vendidos con los pedidos que entran o salen de 'entregado'
+
+        Un pedido creado directamente como 'entregado' cuenta las líneas que
+        ya tenga en ese momento.
+
+        Returns:
+            list: Ids de los productos ajustados
+        """
+        entran = [pk for pk, anterior, nuevo in cambios if nuevo == 'entregado' and anterior != 'entregado']
+        salen = [pk for pk, anterior, nuevo in cambios if anterior == 'entregado' and nuevo != 'entregado']
+        if not entran and not salen:
+            return []
+        deltas = dict(
+            ItemPedido.objects.filter(pedido_id__in=entran + salen).order_by().values('producto_id').annotate(
+                delta=Sum(Case(
+                    When(pedido_id__in=entran, then=F('cantidad')),
+                    default=-F('cantidad'),
+                    output_field=IntegerField(),
+                ))
+            ).exclude(delta=0).values_list('producto_id', 'delta')
+        )
+        if not deltas:
+            return []
+        Producto.objects.filter(pk__in=deltas).update(
+            total_vendidos=F('total_vendidos') + valor_por_pk(deltas)
+        )
+        ProductoCatalogo.sincronizar(*deltas)
+        VersionCatalogo.incrementar()
+        return list(deltas)
@@ -0,0 +1,25 @@
+"""
+Expresiones compartidas por los UPDATE masivos
+
+Los servicios que ajustan varias filas con un solo UPDATE (checkout, cola de
+pedidos, reservas, compactación del libro de stock) calculan en Python la
+cantidad de cada fila y la pasan a la base de datos como un CASE por pk.
+"""
+from django.db.models import Case, IntegerField, Value, When
+
+
+def valor_por_pk(valores):
+    """
+    Expresión CASE con el valor correspondiente a cada pk (0 para el resto)
+
+    Ejemplo de uso:
+        Talla.objects.filter(pk__in=vendidas).update(stock=F('stock') - valor_por_pk(vendidas))
+
+    Args:
+        valores: {pk: entero}
+    """
+    return Case(
+        *[When(pk=pk, then=Value(valor)) for pk, valor in valores.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
@@ -0,0 +1,141 @@
+"""
+Motor de facetas del catálogo
+
+Calcula en una sola consulta agregada los conteos de color, marca, talla,
+categoría y rango de precio para el conjunto de filtros actual.
+
+La consulta se hace sobre el modelo de lectura ProductoCatalogo (una sola
+tabla) y agrupa los productos por (color, marca, categoría, rango de precio,
+máscara de tallas). Con esas filas el resto se resuelve en Python: cada faceta se cuenta aplicando los demás
+filtros de faceta pero no el suyo, así el usuario ve cuántos resultados
+obtendría al cambiar de opción sin lanzar una consulta por faceta.
+"""
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from ..models import ProductoCatalogo
+from .cache_catalogo import VersionCatalogo
+from .catalogo import FiltrosCatalogo
+from .tallas import MascaraTallas
+
+
+class FacetasCatalogo:
+    """
+    Facetas con conteos para la barra lateral del catálogo
+
+    Ejemplo de uso:
+        filtros = FiltrosCatalogo.desde_parametros(request.GET)
+        facetas = FacetasCatalogo.obtener(filtros)
+        facetas['colores']  # [{'valor': 'Azul', 'total': 4}, ...]
+    """
+
+    # Rangos de precio en COP: (mínimo incluido, máximo excluido)
+    RANGOS_PRECIO = [
+        (0, 50000),
+        (50000, 100000),
+        (100000, 200000),
+        (200000, None),
+    ]
+
+    CACHE_PREFIX = 'facetas'
+    CACHE_TIMEOUT = 300  # 5 minutos
+
+    @classmethod
+    def obtener(cls, filtros):
+        """Obtener las facetas desde caché o calcularlas"""
+        cache_key = VersionCatalogo.clave(cls.CACHE_PREFIX, filtros.firma())
+        facetas = cache.get(cache_key)
+        if facetas is None:
+            facetas = cls.calcular(filtros)
+            cache.set(cache_key, facetas, cls.CACHE_TIMEOUT)
+        return facetas
+
+    @classmethod
+    def _anotacion_rango_precio(cls):
+        """Índice del rango de precio de cada producto"""
+        casos = [
+            When(precio__lt=maximo, then=Value(indice))
+            for indice, (minimo, maximo) in enumerate(cls.RANGOS_PRECIO)
+            if maximo is not None
+        ]
+        return Case(*casos, default=Value(len(cls.RANGOS_PRECIO) - 1), output_field=IntegerField())
+
+    @classmethod
+    def calcular(cls, filtros):
+        """Calcular todas las facetas con una única consulta agregada"""
+        tallas = FiltrosCatalogo.TALLAS_VALIDAS
+
+        # Los filtros de faceta se resuelven en Python; el resto va a la consulta
+        base = filtros.sin(*FiltrosCatalogo.FACETAS).aplicar(ProductoCatalogo.objects.all())
+        filas = base.annotate(
+            rango_precio=cls._anotacion_rango_precio()
+        ).values(
+            'color', 'marca', 'categoria_id', 'categoria_nombre', 'rango_precio', 'tallas_mascara'
+        ).annotate(
+            total=Count('pk')
+        ).order_by()
+
+        color = (filtros.get('color') or '').lower()
+        marca = (filtros.get('marca') or '').lower()
+        categoria = filtros.get('categoria')
+        mascara_filtro = filtros.mascara_tallas()
+
+        colores, marcas, categorias = {}, {}, {}
+        conteo_tallas = dict.fromkeys(tallas, 0)
+        conteo_precios = [0] * len(cls.RANGOS_PRECIO)
+        total = 0
+
+        for fila in filas:
+            coincide_color = not color or fila['color'].lower() == color
+            coincide_marca = not marca or fila['marca'].lower() == marca
+            coincide_categoria = not categoria or fila['categoria_id'] == categoria
+            # Si hay tallas seleccionadas solo cuentan los productos con alguna de ellas
+            coincide_talla = not mascara_filtro or fila['tallas_mascara'] & mascara_filtro
+            cantidad = fila['total'] if coincide_talla else 0
+
+            if coincide_marca and coincide_categoria:
+                colores[fila['color']] = colores.get(fila['color'], 0) + cantidad
+            if coincide_color and coincide_categoria:
+                marcas[fila['marca']] = marcas.get(fila['marca'], 0) + cantidad
+            if coincide_color and coincide_marca:
+                nombre = fila['categoria_nombre']
+                actual = categorias.get(fila['categoria_id'], (nombre, 0))
+                categorias[fila['categoria_id']] = (nombre, actual[1] + cantidad)
+                if coincide_categoria:
+                    for opcion in MascaraTallas.tallas(fila['tallas_mascara']):
+                        conteo_tallas[opcion] += fila['total']
+                    conteo_precios[fila['rango_precio']] += cantidad
+                    total += cantidad
+
+        return {
+            'colores': cls._ordenar(colores),
+            'marcas': cls._ordenar(marcas),
+            'categorias': [
+                {'id': categoria_id, 'nombre': nombre, 'total': cantidad}
+                for categoria_id, (nombre, cantidad) in sorted(categorias.items(), key=lambda c: c[1][0].lower())
+                if cantidad > 0
+            ],
+            'tallas': [
+                {'valor': opcion, 'total': conteo_tallas[opcion]}
+                for opcion in tallas if conteo_tallas[opcion] > 0
+            ],
+            'precios': [
+                {'min': minimo, 'max': maximo, 'total': conteo_precios[indice]}
+                for indice, (minimo, maximo) in enumerate(cls.RANGOS_PRECIO)
+                if conteo_precios[indice] > 0
+            ],
+            'total': total,
+        }
+
+    @staticmethod
+    def _ordenar(conteos):
+        """Lista de {'valor', 'total'} ordenada alfabéticamente, sin opciones vacías"""
+        return [
+            {'valor': valor, 'total': cantidad}
+            for valor, cantidad in sorted(conteos.items(), key=lambda c: c[0].lower())
+            if cantidad > 0
+        ]
+
+    @classmethod
+    def invalidar(cls):
+        """Invalidar las facetas en caché (junto con el resto del catálogo)"""
+        VersionCatalogo.incrementar()
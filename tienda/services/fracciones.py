@@ -0,0 +1,159 @@
+"""
+Contadores de stock fraccionados para las tallas con mucha demanda
+
+En una promoción, unas pocas tallas reciben casi todas las ventas y cada
+checkout espera el bloqueo de la misma fila de Talla. Una talla fraccionada
+reparte sus unidades libres en Talla.fracciones filas de FraccionStock:
+
+- Vender o reservar descuenta de una fracción elegida al azar con un UPDATE
+  condicional (`stock >= cantidad`); si no alcanza se prueba con las demás
+  y, como último recurso, se juntan unidades de varias fracciones.
+- Las unidades que vuelven (reservas liberadas, reposiciones) se suman a
+  una fracción al azar.
+- Mientras está fraccionada, Talla.stock y Talla.reservado quedan en 0 y
+  no se escriben: las unidades libres están en las fracciones y las
+  retenidas en sus ReservaStock. Las lecturas suman todo con
+  Talla.stock_fisico().
+
+Una talla entra y sale de este modo en línea con `activar` y `desactivar`.
+Las entradas se registran con InventarioStock.reponer. Guardar la talla con
+otro stock (p. ej. desde el admin) fija sus unidades libres con `fijar`.
+"""
+import random
+from django.db import transaction
+from django.db.models import F, Sum
+from ..models import FraccionStock, MovimientoStock, ReservaStock, Talla
+
+
+class StockFraccionado:
+    """
+    Operaciones sobre tallas fraccionadas
+
+    Ejemplo de uso:
+        StockFraccionado.activar(talla.pk, fracciones=8)
+        if not StockFraccionado.descontar(talla.pk, talla.fracciones, 1):
+            ...  # sin unidades libres
+        StockFraccionado.desactivar(talla.pk)
+    """
+
+    FRACCIONES = 8
+
+    @staticmethod
+    def _repartir(total, fracciones):
+        """Partes casi iguales que suman `total`"""
+        base, resto = divmod(max(total, 0), fracciones)
+        return [base + (1 if indice < resto else 0) for indice in range(fracciones)]
+
+    @classmethod
+    def activar(cls, talla_id, fracciones=None):
+        """
+        Fraccionar el stock libre de una talla
+
+        Las unidades reservadas siguen en sus ReservaStock; al fraccionar,
+        Talla.stock y Talla.reservado pasan a 0.
+        """
+        fracciones = fracciones or cls.FRACCIONES
+        with transaction.atomic():
+            talla = Talla.objects.select_for_update().get(pk=talla_id)
+            if talla.fracciones:
+                return False
+            FraccionStock.objects.bulk_create([
+                FraccionStock(talla_id=talla_id, indice=indice, stock=parte)
+                for indice, parte in enumerate(cls._repartir(talla.stock - talla.reservado, fracciones))
+            ])
+            Talla.objects.filter(pk=talla_id).update(stock=0, reservado=0, fracciones=fracciones)
+        return True
+
+    @staticmethod
+    def desactivar(talla_id):
+        """Volver a guardar todo el stock de la talla en su fila"""
+        with transaction.atomic():
+            talla = Talla.objects.select_for_update().get(pk=talla_id)
+            if not talla.fracciones:
+                return False
+            partes = FraccionStock.objects.select_for_update().filter(talla_id=talla_id)
+            libres = sum(partes.values_list('stock', flat=True))
+            retenidas = ReservaStock.objects.filter(talla_id=talla_id).aggregate(total=Sum('cantidad'))['total'] or 0
+            partes.delete()
+            Talla.objects.filter(pk=talla_id).update(stock=libres + retenidas, reservado=retenidas, fracciones=0)
+        return True
+
+    @classmethod
+    def fijar(cls, talla_id, libres):
+        """
+        Dejar `libres` unidades libres en las fracciones y registrar la diferencia como ajuste
+
+        Returns:
+            int: Unidades agregadas (negativo si se quitaron)
+        """
+        with transaction.atomic():
+            fracciones = Talla.objects.select_for_update().values_list('fracciones', flat=True).get(pk=talla_id)
+            diferencia = max(libres, 0) - cls.libres([talla_id], bloquear=True).get(talla_id, 0)
+            if diferencia:
+                cls.repartir(talla_id, fracciones, libres)
+                MovimientoStock.objects.create(talla_id=talla_id, tipo='ajuste', cantidad=diferencia)
+        return diferencia
+
+    @staticmethod
+    def descontar(talla_id, fracciones, cantidad):
+        """
+        Descontar unidades libres de las fracciones
+
+        Returns:
+            bool: False si entre todas las fracciones no alcanza (no se descuenta nada)
+        """
+        indices = list(range(fracciones))
+        random.shuffle(indices)
+        for indice in indices:
+            if FraccionStock.objects.filter(
+                talla_id=talla_id, indice=indice, stock__gte=cantidad
+            ).update(stock=F('stock') - cantidad):
+                return True
+
+        # Ninguna fracción alcanza sola: juntar unidades de varias
+        with transaction.atomic():
+            partes = list(
+                FraccionStock.objects.select_for_update().filter(talla_id=talla_id, stock__gt=0)
+                .order_by('indice').values_list('pk', 'stock')
+            )
+            if sum(stock for _, stock in partes) < cantidad:
+                return False
+            pendiente = cantidad
+            for pk, stock in partes:
+                tomar = min(stock, pendiente)
+                FraccionStock.objects.filter(pk=pk).update(stock=F('stock') - tomar)
+                pendiente -= tomar
+                if not pendiente:
+                    break
+        return True
+
+    @staticmethod
+    def sumar(talla_id, fracciones, cantidad):
+        """Devolver unidades libres a una fracción al azar"""
+        FraccionStock.objects.filter(
+            talla_id=talla_id, indice=random.randrange(fracciones)
+        ).update(stock=F('stock') + cantidad)
+
+    @classmethod
+    def repartir(cls, talla_id, fracciones, total):
+        """Reescribir las fracciones para que sumen `total` (con las fracciones ya bloqueadas)"""
+        for indice, parte in enumerate(cls._repartir(total, fracciones)):
+            FraccionStock.objects.filter(talla_id=talla_id, indice=indice).update(stock=parte)
+
+    @staticmethod
+    def fraccionadas(talla_ids):
+        """Tallas fraccionadas entre las indicadas: {talla_id: fracciones}"""
+        return dict(
+            Talla.objects.filter(pk__in=talla_ids, fracciones__gt=0).values_list('pk', 'fracciones')
+        )
+
+    @staticmethod
+    def libres(talla_ids, bloquear=False):
+        """Unidades libres de cada talla fraccionada: {talla_id: suma de sus fracciones}"""
+        partes = FraccionStock.objects.filter(talla_id__in=talla_ids)
+        if bloquear:
+            partes = partes.select_for_update()
+        libres = {}
+        for talla_id, stock in partes.values_list('talla_id', 'stock'):
+            libres[talla_id] = libres.get(talla_id, 0) + stock
+        return libres
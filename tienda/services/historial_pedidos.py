@@ -0,0 +1,99 @@
+"""
+Historial de pedidos del usuario
+
+La página de Mis Pedidos se arma con un número fijo de consultas sin
+importar cuántos pedidos tenga el cliente:
+
+- Los pedidos se paginan y sus líneas se traen con un solo prefetch que ya
+  incluye producto y talla.
+- El resumen (cantidad de pedidos, total gastado, último pedido) se guarda
+  en la caché por usuario. Se invalida al crear un pedido o cambiar su
+  estado (señal post_save de Pedido; los UPDATE masivos llaman a
+  `invalidar`) y se recalcula con un solo aggregate en la siguiente visita.
+- Los pedidos archivados (ver services/archivo_pedidos.py) se leen solo si
+  el archivo tiene pedidos; el listado mezcla ambas tablas por fecha.
+"""
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Count, Max, Prefetch, Q, Sum
+from ..models import ItemPedido, ItemPedidoArchivado, Pedido, PedidoArchivado
+from .archivo_pedidos import ArchivoPedidos, ListadoConArchivo
+
+
+class HistorialPedidos:
+    """
+    Páginas del historial y resumen cacheado por usuario
+
+    Ejemplo de uso:
+        pedidos = HistorialPedidos.pagina(request.user, request.GET.get('page'))
+        resumen = HistorialPedidos.resumen(request.user.pk)
+        HistorialPedidos.invalidar(*usuario_ids)  # tras un queryset.update(estado=...)
+    """
+
+    POR_PAGINA = 10
+    CACHE_TIMEOUT = 60 * 60 * 24  # 1 día; las invalidaciones lo mantienen al día
+
+    @staticmethod
+    def _clave(usuario_id):
+        return f'resumen_pedidos:{usuario_id}'
+
+    @staticmethod
+    def _fuentes():
+        """(modelo de pedido, modelo de item) a consultar: el archivo solo si tiene pedidos"""
+        if ArchivoPedidos.incluir_archivo():
+            return [(Pedido, ItemPedido), (PedidoArchivado, ItemPedidoArchivado)]
+        return [(Pedido, ItemPedido)]
+
+    @classmethod
+    def pagina(cls, usuario, numero):
+        """Página de pedidos del usuario con sus líneas, productos y tallas ya cargados"""
+        listado = ListadoConArchivo(*(
+            modelo.objects.filter(usuario=usuario).order_by('-fecha_pedido', '-pk').prefetch_related(
+                Prefetch('itempedido_set', queryset=items.objects.select_related('producto', 'talla').order_by('pk'))
+            )
+            for modelo, items in cls._fuentes()
+        ))
+        paginator = Paginator(listado, cls.POR_PAGINA)
+        try:
+            return paginator.page(numero)
+        except PageNotAnInteger:
+            return paginator.page(1)
+        except EmptyPage:
+            return paginator.page(paginator.num_pages)
+
+    @classmethod
+    def resumen(cls, usuario_id):
+        """
+        Resumen de pedidos del usuario
+
+        Returns:
+            dict: pedidos (cantidad), gastado (sin los cancelados) y
+            ultimo_pedido (fecha o None)
+        """
+        resumen = cache.get(cls._clave(usuario_id))
+        if resumen is None:
+            resumen = {'pedidos': 0, 'gastado': Decimal('0.00'), 'ultimo_pedido': None}
+            for modelo, _ in cls._fuentes():
+                datos = modelo.objects.filter(usuario_id=usuario_id).aggregate(
+                    pedidos=Count('pk'),
+                    gastado=Sum('total', filter=~Q(estado='cancelado')),
+                    ultimo_pedido=Max('fecha_pedido'),
+                )
+                resumen['pedidos'] += datos['pedidos']
+                resumen['gastado'] += datos['gastado'] or 0
+                resumen['ultimo_pedido'] = max(
+                    filter(None, (resumen['ultimo_pedido'], datos['ultimo_pedido'])), default=None
+                )
+            cache.set(cls._clave(usuario_id), resumen, cls.CACHE_TIMEOUT)
+        return resumen
+
+    @classmethod
+    def invalidar(cls, *usuario_ids):
+        """Descartar el resumen de los usuarios cuyos pedidos cambiaron"""
+        cache.delete_many([cls._clave(usuario_id) for usuario_id in set(usuario_ids)])
+
+    @classmethod
+    def invalidar_pedidos(cls, pedido_ids):
+        """Descartar el resumen de los dueños de los pedidos indicados"""
+        cls.invalidar(*Pedido.objects.filter(pk__in=pedido_ids).values_list('usuario_id', flat=True).distinct())
@@ -0,0 +1,150 @@
+"""
+Claves de idempotencia para los POST que cambian pedidos e inventario
+
+Los clientes móviles y los proxies reintentan los POST de checkout y de
+cambio de estado de pedidos. Si la solicitud trae una clave (cabecera
+Idempotency-Key o campo clave_idempotencia del formulario), la operación y
+el guardado de su respuesta ocurren en la misma transacción:
+
+- La primera solicitud inserta la fila de RespuestaIdempotente, ejecuta la
+  vista y guarda su respuesta.
+- Un reintento choca con la restricción única (ámbito, clave) y recibe la
+  respuesta guardada, sin volver a tocar stock ni pedidos. Si el original
+  sigue en curso, la base de datos lo hace esperar a que termine.
+- Si la vista falla (excepción o respuesta 5xx) se revierte todo, incluida
+  la fila, y el reintento se ejecuta de nuevo.
+
+Las solicitudes sin clave se atienden igual que antes.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from ..models import RespuestaIdempotente
+
+
+class ServicioIdempotencia:
+    """
+    Ejecución de vistas con clave de idempotencia
+
+    Ejemplo de uso:
+        @login_required
+        @idempotente
+        def checkout(request):
+            ...
+    """
+
+    CABECERA = 'HTTP_IDEMPOTENCY_KEY'
+    CAMPO = 'clave_idempotencia'
+    TIPOS_FORMULARIO = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+    @staticmethod
+    def duracion():
+        return timedelta(hours=settings.IDEMPOTENCIA_HORAS)
+
+    @classmethod
+    def clave_de(cls, request):
+        """Clave enviada en la cabecera o en el formulario ('' si no hay)"""
+        clave = request.META.get(cls.CABECERA) or request.POST.get(cls.CAMPO) or ''
+        clave = clave.strip()
+        if len(clave) > 64:
+            clave = hashlib.sha256(clave.encode()).hexdigest()
+        return clave
+
+    @staticmethod
+    def ambito(request):
+        """Las claves de cada usuario (o sesión anónima) no chocan entre sí"""
+        if request.user.is_authenticated:
+            return f'usuario:{request.user.pk}'
+        if not request.session.session_key:
+            request.session.save()
+        return f'sesion:{request.session.session_key}'
+
+    @classmethod
+    def huella(cls, request):
+        """SHA-256 de la ruta y los datos, para detectar una clave reutilizada con otros datos"""
+        if request.content_type in cls.TIPOS_FORMULARIO:
+            datos = sorted(
+                (campo, valores) for campo, valores in request.POST.lists()
+                if campo not in ('csrfmiddlewaretoken', cls.CAMPO)
+            )
+            cuerpo = repr(datos).encode()
+        else:
+            cuerpo = request.body
+        return hashlib.sha256(request.path.encode() + b'\n' + cuerpo).hexdigest()
+
+    @classmethod
+    def ejecutar(cls, request, clave, vista):
+        """
+        Ejecutar la vista una sola vez por clave y guardar su respuesta
+
+        Returns:
+            HttpResponse: La respuesta de la vista, la guardada (reintentos) o
+            un 422 si la clave ya se usó con otros datos
+        """
+        ambito = cls.ambito(request)
+        huella = cls.huella(request)
+        ahora = timezone.now()
+        RespuestaIdempotente.objects.filter(ambito=ambito, clave=clave, expira_en__lte=ahora).delete()
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    registro = RespuestaIdempotente.objects.create(
+                        ambito=ambito, clave=clave, huella=huella, estado_http=0,
+                        expira_en=ahora + cls.duracion(),
+                    )
+            except IntegrityError:
+                return cls._repetir(ambito, clave, huella)
+
+            respuesta = vista()
+            if respuesta.status_code >= 500 or respuesta.streaming:
+                # Sin respuesta guardada: el reintento vuelve a ejecutar la vista
+                transaction.set_rollback(True)
+                return respuesta
+
+            registro.estado_http = respuesta.status_code
+            registro.ubicacion = respuesta.get('Location', '')
+            registro.tipo_contenido = respuesta.get('Content-Type', '')
+            registro.contenido = respuesta.content.decode(respuesta.charset or 'utf-8')
+            registro.save(update_fields=['estado_http', 'ubicacion', 'tipo_contenido', 'contenido'])
+        return respuesta
+
+    @staticmethod
+    def _repetir(ambito, clave, huella):
+        """Respuesta guardada para un reintento"""
+        registro = RespuestaIdempotente.objects.get(ambito=ambito, clave=clave)
+        if registro.huella != huella:
+            return JsonResponse({
+                'success': False,
+                'message': 'La clave de idempotencia ya se usó con otra solicitud.'
+            }, status=422)
+        respuesta = HttpResponse(
+            registro.contenido, status=registro.estado_http, content_type=registro.tipo_contenido or None
+        )
+        if registro.ubicacion:
+            respuesta['Location'] = registro.ubicacion
+        respuesta['Idempotent-Replayed'] = 'true'
+        return respuesta
+
+    @classmethod
+    def limpiar_vencidas(cls):
+        """Borrar las respuestas guardadas cuyo plazo ya pasó"""
+        borradas, _ = RespuestaIdempotente.objects.filter(expira_en__lte=timezone.now()).delete()
+        return borradas
+
+
+def idempotente(vista):
+    """Decorador: los POST con clave de idempotencia se ejecutan una sola vez"""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method != 'POST':
+            return vista(request, *args, **kwargs)
+        clave = ServicioIdempotencia.clave_de(request)
+        if not clave:
+            return vista(request, *args, **kwargs)
+        return ServicioIdempotencia.ejecutar(request, clave, lambda: vista(request, *args, **kwargs))
+    return envoltura
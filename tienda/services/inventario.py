@@ -0,0 +1,176 @@
+"""
+Libro de movimientos de inventario con compactación
+
+Todo cambio de stock queda en MovimientoStock, así se puede reconstruir el
+stock de cualquier talla y revisar de dónde salió cada unidad:
+
+- Las salidas (ventas, ajustes hacia abajo) se aplican a Talla.stock en la
+  misma transacción: el checkout necesita comprobar la disponibilidad sobre
+  la fila de la talla para no vender de más.
+- Las entradas (reposiciones, cancelaciones) solo insertan la fila, sin
+  bloquear la talla. El stock actual es Talla.stock más esas entradas
+  pendientes (`stock_actual`), y `compactar` las suma a Talla.stock por lotes.
+  Hasta entonces no están a la venta.
+- `consolidar` resume los movimientos antiguos de cada talla en una fila
+  de saldo y los marca como consolidados, para que `reconciliar` recorra
+  solo los saldos y los movimientos recientes. Las filas originales se
+  conservan: el libro solo agrega filas.
+
+En las tallas fraccionadas (ver services/fracciones.py) el stock es la suma
+de sus fracciones y reservas, y las entradas se compactan en una fracción.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from ..models import ItemPedido, MovimientoStock, Talla
+from .expresiones import valor_por_pk
+from .fracciones import StockFraccionado
+
+
+class InventarioStock:
+    """
+    Registro, compactación y réplica de movimientos de stock
+
+    Ejemplo de uso:
+        InventarioStock.reponer(talla.pk, 20)          # INSERT, sin bloquear la talla
+        InventarioStock.stock_actual(talla.pk)         # {talla_id: stock + entradas pendientes}
+        InventarioStock.compactar()                    # desde el comando compactar_stock
+    """
+
+    TAMANO_LOTE = 1000
+
+    @staticmethod
+    def registrar_ventas(ventas):
+        """
+        Agregar las salidas ya descontadas de Talla.stock, en un solo INSERT
+
+        Args:
+            ventas: {pedido_id: {talla_id: cantidad}}
+        """
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(talla_id=talla_id, tipo='venta', cantidad=-cantidad, pedido_id=pedido_id)
+            for pedido_id, cantidades in ventas.items()
+            for talla_id, cantidad in cantidades.items()
+        ])
+
+    @staticmethod
+    def reponer(talla_id, cantidad, tipo='reposicion', pedido=None):
+        """Registrar una entrada pendiente de compactar"""
+        if cantidad <= 0:
+            raise ValueError('Las entradas pendientes deben ser positivas')
+        return MovimientoStock.objects.create(
+            talla_id=talla_id, tipo=tipo, cantidad=cantidad, pedido=pedido, aplicado=False
+        )
+
+    @classmethod
+    def devolver_pedido(cls, pedido):
+        """Registrar como entradas pendientes las unidades de un pedido cancelado"""
+        return cls.devolver_pedidos([pedido.pk])
+
+    @staticmethod
+    def devolver_pedidos(pedido_ids):
+        """Entradas pendientes de varios pedidos cancelados, con un SELECT agrupado y un INSERT"""
+        unidades = ItemPedido.objects.filter(pedido_id__in=pedido_ids).order_by().values(
+            'pedido_id', 'talla_id'
+        ).annotate(total=Sum('cantidad')).values_list('pedido_id', 'talla_id', 'total')
+        return MovimientoStock.objects.bulk_create([
+            MovimientoStock(talla_id=talla_id, tipo='cancelacion', cantidad=total, pedido_id=pedido_id, aplicado=False)
+            for pedido_id, talla_id, total in unidades
+        ])
+
+    @staticmethod
+    def stock_actual(*talla_ids):
+        """Stock de cada talla incluyendo las entradas sin compactar: {talla_id: stock}"""
+        pendientes = MovimientoStock.objects.filter(
+            talla=OuterRef('pk'), aplicado=False
+        ).order_by().values('talla').annotate(total=Sum('cantidad')).values('total')
+        return dict(
+            Talla.objects.filter(pk__in=talla_ids).annotate(
+                actual=Talla.stock_fisico() + Coalesce(Subquery(pendientes), Value(0), output_field=IntegerField())
+            ).values_list('pk', 'actual')
+        )
+
+    @classmethod
+    def compactar(cls, tamano_lote=None):
+        """
+        Sumar las entradas pendientes a Talla.stock por lotes
+
+        Cada lote toma los movimientos pendientes más antiguos (saltando los
+        que otro proceso ya bloqueó), actualiza las tallas con un solo UPDATE
+        y los marca como aplicados.
+
+        Returns:
+            int: Movimientos compactados
+        """
+        from .checkout import ServicioCheckout  # checkout registra sus ventas con este servicio
+
+        tamano_lote = tamano_lote or cls.TAMANO_LOTE
+        compactados = 0
+        while True:
+            with transaction.atomic():
+                filas = list(
+                    MovimientoStock.objects.select_for_update(skip_locked=True)
+                    .filter(aplicado=False).order_by('pk')
+                    .values_list('pk', 'talla_id', 'cantidad')[:tamano_lote]
+                )
+                if not filas:
+                    return compactados
+                por_talla = {}
+                for _, talla_id, cantidad in filas:
+                    por_talla[talla_id] = por_talla.get(talla_id, 0) + cantidad
+                for talla_id, fracciones in StockFraccionado.fraccionadas(por_talla).items():
+                    StockFraccionado.sumar(talla_id, fracciones, por_talla.pop(talla_id))
+                Talla.objects.filter(pk__in=por_talla).update(
+                    stock=F('stock') + valor_por_pk(por_talla)
+                )
+                MovimientoStock.objects.filter(pk__in=[fila[0] for fila in filas]).update(aplicado=True)
+                ServicioCheckout.refrescar_productos(*set(
+                    Talla.objects.filter(pk__in={fila[1] for fila in filas}).values_list('producto_id', flat=True)
+                ))
+            compactados += len(filas)
+
+    @staticmethod
+    def consolidar(antes_de):
+        """
+        Resumir en un saldo por talla los movimientos aplicados anteriores a `antes_de`
+
+        Los movimientos resumidos quedan marcados como consolidados y
+        `reconciliar` deja de sumarlos.
+
+        Returns:
+            int: Movimientos consolidados
+        """
+        with transaction.atomic():
+            antiguos = MovimientoStock.objects.select_for_update().filter(
+                aplicado=True, consolidado=False, fecha__lt=antes_de
+            )
+            grupos = list(
+                antiguos.order_by().values('talla_id').annotate(total=Sum('cantidad'), filas=Count('pk'))
+                .filter(filas__gt=1).values_list('talla_id', 'total', 'filas')
+            )
+            if not grupos:
+                return 0
+            antiguos.filter(talla_id__in=[talla_id for talla_id, _, _ in grupos]).update(consolidado=True)
+            MovimientoStock.objects.bulk_create([
+                MovimientoStock(talla_id=talla_id, tipo='saldo', cantidad=total, fecha=antes_de)
+                for talla_id, total, _ in grupos
+            ])
+        return sum(filas for _, _, filas in grupos)
+
+    @staticmethod
+    def reconciliar():
+        """
+        Repetir el libro y compararlo con el stock de cada talla
+
+        Returns:
+            list: (talla_id, stock, stock_según_el_libro) de las tallas que no cuadran
+        """
+        aplicados = MovimientoStock.objects.filter(
+            talla=OuterRef('pk'), aplicado=True, consolidado=False
+        ).order_by().values('talla').annotate(total=Sum('cantidad')).values('total')
+        return list(
+            Talla.objects.annotate(
+                fisico=Talla.stock_fisico(),
+                libro=Coalesce(Subquery(aplicados), Value(0), output_field=IntegerField()),
+            ).exclude(fisico=F('libro')).order_by('pk').values_list('pk', 'fisico', 'libro')
+        )
@@ -0,0 +1,140 @@
+"""
+Paginación por cursor (keyset) para listados ordenados por fecha
+
+En lugar de OFFSET + COUNT(*), cada página se obtiene buscando a partir del
+último (fecha_creacion, id) visto, de modo que la página 100 cuesta lo mismo
+que la primera. Los cursores son tokens firmados y opacos para el cliente.
+"""
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from .cache_catalogo import VersionCatalogo
+
+
+class PaginaKeyset:
+    """
+    Página de resultados obtenida por cursor
+
+    Se puede iterar igual que una página de Paginator. En lugar de números
+    de página expone los cursores de la página siguiente y anterior.
+    """
+
+    es_keyset = True
+
+    def __init__(self, object_list, cursor_siguiente, cursor_anterior, total_aproximado):
+        self.object_list = object_list
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total_aproximado = total_aproximado
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class PaginadorKeyset:
+    """
+    Paginador por cursor sobre (campo_fecha, id) en orden descendente
+
+    Ejemplo de uso:
+        paginador = PaginadorKeyset(productos, por_pagina=9)
+        pagina = paginador.pagina(request.GET.get('cursor'))
+    """
+
+    SALT = 'tienda.paginacion.keyset'
+    CACHE_PREFIX = 'conteo_aproximado'
+    CACHE_TIMEOUT = 600  # 10 minutos
+
+    def __init__(self, queryset, por_pagina, campo_fecha='fecha_creacion'):
+        self.queryset = queryset
+        self.por_pagina = por_pagina
+        self.campo_fecha = campo_fecha
+
+    def codificar_cursor(self, objeto, direccion):
+        """Crear un cursor opaco a partir de la última fila vista"""
+        fecha = getattr(objeto, self.campo_fecha)
+        return signing.dumps({'f': fecha.isoformat(), 'i': objeto.pk, 'd': direccion}, salt=self.SALT, compress=True)
+
+    def decodificar_cursor(self, cursor):
+        """Devuelve (fecha_iso, id, direccion) o None si el cursor no es válido"""
+        if not cursor:
+            return None
+        try:
+            datos = signing.loads(cursor, salt=self.SALT)
+            return datos['f'], int(datos['i']), datos['d']
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+    def pagina(self, cursor=None, total=None, firma=None):
+        """
+        Obtener una página de resultados
+
+        Args:
+            cursor: Token recibido en la URL (None para la primera página)
+            total: Total ya conocido (p. ej. de las facetas) para evitar el COUNT
+            firma: Firma de los filtros para cachear el conteo aproximado
+        """
+        fecha = self.campo_fecha
+        posicion = self.decodificar_cursor(cursor)
+        queryset = self.queryset
+
+        if posicion is None:
+            direccion = 'n'
+            queryset = queryset.order_by(f'-{fecha}', '-pk')
+        else:
+            valor_fecha, pk, direccion = posicion
+            if direccion == 'p':
+                # Página anterior: avanzar en orden ascendente y luego invertir
+                queryset = queryset.filter(
+                    Q(**{f'{fecha}__gt': valor_fecha}) | Q(**{fecha: valor_fecha, 'pk__gt': pk})
+                ).order_by(fecha, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{fecha}__lt': valor_fecha}) | Q(**{fecha: valor_fecha, 'pk__lt': pk})
+                ).order_by(f'-{fecha}', '-pk')
+
+        # Una fila extra indica si hay más resultados en esa dirección
+        filas = list(queryset[:self.por_pagina + 1])
+        hay_mas = len(filas) > self.por_pagina
+        filas = filas[:self.por_pagina]
+
+        if direccion == 'p':
+            filas.reverse()
+            hay_siguiente, hay_anterior = True, hay_mas
+        else:
+            hay_siguiente, hay_anterior = hay_mas, posicion is not None
+
+        cursor_siguiente = self.codificar_cursor(filas[-1], 'n') if filas and hay_siguiente else None
+        cursor_anterior = self.codificar_cursor(filas[0], 'p') if filas and hay_anterior else None
+
+        if total is None:
+            total = self.total_aproximado(firma)
+
+        return PaginaKeyset(filas, cursor_siguiente, cursor_anterior, total)
+
+    def total_aproximado(self, firma=None):
+        """
+        Conteo del listado cacheado por firma de filtros y versión del catálogo
+
+        Puede quedar desfasado hasta CACHE_TIMEOUT si la caché no es compartida
+        entre procesos; solo se usa para mostrar un total orientativo.
+        """
+        if firma is None:
+            return self.queryset.count()
+        cache_key = VersionCatalogo.clave(self.CACHE_PREFIX, firma)
+        total = cache.get(cache_key)
+        if total is None:
+            total = self.queryset.order_by().count()
+            cache.set(cache_key, total, self.CACHE_TIMEOUT)
+        return total
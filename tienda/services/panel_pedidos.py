@@ -0,0 +1,146 @@
+"""
+Datos del panel de pedidos del administrador
+
+La tabla de pedidos se carga por partes desde un endpoint JSON en lugar de
+renderizar todos los pedidos en la página:
+
+- Paginación por cursor sobre (fecha_pedido, id) con PaginadorKeyset: cada
+  página cuesta lo mismo sin importar cuántos pedidos haya detrás.
+- Los filtros se traducen a predicados que usan los índices de Pedido:
+  estado + rango de fechas (pedido_estado_fecha_idx), usuario
+  (pedido_usuario_fecha_idx) y rangos de fecha sin funciones sobre la
+  columna. La búsqueda acepta un número de pedido o un email.
+- El cliente viene en el mismo SELECT (select_related) y la cantidad de
+  items es una subconsulta por fila; las filas se devuelven como listas
+  compactas con el orden de `COLUMNAS`.
+- Si los filtros llegan a fechas ya archivadas (ver services/archivo_pedidos.py)
+  se pagina también PedidoArchivado con el mismo cursor y se mezclan las
+  dos páginas; los ids son únicos entre ambas tablas.
+"""
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import ItemPedido, ItemPedidoArchivado, Pedido, PedidoArchivado
+from .archivo_pedidos import ArchivoPedidos
+from .paginacion import PaginadorKeyset
+
+
+class PanelPedidos:
+    """
+    Filtros y páginas del listado de pedidos del panel
+
+    Ejemplo de uso:
+        datos = PanelPedidos.pagina(request.GET)
+        return JsonResponse({'success': True, **datos})
+    """
+
+    POR_PAGINA = 50
+    MAXIMO_POR_PAGINA = 200
+    COLUMNAS = ['id', 'cliente', 'email', 'fecha', 'total', 'estado', 'items', 'archivado']
+
+    @staticmethod
+    def _inicio_del_dia(valor):
+        """Medianoche (hora local) de una fecha AAAA-MM-DD, o None si no es válida"""
+        try:
+            dia = date.fromisoformat(valor)
+        except (TypeError, ValueError):
+            return None
+        return timezone.make_aware(datetime.combine(dia, time.min))
+
+    @classmethod
+    def filtrar(cls, parametros, modelo=Pedido):
+        """
+        Pedidos que cumplen los filtros
+
+        Args:
+            parametros: QueryDict con estado, desde, hasta (AAAA-MM-DD),
+                usuario (id) y q (número de pedido o email)
+            modelo: Pedido o PedidoArchivado
+        """
+        pedidos = modelo.objects.all()
+
+        estado = parametros.get('estado')
+        if estado in dict(Pedido.ESTADOS_PEDIDO):
+            pedidos = pedidos.filter(estado=estado)
+
+        desde = cls._inicio_del_dia(parametros.get('desde'))
+        if desde:
+            pedidos = pedidos.filter(fecha_pedido__gte=desde)
+        hasta = cls._inicio_del_dia(parametros.get('hasta'))
+        if hasta:
+            pedidos = pedidos.filter(fecha_pedido__lt=hasta + timedelta(days=1))
+
+        usuario = parametros.get('usuario', '')
+        if usuario.isdigit():
+            pedidos = pedidos.filter(usuario_id=int(usuario))
+
+        busqueda = parametros.get('q', '').strip().lstrip('#')
+        if busqueda.isdigit():
+            pedidos = pedidos.filter(pk=int(busqueda))
+        elif '@' in busqueda:
+            pedidos = pedidos.filter(usuario__email__iexact=busqueda)
+        elif busqueda:
+            pedidos = pedidos.filter(usuario__email__istartswith=busqueda)
+        return pedidos
+
+    @classmethod
+    def pagina(cls, parametros):
+        """
+        Página del listado para el endpoint JSON
+
+        El total solo se cuenta en la primera página (sin cursor); las
+        siguientes no hacen COUNT.
+
+        Returns:
+            dict: columnas, pedidos (filas como listas), siguiente (cursor o
+            None) y, en la primera página, total
+        """
+        try:
+            por_pagina = min(max(int(parametros.get('limite', cls.POR_PAGINA)), 1), cls.MAXIMO_POR_PAGINA)
+        except ValueError:
+            por_pagina = cls.POR_PAGINA
+
+        fuentes = [(Pedido, ItemPedido)]
+        if ArchivoPedidos.incluir_archivo(cls._inicio_del_dia(parametros.get('desde')), parametros.get('estado')):
+            fuentes.append((PedidoArchivado, ItemPedidoArchivado))
+
+        cursor = parametros.get('cursor')
+        paginas, total = [], 0
+        for modelo, modelo_items in fuentes:
+            items = modelo_items.objects.filter(
+                pedido=OuterRef('pk')
+            ).order_by().values('pedido').annotate(total=Count('pk')).values('total')
+            filtrados = cls.filtrar(parametros, modelo)
+            pedidos = filtrados.select_related('usuario').only(
+                'pk', 'fecha_pedido', 'total', 'estado', 'usuario__nombre', 'usuario__email'
+            ).annotate(items=Coalesce(Subquery(items), Value(0), output_field=IntegerField()))
+
+            paginador = PaginadorKeyset(pedidos, por_pagina, campo_fecha='fecha_pedido')
+            # Las páginas siguientes no cuentan (el cliente ya tiene el total)
+            paginas.append(paginador.pagina(cursor, total=0))
+            if not cursor:
+                total += filtrados.count()
+
+        # Las primeras `por_pagina` filas de las dos tablas; el cursor sirve para ambas
+        filas = sorted(chain.from_iterable(paginas), key=lambda p: (p.fecha_pedido, p.pk), reverse=True)
+        pagina = filas[:por_pagina]
+        hay_mas = len(filas) > por_pagina or any(p.has_next() for p in paginas)
+        siguiente = paginador.codificar_cursor(pagina[-1], 'n') if pagina and hay_mas else None
+
+        datos = {
+            'columnas': cls.COLUMNAS,
+            'pedidos': [
+                [
+                    pedido.pk, pedido.usuario.nombre, pedido.usuario.email,
+                    timezone.localtime(pedido.fecha_pedido).isoformat(timespec='minutes'),
+                    str(pedido.total), pedido.estado, pedido.items, isinstance(pedido, PedidoArchivado),
+                ]
+                for pedido in pagina
+            ],
+            'siguiente': siguiente,
+        }
+        if not cursor:
+            datos['total'] = total
+        return datos
@@ -0,0 +1,115 @@
+"""
+Recálculo por conjuntos de Producto.total_vendidos
+
+El contador se mantiene al día con los eventos de estado de los pedidos (ver
+services/eventos_pedido.py); este recálculo sirve para verificarlo y
+repararlo sin recorrer producto por producto:
+
+1. Un SELECT ... GROUP BY sobre ItemPedido (y otro sobre ItemPedidoArchivado:
+   los pedidos archivados siguen contando) con las unidades de pedidos
+   entregados por producto.
+2. Los contadores actuales se leen por lotes y solo los que difieren se
+   escriben con bulk_update (también en ProductoCatalogo).
+
+El modo incremental usa como marca el último CambioEstadoPedido procesado y
+solo recalcula los productos de pedidos que cambiaron de estado desde
+entonces. Si no hay marca (primera ejecución o caché vaciada) hace un
+recálculo completo. Un pedido que cambia de estado mientras corre el
+recálculo queda después de la marca y se corrige en la siguiente ejecución.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Sum
+from ..models import CambioEstadoPedido, ItemPedido, ItemPedidoArchivado, Producto, ProductoCatalogo
+from .cache_catalogo import VersionCatalogo
+
+
+class RecalculoVentas:
+    """
+    Recálculo completo o incremental del contador de ventas
+
+    Ejemplo de uso:
+        resultado = RecalculoVentas.recalcular(incremental=True)
+        resultado['actualizados'], resultado['segundos']
+    """
+
+    TAMANO_LOTE = 1000
+    CACHE_KEY = 'recalculo_ventas_marca'
+
+    @classmethod
+    def recalcular(cls, incremental=False, producto_ids=None, tamano_lote=None):
+        """
+        Recalcular total_vendidos desde las líneas de pedidos entregados
+
+        Args:
+            incremental: Solo los productos de pedidos con cambios de estado
+                posteriores a la marca
+            producto_ids: Limitar el recálculo a estos productos
+
+        Returns:
+            dict: modo, revisados, actualizados (productos con otro valor) y segundos
+        """
+        inicio = time.monotonic()
+        tamano_lote = tamano_lote or cls.TAMANO_LOTE
+        # La marca se toma antes de leer: los cambios posteriores entran en la próxima ejecución
+        tope = CambioEstadoPedido.objects.aggregate(tope=Max('pk'))['tope'] or 0
+        marca = cache.get(cls.CACHE_KEY) if incremental and producto_ids is None else None
+        modo = 'completo'
+        if marca is not None:
+            modo = 'incremental'
+            producto_ids = list(
+                ItemPedido.objects.filter(
+                    pedido__cambios_estado__pk__gt=marca, pedido__cambios_estado__pk__lte=tope
+                ).order_by().values_list('producto_id', flat=True).distinct()
+            )
+
+        productos = Producto.objects.order_by('pk')
+        if producto_ids is not None:
+            productos = productos.filter(pk__in=producto_ids)
+        totales = {}
+        for modelo in (ItemPedido, ItemPedidoArchivado):
+            entregadas = modelo.objects.filter(pedido__estado='entregado')
+            if producto_ids is not None:
+                entregadas = entregadas.filter(producto_id__in=producto_ids)
+            for producto_id, total in entregadas.order_by().values('producto_id').annotate(
+                total=Sum('cantidad')
+            ).values_list('producto_id', 'total'):
+                totales[producto_id] = totales.get(producto_id, 0) + total
+
+        revisados = actualizados = ultimo = 0
+        while True:
+            # Lotes por rango de pk: no se escribe en la tabla mientras hay un cursor abierto sobre ella
+            filas = list(productos.filter(pk__gt=ultimo).values_list('pk', 'total_vendidos')[:tamano_lote])
+            if not filas:
+                break
+            revisados += len(filas)
+            ultimo = filas[-1][0]
+            actualizados += cls._aplicar([
+                (pk, totales.get(pk, 0)) for pk, actual in filas if totales.get(pk, 0) != actual
+            ])
+
+        if actualizados:
+            VersionCatalogo.incrementar()
+        if producto_ids is None or modo == 'incremental':
+            cache.set(cls.CACHE_KEY, tope, None)
+        return {
+            'modo': modo,
+            'revisados': revisados,
+            'actualizados': actualizados,
+            'segundos': round(time.monotonic() - inicio, 3),
+        }
+
+    @staticmethod
+    def _aplicar(lote):
+        """Escribir un lote de (producto_id, total) en Producto y ProductoCatalogo"""
+        if not lote:
+            return 0
+        with transaction.atomic():
+            Producto.objects.bulk_update(
+                [Producto(pk=pk, total_vendidos=total) for pk, total in lote], ['total_vendidos']
+            )
+            ProductoCatalogo.objects.bulk_update(
+                [ProductoCatalogo(producto_id=pk, total_vendidos=total) for pk, total in lote], ['total_vendidos']
+            )
+        return len(lote)
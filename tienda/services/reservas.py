@@ -0,0 +1,183 @@
+"""
+Reservas temporales de stock para los carritos
+
+Al agregar una talla al carrito se retienen esas unidades durante
+CARRITO_RESERVA_MINUTOS. Así, en un lanzamiento con mucha demanda, quien ya
+tiene la prenda en el carrito no la pierde en el checkout y los demás ven
+la disponibilidad real desde el principio.
+
+- Cada reserva es una fila de ReservaStock (una por carrito y talla). El
+  carrito se identifica por su clave (CarritoSesion.clave_reservas o
+  CarritoCompras.clave_reservas), así los carritos anónimos en sesión
+  también reservan sin crear filas de CarritoCompras.
+- Talla.reservado lleva la suma de las reservas de la talla: la
+  disponibilidad es `stock - reservado`, sin recorrer carritos ni reservas.
+- Las reservas vencidas se liberan por lotes (`manage.py liberar_reservas`)
+  y también antes de reservar sobre la misma talla.
+- El checkout convierte las reservas del carrito en ventas en el mismo
+  UPDATE que descuenta el stock (ver ServicioCheckout).
+- En una talla fraccionada (ver services/fracciones.py) reservar descuenta
+  de una fracción y liberar devuelve a una fracción; Talla.reservado no se
+  toca.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import ReservaStock, Talla
+from .fracciones import StockFraccionado
+from .expresiones import valor_por_pk
+
+
+class ReservasStock:
+    """
+    Reserva, liberación y barrido de unidades retenidas por carritos
+
+    Ejemplo de uso:
+        if not ReservasStock.reservar(carrito.clave_reservas, talla, 2):
+            messages.error(request, 'No hay unidades disponibles')
+        ReservasStock.liberar_vencidas()  # desde cron o el comando liberar_reservas
+    """
+
+    TAMANO_LOTE = 500
+
+    @staticmethod
+    def duracion():
+        return timedelta(minutes=settings.CARRITO_RESERVA_MINUTOS)
+
+    @classmethod
+    def reservar(cls, clave_carrito, talla, cantidad):
+        """
+        Retener `cantidad` unidades más de la talla para el carrito indicado
+
+        También renueva el vencimiento de todas las reservas del carrito.
+
+        Returns:
+            bool: False si no hay unidades disponibles (no se reserva nada)
+        """
+        ahora = timezone.now()
+        expira_en = ahora + cls.duracion()
+        with transaction.atomic():
+            cls.liberar_vencidas(talla_ids=[talla.pk], ahora=ahora)
+
+            if talla.fracciones:
+                if not StockFraccionado.descontar(talla.pk, talla.fracciones, cantidad):
+                    return False
+            # Solo reserva si stock - reservado alcanza (condición dentro del UPDATE)
+            elif not Talla.objects.filter(
+                pk=talla.pk, stock__gte=F('reservado') + cantidad
+            ).update(reservado=F('reservado') + cantidad):
+                return False
+
+            if not ReservaStock.objects.filter(clave_carrito=clave_carrito, talla=talla).update(
+                cantidad=F('cantidad') + cantidad
+            ):
+                ReservaStock.objects.create(
+                    clave_carrito=clave_carrito, talla=talla, cantidad=cantidad, expira_en=expira_en
+                )
+            ReservaStock.objects.filter(clave_carrito=clave_carrito).update(expira_en=expira_en)
+        return True
+
+    @classmethod
+    def retenidas(cls, clave_carrito):
+        """
+        Unidades retenidas por el carrito en cada talla: {talla_id: cantidad}
+
+        Incluye las reservas vencidas que aún no se barrieron, porque siguen
+        sumadas en Talla.reservado.
+        """
+        return dict(
+            ReservaStock.objects.select_for_update().filter(
+                clave_carrito=clave_carrito
+            ).values_list('talla_id', 'cantidad')
+        )
+
+    @classmethod
+    def liberar(cls, clave_carrito, talla_ids=None):
+        """Liberar las reservas del carrito (todas o solo las de ciertas tallas)"""
+        reservas = ReservaStock.objects.filter(clave_carrito=clave_carrito)
+        if talla_ids is not None:
+            reservas = reservas.filter(talla_id__in=talla_ids)
+        return cls._liberar(reservas)
+
+    @classmethod
+    def devolver(cls, clave_carrito, talla_id, cantidad):
+        """
+        Liberar parte de la reserva de una talla (al bajar la cantidad en el carrito)
+
+        Returns:
+            int: Unidades devueltas (a lo sumo las que el carrito tenía reservadas)
+        """
+        with transaction.atomic():
+            reserva = ReservaStock.objects.select_for_update().filter(
+                clave_carrito=clave_carrito, talla_id=talla_id
+            ).first()
+            if reserva is None:
+                return 0
+            if reserva.cantidad <= cantidad:
+                return cls._liberar(ReservaStock.objects.filter(pk=reserva.pk))
+            ReservaStock.objects.filter(pk=reserva.pk).update(cantidad=F('cantidad') - cantidad)
+            cls._devolver_unidades({talla_id: cantidad})
+        return cantidad
+
+    @classmethod
+    def liberar_vencidas(cls, talla_ids=None, ahora=None):
+        """
+        Barrer las reservas vencidas por lotes
+
+        Returns:
+            int: Unidades devueltas a la disponibilidad
+        """
+        vencidas = ReservaStock.objects.filter(expira_en__lte=ahora or timezone.now())
+        if talla_ids is not None:
+            vencidas = vencidas.filter(talla_id__in=talla_ids)
+        liberadas = 0
+        while True:
+            lote = cls._liberar(vencidas.order_by('pk')[:cls.TAMANO_LOTE], saltar_bloqueadas=True)
+            liberadas += lote
+            if not lote:
+                return liberadas
+
+    @classmethod
+    def _liberar(cls, reservas, saltar_bloqueadas=False):
+        """Borrar las reservas y restar sus unidades de Talla.reservado (un UPDATE)"""
+        with transaction.atomic():
+            # Las reservas que un checkout está convirtiendo se saltan en el barrido
+            filas = list(reservas.select_for_update(skip_locked=saltar_bloqueadas).values_list(
+                'pk', 'talla_id', 'cantidad'
+            ))
+            if not filas:
+                return 0
+            por_talla = {}
+            for _, talla_id, cantidad in filas:
+                por_talla[talla_id] = por_talla.get(talla_id, 0) + cantidad
+            ReservaStock.objects.filter(pk__in=[fila[0] for fila in filas]).delete()
+            cls._devolver_unidades(por_talla)
+        return sum(por_talla.values())
+
+    @staticmethod
+    def _devolver_unidades(por_talla):
+        """Restar de Talla.reservado (un UPDATE) o devolver a las fracciones las unidades liberadas"""
+        fraccionadas = StockFraccionado.fraccionadas(por_talla)
+        for talla_id, fracciones in fraccionadas.items():
+            StockFraccionado.sumar(talla_id, fracciones, por_talla[talla_id])
+        por_talla = {talla_id: cantidad for talla_id, cantidad in por_talla.items() if talla_id not in fraccionadas}
+        if por_talla:
+            Talla.objects.filter(pk__in=por_talla).update(
+                reservado=F('reservado') - valor_por_pk(por_talla)
+            )
+
+    @classmethod
+    def reconciliar(cls):
+        """
+        Recalcular Talla.reservado desde las reservas existentes
+
+        Corrige el contador si se borraron reservas sin pasar por este
+        servicio (por ejemplo, en cascada al eliminar una talla).
+        """
+        suma = ReservaStock.objects.filter(
+            talla=OuterRef('pk')
+        ).order_by().values('talla').annotate(total=Sum('cantidad')).values('total')
+        return Talla.objects.filter(fracciones=0).update(reservado=Coalesce(Subquery(suma), Value(0)))
@@ -0,0 +1,75 @@
+"""
+Máscara de bits de las tallas con stock
+
+Producto.tallas_mascara y ProductoCatalogo.tallas_mascara guardan un bit por
+cada talla de Talla.OPCIONES_TALLA con stock (ver Talla.BITS). Como solo hay
+cinco tallas la máscara toma a lo sumo 32 valores, así que "M o L en stock" se
+traduce en `tallas_mascara IN (...)` con los valores que tienen alguno de esos
+bits: un predicado sobre una sola tabla que usa el índice de la columna, a
+diferencia de `tallas_mascara & 12 <> 0`.
+"""
+from django.db.models import Q
+from ..models import Talla
+
+
+class MascaraTallas:
+    """
+    Construcción y consulta de máscaras de tallas
+
+    Ejemplo de uso:
+        mascara = MascaraTallas.desde_parametros(request.GET)  # ?talla=M&talla=L o ?talla=M,L
+        productos = ProductoCatalogo.objects.filter(MascaraTallas.filtro(mascara))
+    """
+
+    BITS = Talla.BITS
+    TODAS = sum(BITS.values())
+
+    @classmethod
+    def desde_tallas(cls, tallas):
+        """Máscara a partir de nombres de talla (sin distinguir mayúsculas); ignora los desconocidos"""
+        mascara = 0
+        for talla in tallas:
+            mascara |= cls.BITS.get((talla or '').strip().upper(), 0)
+        return mascara
+
+    @classmethod
+    def desde_parametros(cls, parametros, clave='talla'):
+        """
+        Máscara a partir de un QueryDict (request.GET) o dict
+
+        Acepta el parámetro repetido (?talla=M&talla=L) y separado por comas
+        (?talla=M,L).
+        """
+        if hasattr(parametros, 'getlist'):
+            valores = parametros.getlist(clave)
+        else:
+            valor = parametros.get(clave)
+            valores = valor if isinstance(valor, (list, tuple)) else [valor or '']
+        return cls.desde_tallas(talla for valor in valores for talla in str(valor).split(','))
+
+    @classmethod
+    def tallas(cls, mascara):
+        """Nombres de las tallas de la máscara en el orden de Talla.OPCIONES_TALLA"""
+        return [talla for talla, bit in cls.BITS.items() if mascara & bit]
+
+    @classmethod
+    def valores_con_alguna(cls, mascara):
+        """Valores posibles de tallas_mascara que tienen al menos una talla de la máscara"""
+        return [valor for valor in range(1, cls.TODAS + 1) if valor & mascara]
+
+    @classmethod
+    def valores_con_todas(cls, mascara):
+        """Valores posibles de tallas_mascara que tienen todas las tallas de la máscara"""
+        return [valor for valor in range(1, cls.TODAS + 1) if valor & mascara == mascara]
+
+    @classmethod
+    def filtro(cls, mascara, todas=False, campo='tallas_mascara'):
+        """
+        Q indexable para productos con alguna (o todas) las tallas de la máscara
+
+        Una máscara vacía no filtra nada.
+        """
+        if not mascara:
+            return Q()
+        valores = cls.valores_con_todas(mascara) if todas else cls.valores_con_alguna(mascara)
+        return Q(**{f'{campo}__in': valores})
@@ -0,0 +1,164 @@
+"""
+Señales de la aplicación tienda
+
+Mantienen sincronizados los datos desnormalizados de Producto, el modelo
+de lectura ProductoCatalogo y las cachés del catálogo cuando cambian los
+modelos relacionados, y el carrito en sesión al iniciar y cerrar sesión.
+"""
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Categoria, ImagenProducto, MovimientoStock, Pedido, Talla, Producto, ProductoCatalogo
+from .services.cache_catalogo import VersionCatalogo
+from .services.busqueda import IndiceBusqueda
+from .services.archivo_pedidos import ArchivoPedidos
+from .services.autocompletado import IndiceAutocompletado
+from .services.carrito import CarritoSesion
+from .services.eventos_pedido import EventosPedido
+from .services.historial_pedidos import HistorialPedidos
+
+
+@receiver(post_save, sender=Talla)
+@receiver(post_delete, sender=Talla)
+def actualizar_stock_producto(sender, instance, **kwargs):
+    """Recalcular stock_total y en_stock del producto al crear, editar o borrar una talla"""
+    Producto.recalcular_stock_de(instance.producto_id)
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Producto)
+@receiver(post_save, sender=Talla)
+@receiver(post_delete, sender=Talla)
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_delete, sender=ImagenProducto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_cache_catalogo(sender, **kwargs):
+    """Invalidar facetas, fragmentos HTML y demás cachés del catálogo cuando cambian sus datos"""
+    VersionCatalogo.incrementar()
+
+
+def _borrado_en_cascada(sender, origin):
+    """Indica si el borrado viene de otro modelo (p. ej. al eliminar el producto)"""
+    return getattr(origin, 'model', type(origin)) is not sender
+
+
+@receiver(post_save, sender=Producto)
+def sincronizar_catalogo_producto(sender, instance, **kwargs):
+    """Regenerar la fila del producto en el modelo de lectura"""
+    ProductoCatalogo.sincronizar(instance.pk)
+
+
+@receiver(post_save, sender=Talla)
+@receiver(post_delete, sender=Talla)
+@receiver(post_save, sender=ImagenProducto)
+@receiver(post_delete, sender=ImagenProducto)
+def sincronizar_catalogo_relacionado(sender, instance, **kwargs):
+    """Las tallas con stock y la imagen forman parte de la fila del catálogo"""
+    if 'origin' in kwargs and _borrado_en_cascada(sender, kwargs['origin']):
+        # La fila del catálogo se borra junto con el producto
+        return
+    ProductoCatalogo.sincronizar(instance.producto_id)
+
+
+@receiver(post_save, sender=Categoria)
+def sincronizar_catalogo_categoria(sender, instance, created, **kwargs):
+    """El nombre de la categoría se guarda en cada fila del catálogo"""
+    if not created:
+        ProductoCatalogo.sincronizar(*instance.producto_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Talla)
+def registrar_movimiento_talla(sender, instance, created, **kwargs):
+    """Los cambios de stock hechos guardando la talla quedan en el libro de movimientos"""
+    anterior = 0 if created else getattr(instance, '_stock_guardado', None)
+    # En una talla fraccionada save() no escribe el stock (ver services/fracciones.py)
+    if anterior is not None and not instance.fracciones and instance.stock != anterior:
+        MovimientoStock.objects.create(
+            talla=instance, tipo='inicial' if created else 'ajuste', cantidad=instance.stock - anterior
+        )
+    instance._stock_guardado = instance.stock
+
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, **kwargs):
+    """Actualizar el producto en el índice de búsqueda"""
+    IndiceBusqueda.indexar(instance.pk)
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    """Quitar el producto del índice de búsqueda"""
+    IndiceBusqueda.eliminar(instance.pk)
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_productos_categoria(sender, instance, created, **kwargs):
+    """El nombre de la categoría forma parte del índice de sus productos"""
+    if not created:
+        IndiceBusqueda.indexar(*instance.producto_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Producto)
+def actualizar_autocompletado_producto(sender, instance, **kwargs):
+    """Refrescar el producto en el índice de autocompletado en memoria"""
+    IndiceAutocompletado.actualizar(instance.pk)
+
+
+@receiver(post_delete, sender=Producto)
+def quitar_autocompletado_producto(sender, instance, **kwargs):
+    IndiceAutocompletado.eliminar(instance.pk)
+
+
+@receiver(post_save, sender=Talla)
+@receiver(post_delete, sender=Talla)
+def actualizar_autocompletado_talla(sender, instance, **kwargs):
+    """El autocompletado muestra el stock total del producto"""
+    IndiceAutocompletado.actualizar(instance.producto_id)
+
+
+@receiver(post_save, sender=Categoria)
+def actualizar_autocompletado_categoria(sender, instance, created, **kwargs):
+    if not created:
+        IndiceAutocompletado.actualizar(*instance.producto_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Pedido)
+def registrar_cambio_estado_pedido(sender, instance, created, **kwargs):
+    """La creación del pedido queda en el historial (save() envía los cambios de estado a TransicionesPedido)"""
+    anterior = '' if created else getattr(instance, '_estado_guardado', instance.estado)
+    if created or instance.estado != anterior:
+        EventosPedido.registrar([(instance.pk, anterior, instance.estado)])
+    instance._estado_guardado = instance.estado
+
+
+@receiver(pre_delete, sender=Pedido)
+def descontar_ventas_pedido_eliminado(sender, instance, **kwargs):
+    """Un pedido entregado que se elimina deja de contar en las ventas (sus líneas aún existen)"""
+    # Al moverlo al archivo sus líneas siguen contando (ver services/archivo_pedidos.py)
+    if instance.estado == 'entregado' and not ArchivoPedidos.moviendo(instance.pk):
+        EventosPedido.actualizar_ventas([(instance.pk, 'entregado', '')])
+
+
+@receiver(post_save, sender=Pedido)
+@receiver(post_delete, sender=Pedido)
+def invalidar_resumen_pedidos(sender, instance, **kwargs):
+    """Un pedido nuevo o con otro estado cambia el resumen del historial de su dueño"""
+    HistorialPedidos.invalidar(instance.usuario_id)
+
+
+@receiver(user_logged_in)
+def fusionar_carrito_al_iniciar_sesion(sender, request, user, **kwargs):
+    """Completar el carrito anónimo de la sesión con el carrito guardado del usuario"""
+    if request is not None and hasattr(request, 'session'):
+        CarritoSesion.fusionar(request, user)
+
+
+@receiver(user_logged_out)
+def guardar_carrito_al_cerrar_sesion(sender, request, user, **kwargs):
+    """Guardar el carrito de la sesión antes de que se borre la sesión"""
+    if request is None or user is None or not hasattr(request, 'session'):
+        return
+    carrito = CarritoSesion(request)
+    if carrito:
+        carrito.guardar(user)
@@ -3,7 +3,7 @@ Pruebas unitarias para la aplicación tienda
 """
 from django.test import TestCase
 from django.contrib.auth import get_user_model
-from tienda.models import Categoria, Producto, Talla, CarritoCompras
+from tienda.models import Categoria, Producto, Talla, CarritoCompras, ItemCarrito
 from decimal import Decimal
 
 User = get_user_model()
@@ -49,5 +49,1666 @@ class ProductoTestCase(TestCase):
         Talla.objects.create(producto=self.producto, talla='L', stock=8)
 
         # El stock total debe ser la suma de todas las tallas
-        stock_total = self.producto.stock_total()
+        self.producto.refresh_from_db()
+        stock_total = self.producto.stock_total
         self.assertEqual(stock_total, 33)  # 10 + 15 + 8 = 33
+
+    def test_stock_total_sincronizado_con_tallas(self):
+        """Prueba 3: stock_total y en_stock se mantienen al editar, reducir y borrar tallas"""
+        talla_s = Talla.objects.create(producto=self.producto, talla='S', stock=2)
+        talla_m = Talla.objects.create(producto=self.producto, talla='M', stock=3)
+
+        talla_m.stock = 1
+        talla_m.save()
+        self.assertTrue(talla_s.reducir_stock(2))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_total, 1)
+        self.assertTrue(self.producto.en_stock)
+
+        talla_m.delete()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_total, 0)
+        self.assertFalse(self.producto.en_stock)
+        self.assertFalse(Producto.objects.filter(en_stock=True).exists())
+
+    def test_guardar_instancia_vieja_no_pisa_el_stock(self):
+        """Prueba 4: guardar un producto cargado antes de cambiar sus tallas conserva stock_total y en_stock"""
+        Talla.objects.create(producto=self.producto, talla='S', stock=4)
+
+        self.producto.nombre = "Camisa Renombrada"
+        self.producto.save()
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.nombre, "Camisa Renombrada")
+        self.assertEqual(self.producto.stock_total, 4)
+        self.assertTrue(self.producto.en_stock)
+
+
+class FacetasCatalogoTestCase(TestCase):
+    """
+    Pruebas del motor de facetas del catálogo
+    """
+
+    def setUp(self):
+        self.camisas = Categoria.objects.create(nombre="Camisas", descripcion="Camisas")
+        self.pantalones = Categoria.objects.create(nombre="Pantalones", descripcion="Pantalones")
+        datos = [
+            ("Camisa Roja", "Rojo", "Nike", self.camisas, '30000.00', {'M': 2}),
+            ("Camisa Azul", "Azul", "Nike", self.camisas, '60000.00', {'M': 0, 'L': 3}),
+            ("Pantalón Azul", "Azul", "Levis", self.pantalones, '150000.00', {'S': 1}),
+        ]
+        for nombre, color, marca, categoria, precio, tallas in datos:
+            producto = Producto.objects.create(
+                nombre=nombre, descripcion=nombre, precio=Decimal(precio),
+                marca=marca, color=color, material="Algodón", categoria=categoria
+            )
+            for talla, stock in tallas.items():
+                Talla.objects.create(producto=producto, talla=talla, stock=stock)
+
+    def test_conteos_excluyen_el_filtro_propio(self):
+        """Cada faceta cuenta con los demás filtros aplicados, en una sola consulta"""
+        from tienda.services.catalogo import FiltrosCatalogo
+        from tienda.services.facetas import FacetasCatalogo
+
+        filtros = FiltrosCatalogo.desde_parametros({'color': 'azul'})
+        with self.assertNumQueries(1):
+            facetas = FacetasCatalogo.calcular(filtros)
+
+        self.assertEqual(facetas['total'], 2)
+        self.assertEqual(facetas['colores'], [{'valor': 'Azul', 'total': 2}, {'valor': 'Rojo', 'total': 1}])
+        self.assertEqual(facetas['marcas'], [{'valor': 'Levis', 'total': 1}, {'valor': 'Nike', 'total': 1}])
+        self.assertEqual(facetas['tallas'], [{'valor': 'S', 'total': 1}, {'valor': 'L', 'total': 1}])
+        self.assertEqual([r['total'] for r in facetas['precios']], [1, 1])
+
+    def test_cache_se_invalida_al_cambiar_tallas(self):
+        """Las facetas en caché se recalculan cuando cambia el stock"""
+        from tienda.services.catalogo import FiltrosCatalogo
+        from tienda.services.facetas import FacetasCatalogo
+
+        filtros = FiltrosCatalogo.desde_parametros({'talla': 'm'})
+        self.assertEqual(FacetasCatalogo.obtener(filtros)['total'], 1)
+        with self.assertNumQueries(0):
+            FacetasCatalogo.obtener(filtros)
+
+        Talla.objects.filter(talla='M', stock=0).update(stock=4)
+        Talla.objects.get(talla='L').save()
+        self.assertEqual(FacetasCatalogo.obtener(filtros)['total'], 2)
+
+
+class PaginacionKeysetTestCase(TestCase):
+    """
+    Pruebas de la paginación por cursor del catálogo
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        for i in range(7):
+            Producto.objects.create(
+                nombre=f"Producto {i}", descripcion="Desc", precio=Decimal('10000.00'),
+                marca="Marca", color="Negro", material="Algodón", categoria=categoria
+            )
+
+    def test_recorrer_paginas_adelante_y_atras(self):
+        """Los cursores recorren todo el listado sin repetir y permiten volver atrás"""
+        from tienda.services.paginacion import PaginadorKeyset
+
+        paginador = PaginadorKeyset(Producto.objects.all(), por_pagina=3)
+        esperado = list(Producto.objects.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+
+        vistos, cursor, paginas = [], None, []
+        while True:
+            pagina = paginador.pagina(cursor, total=7)
+            paginas.append(pagina)
+            vistos.extend(p.id for p in pagina)
+            if not pagina.has_next():
+                break
+            cursor = pagina.cursor_siguiente
+
+        self.assertEqual(vistos, esperado)
+        self.assertEqual(len(paginas), 3)
+        self.assertFalse(paginas[0].has_previous())
+
+        anterior = paginador.pagina(paginas[2].cursor_anterior, total=7)
+        self.assertEqual([p.id for p in anterior], [p.id for p in paginas[1]])
+        self.assertTrue(anterior.has_next())
+
+    def test_cursor_invalido_devuelve_primera_pagina(self):
+        """Un cursor manipulado no falla: se muestra la primera página"""
+        from tienda.services.paginacion import PaginadorKeyset
+
+        paginador = PaginadorKeyset(Producto.objects.all(), por_pagina=3)
+        pagina = paginador.pagina('no-es-un-cursor', total=7)
+        self.assertEqual(len(pagina), 3)
+        self.assertFalse(pagina.has_previous())
+
+
+class BusquedaTextoCompletoTestCase(TestCase):
+    """
+    Pruebas del índice de búsqueda de texto completo
+    """
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre="Pantalones", descripcion="Inferiores")
+        self.pantalon = Producto.objects.create(
+            nombre="Pantalón Formal Gris", descripcion="Corte recto", precio=Decimal('90000.00'),
+            marca="Elegance", color="Gris", material="Lana", categoria=self.categoria
+        )
+        self.camisa = Producto.objects.create(
+            nombre="Camisa Básica", descripcion="Para combinar con pantalón", precio=Decimal('40000.00'),
+            marca="BasicWear", color="Blanco", material="Algodón", categoria=self.categoria
+        )
+
+    def test_busqueda_sin_tildes_ordenada_por_relevancia(self):
+        """'pantalon' encuentra 'Pantalón' y prioriza coincidencias en el nombre"""
+        from tienda.services.busqueda import IndiceBusqueda
+
+        self.assertEqual(IndiceBusqueda.buscar_ids('pantalon'), [self.pantalon.id, self.camisa.id])
+        self.assertEqual(IndiceBusqueda.buscar_ids('BASICA'), [self.camisa.id])
+        resultado = IndiceBusqueda.filtrar(Producto.objects.all(), 'pantal gris')
+        self.assertEqual(list(resultado), [self.pantalon])
+
+    def test_catalogo_ordena_la_busqueda_por_relevancia(self):
+        """Con búsqueda el catálogo lista primero la coincidencia en el nombre, aunque sea más antigua"""
+        from django.urls import reverse
+
+        html = self.client.get(reverse('tienda:productos'), {'busqueda': 'pantalon'}).content.decode()
+        self.assertLess(html.index("Pantalón Formal Gris"), html.index("Camisa Básica"))
+        # Con paginación por cursor también (la búsqueda se pagina por número)
+        with self.settings(CATALOGO_PAGINACION_KEYSET=True):
+            html = self.client.get(reverse('tienda:productos'), {'busqueda': 'pantalon', 'page': 1}).content.decode()
+        self.assertLess(html.index("Pantalón Formal Gris"), html.index("Camisa Básica"))
+
+    def test_indice_se_actualiza_al_guardar_y_borrar(self):
+        """Los cambios de producto y categoría se reflejan en el índice"""
+        from tienda.services.busqueda import IndiceBusqueda
+
+        self.camisa.nombre = "Blusa Rosa"
+        self.camisa.save()
+        self.assertEqual(IndiceBusqueda.buscar_ids('blusa'), [self.camisa.id])
+
+        self.categoria.nombre = "Básicos"
+        self.categoria.save()
+        self.assertEqual(len(IndiceBusqueda.buscar_ids('basicos')), 2)
+
+        self.pantalon.delete()
+        self.assertEqual(IndiceBusqueda.buscar_ids('gris'), [])
+
+
+class AutocompletadoTestCase(TestCase):
+    """
+    Pruebas del índice de autocompletado en memoria
+    """
+
+    def setUp(self):
+        from tienda.services.autocompletado import IndiceAutocompletado
+        IndiceAutocompletado.reiniciar()
+        self.categoria = Categoria.objects.create(nombre="Vestidos", descripcion="Vestidos")
+        self.vestido = Producto.objects.create(
+            nombre="Vestido Negro Básico", descripcion="Desc", precio=Decimal('80000.00'),
+            marca="Glam", color="Negro", material="Seda", categoria=self.categoria
+        )
+        self.blusa = Producto.objects.create(
+            nombre="Blusa Rosa", descripcion="Desc", precio=Decimal('50000.00'),
+            marca="Glam", color="Negro", material="Seda", categoria=self.categoria
+        )
+
+    def tearDown(self):
+        from tienda.services.autocompletado import IndiceAutocompletado
+        IndiceAutocompletado.reiniciar()
+
+    def test_busqueda_por_prefijo_sin_consultas(self):
+        """Tras la carga, las consultas se responden sin tocar la base de datos"""
+        from tienda.services.autocompletado import IndiceAutocompletado
+
+        IndiceAutocompletado.cargar()
+        with self.assertNumQueries(0):
+            resultados = IndiceAutocompletado.buscar('basico')
+            self.assertEqual([r['id'] for r in resultados], [self.vestido.id])
+            # Coincidencias en el nombre primero
+            self.assertEqual([r['id'] for r in IndiceAutocompletado.buscar('neg')], [self.vestido.id, self.blusa.id])
+            self.assertEqual(IndiceAutocompletado.buscar('glam vestidos rosa')[0]['nombre'], "Blusa Rosa")
+
+        estadisticas = IndiceAutocompletado.estadisticas()
+        self.assertEqual(estadisticas['productos'], 2)
+        self.assertEqual(estadisticas['tasa_aciertos'], 1.0)
+
+    def test_actualizacion_incremental_por_senales(self):
+        """Los cambios de stock, nombre y borrado se reflejan sin recargar"""
+        from tienda.services.autocompletado import IndiceAutocompletado
+
+        IndiceAutocompletado.cargar()
+        Talla.objects.create(producto=self.blusa, talla='S', stock=4)
+        self.assertEqual(IndiceAutocompletado.buscar('blusa')[0]['stock_total'], 4)
+
+        self.blusa.refresh_from_db()
+        self.blusa.nombre = "Camisa Rosa"
+        self.blusa.save()
+        self.assertEqual(IndiceAutocompletado.buscar('blusa'), [])
+        self.assertEqual(IndiceAutocompletado.buscar('camisa')[0]['id'], self.blusa.id)
+        self.assertEqual(IndiceAutocompletado.buscar('camisa')[0]['stock_total'], 4)
+
+        self.vestido.delete()
+        self.assertEqual(IndiceAutocompletado.buscar('vestido basico'), [])
+
+
+class CacheFragmentosTestCase(TestCase):
+    """
+    Pruebas de la caché de fragmentos del catálogo
+    """
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Chaqueta Jean", descripcion="Desc", precio=Decimal('120000.00'),
+            marca="Denim", color="Azul", material="Jean", categoria=self.categoria
+        )
+
+    def test_grid_en_cache_hasta_que_cambia_el_catalogo(self):
+        """Un acierto no consulta productos; una edición invalida la entrada"""
+        from django.urls import reverse
+
+        url = reverse('tienda:productos')
+        self.client.get(url)
+        # Facetas y grid salen de la caché: ninguna consulta al catálogo
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(url)
+        self.assertContains(respuesta, "Chaqueta Jean")
+
+        self.producto.nombre = "Chaqueta Denim"
+        self.producto.save()
+        respuesta = self.client.get(url)
+        self.assertContains(respuesta, "Chaqueta Denim")
+        self.assertNotContains(respuesta, "Chaqueta Jean")
+
+
+class ImagenProductoTestCase(TestCase):
+    """
+    Pruebas de la resolución de imágenes sin consultas extra
+    """
+
+    def setUp(self):
+        from tienda.models import ImagenProducto
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Falda", descripcion="Desc", precio=Decimal('70000.00'),
+            marca="Glam", color="Rojo", material="Lino", categoria=categoria
+        )
+        self.primera = ImagenProducto.objects.create(producto=self.producto, imagen='productos/a.jpg', orden=0)
+        self.segunda = ImagenProducto.objects.create(producto=self.producto, imagen='productos/b.jpg', orden=1)
+
+    def test_imagen_resuelta_se_mantiene(self):
+        """La imagen resuelta sigue a la marcada como principal y a los borrados"""
+        producto = Producto.objects.get(pk=self.producto.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(producto.obtener_imagen_principal().endswith('productos/a.jpg'))
+
+        self.segunda.es_principal = True
+        self.segunda.save()
+        producto.refresh_from_db()
+        self.assertTrue(producto.obtener_imagen_principal().endswith('productos/b.jpg'))
+
+        self.segunda.delete()
+        self.primera.delete()
+        producto.refresh_from_db()
+        self.assertIsNone(producto.obtener_imagen_principal())
+
+    def test_usa_imagenes_precargadas(self):
+        """Con prefetch_related('imagenes') se resuelve en memoria"""
+        self.segunda.es_principal = True
+        self.segunda.save()
+        productos = list(Producto.objects.prefetch_related('imagenes'))
+        with self.assertNumQueries(0):
+            self.assertTrue(productos[0].obtener_imagen_principal().endswith('productos/b.jpg'))
+
+
+class ProductoCatalogoTestCase(TestCase):
+    """
+    Pruebas del modelo de lectura del catálogo
+    """
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre="Pantalones", descripcion="Pantalones")
+        self.producto = Producto.objects.create(
+            nombre="Jean Slim", descripcion="Desc", precio=Decimal('90000.00'),
+            marca="Denim", color="Azul", material="Mezclilla", categoria=self.categoria
+        )
+        self.talla_m = Talla.objects.create(producto=self.producto, talla='M', stock=4)
+        Talla.objects.create(producto=self.producto, talla='S', stock=0)
+
+    def test_fila_sincronizada_con_escrituras(self):
+        """Tallas, imagen, categoría y borrado se reflejan en la fila"""
+        from tienda.models import ImagenProducto, ProductoCatalogo
+
+        fila = ProductoCatalogo.objects.get(pk=self.producto.pk)
+        self.assertEqual(fila.categoria_nombre, "Pantalones")
+        self.assertEqual((fila.stock_total, fila.en_stock), (4, True))
+        self.assertEqual(fila.tallas, {'M': 4})
+
+        ImagenProducto.objects.create(producto=self.producto, imagen='productos/jean.jpg')
+        self.categoria.nombre = "Jeans"
+        self.categoria.save()
+        self.talla_m.delete()
+        fila.refresh_from_db()
+        self.assertTrue(fila.imagen_url.endswith('productos/jean.jpg'))
+        self.assertEqual(fila.categoria_nombre, "Jeans")
+        self.assertEqual((fila.stock_total, fila.en_stock, fila.tallas), (0, False, {}))
+
+        self.producto.delete()
+        self.assertFalse(ProductoCatalogo.objects.exists())
+
+    def test_filtros_y_reconstruccion(self):
+        """Los filtros del catálogo funcionan sobre la fila y el comando la regenera"""
+        from io import StringIO
+        from django.core.management import call_command
+        from tienda.models import ProductoCatalogo
+        from tienda.services.catalogo import FiltrosCatalogo
+
+        ProductoCatalogo.objects.all().delete()
+        call_command('reconstruir_catalogo', stdout=StringIO())
+
+        for talla, esperado in (('M', [self.producto.pk]), ('S', [])):
+            filtros = FiltrosCatalogo.desde_parametros({'talla': talla, 'marca': 'denim'})
+            with self.assertNumQueries(1):
+                ids = list(filtros.aplicar(ProductoCatalogo.objects.all()).values_list('pk', flat=True))
+            self.assertEqual(ids, esperado)
+
+
+class MascaraTallasTestCase(TestCase):
+    """
+    Pruebas de la máscara de bits de tallas con stock
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.camisa = Producto.objects.create(
+            nombre="Camisa", descripcion="Desc", precio=Decimal('60000.00'),
+            marca="Urban", color="Blanco", material="Lino", categoria=categoria
+        )
+        self.buzo = Producto.objects.create(
+            nombre="Buzo", descripcion="Desc", precio=Decimal('80000.00'),
+            marca="Urban", color="Gris", material="Algodón", categoria=categoria
+        )
+        self.talla_m = Talla.objects.create(producto=self.camisa, talla='M', stock=2)
+        Talla.objects.create(producto=self.camisa, talla='XS', stock=1)
+        Talla.objects.create(producto=self.buzo, talla='L', stock=0)
+
+    def test_construir_mascaras_desde_parametros(self):
+        """Acepta el parámetro repetido o separado por comas e ignora tallas desconocidas"""
+        from django.http import QueryDict
+        from tienda.services.tallas import MascaraTallas
+
+        self.assertEqual(MascaraTallas.desde_parametros(QueryDict('talla=m&talla=L')), 4 | 8)
+        self.assertEqual(MascaraTallas.desde_parametros({'talla': 'XL, s,XXL'}), 16 | 2)
+        self.assertEqual(MascaraTallas.desde_parametros({}), 0)
+        self.assertEqual(MascaraTallas.tallas(4 | 1), ['XS', 'M'])
+        self.assertEqual(MascaraTallas.valores_con_todas(31), [31])
+
+    def test_mascara_mantenida_y_filtrable(self):
+        """La máscara sigue los cambios de stock y "M o L" es un filtro de una sola tabla"""
+        from tienda.models import ProductoCatalogo
+        from tienda.services.tallas import MascaraTallas
+
+        self.camisa.refresh_from_db()
+        self.assertEqual(self.camisa.tallas_mascara, 1 | 4)
+
+        m_o_l = MascaraTallas.filtro(MascaraTallas.desde_tallas(['M', 'L']))
+        self.assertEqual(list(Producto.objects.filter(m_o_l)), [self.camisa])
+
+        self.talla_m.stock = 0
+        self.talla_m.save()
+        Talla.objects.filter(producto=self.buzo).update(stock=3)
+        Talla.objects.get(producto=self.buzo).save()
+        self.assertEqual(list(ProductoCatalogo.objects.filter(m_o_l).values_list('pk', flat=True)), [self.buzo.pk])
+
+
+class CheckoutTestCase(TestCase):
+    """
+    Pruebas del checkout transaccional
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.usuario = User.objects.create_user(username='cliente', email='c@c.com', password='x', nombre='Cliente')
+        self.producto = Producto.objects.create(
+            nombre="Chaqueta", descripcion="Desc", precio=Decimal('120000.00'),
+            marca="North", color="Negro", material="Cuero", categoria=categoria
+        )
+        self.talla_m = Talla.objects.create(producto=self.producto, talla='M', stock=3)
+        self.talla_l = Talla.objects.create(producto=self.producto, talla='L', stock=1)
+        self.carrito = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.producto, talla=self.talla_m, cantidad=2)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.producto, talla=self.talla_l, cantidad=1)
+
+    def test_confirmar_descuenta_stock_y_suma_ventas(self):
+        """Crea el pedido con sus líneas, descuenta stock y suma ventas en consultas fijas"""
+        from tienda.models import ProductoCatalogo
+        from tienda.services.checkout import ServicioCheckout
+
+        with self.assertNumQueries(17):
+            pedido = ServicioCheckout.confirmar(self.carrito, direccion='Calle 1')
+
+        self.assertEqual(pedido.total, Decimal('360000.00'))
+        self.assertEqual(pedido.itempedido_set.count(), 2)
+        self.talla_m.refresh_from_db()
+        self.talla_l.refresh_from_db()
+        self.assertEqual((self.talla_m.stock, self.talla_l.stock), (1, 0))
+        fila = ProductoCatalogo.objects.get(pk=self.producto.pk)
+        # Las ventas se cuentan al entregar el pedido
+        self.assertEqual((fila.total_vendidos, fila.stock_total, fila.tallas), (0, 1, {'M': 1}))
+        self.carrito.refresh_from_db()
+        self.assertFalse(self.carrito.activo)
+
+    def test_grid_en_cache_muestra_el_stock_tras_el_checkout(self):
+        """Una venta que no agota tallas también renueva la grilla cacheada"""
+        from django.urls import reverse
+        from tienda.services.cache_catalogo import VersionCatalogo
+        from tienda.services.checkout import ServicioCheckout
+
+        url = reverse('tienda:productos')
+        self.assertInHTML('<span class="badge bg-warning">4</span>', self.client.get(url).content.decode())
+        self.carrito.itemcarrito_set.filter(talla=self.talla_l).delete()
+        ServicioCheckout.confirmar(self.carrito, direccion='Calle 1')
+        self.assertInHTML('<span class="badge bg-warning">2</span>', self.client.get(url).content.decode())
+
+        # Un lote que no cambia ningún total no invalida las cachés
+        version = VersionCatalogo.obtener()
+        ServicioCheckout.refrescar_productos(self.producto.pk)
+        self.assertEqual(VersionCatalogo.obtener(), version)
+
+    def test_stock_insuficiente_no_guarda_nada(self):
+        """Si una talla no alcanza el pedido completo se revierte"""
+        from tienda.models import Pedido
+        from tienda.services.checkout import ServicioCheckout, StockInsuficiente
+
+        Talla.objects.filter(pk=self.talla_l.pk).update(stock=0)
+        with self.assertRaises(StockInsuficiente) as contexto:
+            ServicioCheckout.confirmar(self.carrito, direccion='Calle 1')
+
+        self.assertEqual([(t.pk, pedida) for t, pedida, _ in contexto.exception.faltantes], [(self.talla_l.pk, 1)])
+        self.assertFalse(Pedido.objects.exists())
+        self.talla_m.refresh_from_db()
+        self.assertEqual(self.talla_m.stock, 3)
+        self.carrito.refresh_from_db()
+        self.assertTrue(self.carrito.activo)
+
+    def test_procesar_pedido_usa_el_mismo_motor(self):
+        """Pedido.procesar_pedido crea las líneas y no permite procesar dos veces el carrito"""
+        from tienda.models import Pedido
+        from tienda.services.checkout import CarritoVacio, ServicioCheckout
+
+        pedido = Pedido.objects.create(usuario=self.usuario, total=Decimal('360000.00'), direccion_entrega='Calle 1')
+        pedido.procesar_pedido()
+        self.assertEqual(pedido.estado, 'procesando')
+        self.assertEqual(pedido.itempedido_set.count(), 2)
+        with self.assertRaises(CarritoVacio):
+            ServicioCheckout.confirmar(self.carrito, direccion='Calle 1')
+
+
+class ReservasStockTestCase(TestCase):
+    """
+    Pruebas de las reservas temporales de stock
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Tenis Drop", descripcion="Desc", precio=Decimal('300000.00'),
+            marca="Run", color="Blanco", material="Malla", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='M', stock=3)
+        self.carritos = [
+            CarritoCompras.objects.create(usuario=User.objects.create_user(
+                username=f'u{i}', email=f'u{i}@c.com', password='x', nombre=f'U{i}'
+            ))
+            for i in range(2)
+        ]
+
+    def test_reservas_descuentan_disponibilidad_y_vencen(self):
+        """Las reservas activas apartan unidades y las vencidas se barren en bloque"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from tienda.models import ReservaStock
+        from tienda.services.reservas import ReservasStock
+
+        primero, segundo = self.carritos
+        self.assertTrue(ReservasStock.reservar(primero.clave_reservas, self.talla, 2))
+        self.assertFalse(ReservasStock.reservar(segundo.clave_reservas, self.talla, 2))
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.reservado, self.talla.disponible), (2, 1))
+
+        # Guardar una instancia cargada antes de la reserva no pisa el contador
+        Talla.objects.get(pk=self.talla.pk).save()
+        ReservaStock.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(ReservasStock.reservar(segundo.clave_reservas, self.talla, 3))
+        self.assertEqual(list(ReservaStock.objects.values_list('clave_carrito', 'cantidad')), [(segundo.clave_reservas, 3)])
+
+        ReservaStock.objects.update(expira_en=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(ReservasStock.liberar_vencidas(), 3)
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.reservado, self.talla.disponible), (0, 3))
+
+    def test_checkout_convierte_reservas_en_venta(self):
+        """El checkout consume la reserva del carrito sin volver a bloquear la talla"""
+        from tienda.models import ReservaStock
+        from tienda.services.checkout import ServicioCheckout
+        from tienda.services.reservas import ReservasStock
+
+        primero, segundo = self.carritos
+        ReservasStock.reservar(primero.clave_reservas, self.talla, 2)
+        ItemCarrito.objects.create(carrito=primero, producto=self.producto, talla=self.talla, cantidad=2)
+        # Otro carrito se llevó la última unidad libre sin reservar
+        ReservasStock.reservar(segundo.clave_reservas, self.talla, 1)
+
+        ServicioCheckout.confirmar(primero, direccion='Calle 1')
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.reservado), (1, 1))
+        self.assertFalse(ReservaStock.objects.filter(clave_carrito=primero.clave_reservas).exists())
+
+    def test_agregar_rechaza_cantidad_no_valida(self):
+        """Una cantidad negativa, cero o no numérica no toca las reservas"""
+        from django.urls import reverse
+        from tienda.models import ReservaStock
+
+        url = reverse('tienda:agregar_al_carrito', args=[self.producto.pk])
+        self.client.post(url, {'talla_id': self.talla.pk, 'cantidad': 2})
+        for cantidad in ('-1', '0', 'dos'):
+            respuesta = self.client.post(url, {'talla_id': self.talla.pk, 'cantidad': cantidad})
+            self.assertRedirects(respuesta, reverse('tienda:producto_detalle', args=[self.producto.pk]))
+        self.assertEqual(list(ReservaStock.objects.values_list('cantidad', flat=True)), [2])
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.reservado, 2)
+
+
+class CarritoSesionTestCase(TestCase):
+    """
+    Pruebas del carrito guardado en la sesión
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Buzo Oversize", descripcion="Desc", precio=Decimal('90000.00'),
+            marca="Urban", color="Gris", material="Algodón", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='L', stock=5)
+        self.usuario = User.objects.create_user(
+            username='sesion', email='sesion@c.com', password='clave123', nombre='Sesion'
+        )
+
+    def agregar(self, cantidad):
+        from django.urls import reverse
+        return self.client.post(
+            reverse('tienda:agregar_al_carrito', args=[self.producto.pk]),
+            {'talla_id': self.talla.pk, 'cantidad': cantidad},
+        )
+
+    def test_visitante_agrega_sin_crear_carrito_en_bd(self):
+        """Un visitante agrega al carrito sin filas de CarritoCompras, solo con la reserva"""
+        from django.urls import reverse
+
+        self.agregar(2)
+        self.assertFalse(CarritoCompras.objects.exists())
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.reservado, 2)
+        respuesta = self.client.get(reverse('tienda:carrito'))
+        self.assertEqual(respuesta.context['carrito'].total, Decimal('180000.00'))
+
+    def test_iniciar_sesion_fusiona_carrito_guardado(self):
+        """Al iniciar sesión se completan las líneas con las guardadas, reservadas, y al cerrarla se guardan"""
+        from tienda.models import ReservaStock
+        from tienda.services.carrito import CarritoSesion
+
+        talla_m = Talla.objects.create(producto=self.producto, talla='M', stock=1)
+        guardado = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=guardado, producto=self.producto, talla=self.talla, cantidad=4)
+        ItemCarrito.objects.create(carrito=guardado, producto=self.producto, talla=talla_m, cantidad=3)
+
+        self.agregar(2)
+        esperadas = {str(self.talla.pk): [self.producto.pk, 4], str(talla_m.pk): [self.producto.pk, 1]}
+        self.client.login(email='sesion@c.com', password='clave123')
+        self.assertEqual(self.client.session[CarritoSesion.CLAVE_SESION]['lineas'], esperadas)
+        # Volver a iniciar sesión con la misma sesión no duplica ni reserva de más
+        self.client.login(email='sesion@c.com', password='clave123')
+        self.assertEqual(self.client.session[CarritoSesion.CLAVE_SESION]['lineas'], esperadas)
+        self.assertEqual(
+            dict(ReservaStock.objects.values_list('talla_id', 'cantidad')), {self.talla.pk: 4, talla_m.pk: 1}
+        )
+
+        self.client.logout()
+        self.assertEqual(
+            sorted(guardado.itemcarrito_set.values_list('talla_id', 'cantidad')), [(self.talla.pk, 4), (talla_m.pk, 1)]
+        )
+
+    def test_checkout_desde_la_sesion_consume_reservas(self):
+        """El checkout guarda el carrito de la sesión y convierte sus reservas en venta"""
+        from django.urls import reverse
+        from tienda.models import Pedido, ReservaStock
+
+        self.client.login(email='sesion@c.com', password='clave123')
+        self.agregar(2)
+        self.client.post(reverse('tienda:checkout'), {'direccion': 'Calle 1'})
+
+        pedido = Pedido.objects.get(usuario=self.usuario)
+        self.assertEqual(pedido.total, Decimal('180000.00'))
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.reservado), (3, 0))
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertEqual(self.client.session['carrito']['lineas'], {})
+
+
+class TotalesCarritoTestCase(TestCase):
+    """
+    Pruebas de los totales del carrito calculados en SQL
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Gorra Snap", descripcion="Desc", precio=Decimal('50000.00'),
+            marca="Cap", color="Negro", material="Lona", categoria=categoria
+        )
+        self.talla_s = Talla.objects.create(producto=self.producto, talla='S', stock=10)
+        self.talla_m = Talla.objects.create(producto=self.producto, talla='M', stock=10)
+        usuario = User.objects.create_user(username='tot', email='tot@c.com', password='x', nombre='Tot')
+        self.carrito = CarritoCompras.objects.create(usuario=usuario)
+
+    def test_calcular_total_en_una_consulta(self):
+        """El total sale de un SUM en SQL sin cargar las líneas"""
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.producto, talla=self.talla_s, cantidad=1)
+        ItemCarrito.objects.create(carrito=self.carrito, producto=self.producto, talla=self.talla_m, cantidad=2)
+        # SELECT SUM(cantidad * precio) y UPDATE del total
+        with self.assertNumQueries(2):
+            self.assertEqual(self.carrito.calcular_total(), Decimal('150000.00'))
+
+        self.carrito.refresh_from_db()
+        self.assertEqual(self.carrito.total, Decimal('150000.00'))
+
+
+class ApiCarritoTestCase(TestCase):
+    """
+    Pruebas de la API JSON del carrito
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Chaqueta Denim", descripcion="Desc", precio=Decimal('150000.00'),
+            marca="Blue", color="Azul", material="Denim", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='M', stock=4)
+
+    def post(self, nombre, **datos):
+        from django.urls import reverse
+        return self.client.post(reverse(f'tienda:{nombre}'), {'talla_id': self.talla.pk, **datos})
+
+    def test_agregar_devuelve_linea_y_totales(self):
+        """Agregar responde con la línea cambiada y el resumen, sin redirigir"""
+        respuesta = self.post('api_carrito_agregar', cantidad=2)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos['carrito'], {'lineas': 1, 'unidades': 2, 'total': 300000.0})
+        self.assertEqual((datos['linea']['cantidad'], datos['linea']['disponible']), (2, 2))
+
+        respuesta = self.post('api_carrito_agregar', cantidad=3)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['carrito']['unidades'], 2)
+
+    def test_actualizar_y_quitar_ajustan_reservas(self):
+        """Bajar la cantidad devuelve la diferencia y quitar libera la reserva"""
+        self.post('api_carrito_agregar', cantidad=3)
+        datos = self.post('api_carrito_actualizar', cantidad=1).json()
+        self.assertEqual((datos['linea']['cantidad'], datos['carrito']['total']), (1, 150000.0))
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.reservado, 1)
+
+        datos = self.post('api_carrito_quitar').json()
+        self.assertIsNone(datos['linea'])
+        self.assertEqual(datos['carrito'], {'lineas': 0, 'unidades': 0, 'total': 0.0})
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.reservado, 0)
+        self.assertEqual(self.post('api_carrito_actualizar', cantidad=2).status_code, 404)
+
+
+    def test_listar_lineas_fraccionadas_sin_consulta_por_talla(self):
+        """Las unidades libres de las tallas fraccionadas se leen con las tallas, no línea por línea"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+        from tienda.services.fracciones import StockFraccionado
+
+        def consultas_y_lineas():
+            with CaptureQueriesContext(connection) as consultas:
+                lineas = self.client.get(reverse('tienda:api_carrito')).json()['lineas']
+            return len(consultas), [(linea['cantidad'], linea['disponible']) for linea in lineas]
+
+        otra = Talla.objects.create(producto=self.producto, talla='L', stock=6)
+        for talla in (self.talla, otra):
+            StockFraccionado.activar(talla.pk, fracciones=4)
+        self.post('api_carrito_agregar', cantidad=1)
+        una, lineas = consultas_y_lineas()
+        self.assertEqual(lineas, [(1, 3)])
+
+        self.client.post(reverse('tienda:api_carrito_agregar'), {'talla_id': otra.pk, 'cantidad': 2})
+        dos, lineas = consultas_y_lineas()
+        self.assertEqual(lineas, [(1, 3), (2, 4)])
+        self.assertEqual(dos, una)
+
+class IdempotenciaTestCase(TestCase):
+    """
+    Pruebas de las claves de idempotencia en checkout y cambios de estado
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Camisa Lino", descripcion="Desc", precio=Decimal('70000.00'),
+            marca="Soft", color="Beige", material="Lino", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='S', stock=5)
+        self.usuario = User.objects.create_user(
+            username='idem', email='idem@c.com', password='clave123', nombre='Idem', is_staff=True
+        )
+        self.client.login(email='idem@c.com', password='clave123')
+
+    def test_reintento_de_checkout_no_duplica_pedido(self):
+        """El reenvío con la misma clave devuelve la misma respuesta sin tocar el stock"""
+        from django.urls import reverse
+        from tienda.models import Pedido
+
+        self.client.post(
+            reverse('tienda:agregar_al_carrito', args=[self.producto.pk]),
+            {'talla_id': self.talla.pk, 'cantidad': 2},
+        )
+        datos = {'direccion': 'Calle 1', 'clave_idempotencia': 'pago-1'}
+        primera = self.client.post(reverse('tienda:checkout'), datos)
+        repetida = self.client.post(reverse('tienda:checkout'), datos)
+
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(repetida.status_code, primera.status_code)
+        self.assertEqual(repetida['Location'], primera['Location'])
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.stock, 3)
+
+    def test_reintento_de_cambio_de_estado(self):
+        """La cabecera Idempotency-Key repite la respuesta y rechaza otros datos con la misma clave"""
+        import json
+        from django.urls import reverse
+        from tienda.models import Pedido
+
+        pedido = Pedido.objects.create(usuario=self.usuario, total=Decimal('1.00'), direccion_entrega='x')
+        url = reverse('tienda:cambiar_estado_pedido')
+
+        def enviar(estado):
+            return self.client.post(
+                url, json.dumps({'pedido_id': pedido.pk, 'nuevo_estado': estado}),
+                content_type='application/json', HTTP_IDEMPOTENCY_KEY='estado-1',
+            )
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        primera = enviar('enviado')
+        with CaptureQueriesContext(connection) as consultas:
+            repetida = enviar('enviado')
+        self.assertEqual(repetida.json(), primera.json())
+        # El reintento no vuelve a escribir el pedido
+        self.assertFalse([c for c in consultas.captured_queries if 'tienda_pedido' in c['sql']])
+        self.assertEqual(enviar('cancelado').status_code, 422)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.estado, 'enviado')
+
+
+class ColaPedidosTestCase(TestCase):
+    """
+    Pruebas del checkout en cola procesado por lotes
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Jogger Cargo", descripcion="Desc", precio=Decimal('110000.00'),
+            marca="Street", color="Verde", material="Algodón", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='M', stock=3)
+        self.usuario = User.objects.create_user(
+            username='cola', email='cola@c.com', password='clave123', nombre='Cola'
+        )
+
+    def test_checkout_en_cola_se_materializa_en_el_worker(self):
+        """El checkout solo registra el pedido; el lote crea líneas y descuenta stock"""
+        from django.test import override_settings
+        from django.urls import reverse
+        from tienda.models import Pedido
+        from tienda.services.cola_pedidos import ColaPedidos
+
+        self.client.login(email='cola@c.com', password='clave123')
+        self.client.post(
+            reverse('tienda:agregar_al_carrito', args=[self.producto.pk]),
+            {'talla_id': self.talla.pk, 'cantidad': 2},
+        )
+        with override_settings(CHECKOUT_EN_COLA=True):
+            self.client.post(reverse('tienda:checkout'), {'direccion': 'Calle 1'})
+
+        pedido = Pedido.objects.get(usuario=self.usuario)
+        self.assertEqual((pedido.estado, pedido.itempedido_set.count()), ('pendiente', 0))
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.reservado), (3, 2))
+
+        self.assertEqual(ColaPedidos.procesar_lote(), (1, 0))
+        pedido.refresh_from_db()
+        self.talla.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual((pedido.estado, pedido.itempedido_set.count()), ('procesando', 1))
+        self.assertEqual((self.talla.stock, self.talla.reservado), (1, 0))
+        pedido.actualizar_estado('entregado')
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.total_vendidos, 2)
+
+    def test_lote_falla_solo_los_pedidos_sin_stock(self):
+        """En el mismo lote se venden los primeros pedidos y se cancelan los que no alcanzan"""
+        from tienda.services.cola_pedidos import ColaPedidos
+
+        lineas = [(self.producto.pk, self.talla.pk, 2, self.producto.precio)]
+        primero = ColaPedidos.encolar(self.usuario, lineas, 'Calle 1')
+        segundo = ColaPedidos.encolar(self.usuario, lineas, 'Calle 2')
+        self.assertEqual(ColaPedidos.estadisticas()['profundidad'], 2)
+
+        self.assertEqual(ColaPedidos.procesar_lote(), (1, 1))
+        primero.refresh_from_db()
+        segundo.refresh_from_db()
+        self.assertEqual((primero.estado, segundo.estado), ('procesando', 'cancelado'))
+        self.assertIn('No hay stock suficiente', segundo.trabajo.error)
+        metricas = ColaPedidos.estadisticas()
+        self.assertEqual((metricas['profundidad'], metricas['fallidos'], metricas['muestra']), (0, 1, 2))
+        self.assertEqual(ColaPedidos.procesar_lote(), (0, 0))
+
+    def test_pedido_cancelado_en_cola_no_se_vende(self):
+        """Si el pedido sale de 'pendiente' antes del worker, el trabajo se descarta y libera sus reservas"""
+        from tienda.models import CambioEstadoPedido, ReservaStock
+        from tienda.services.cola_pedidos import ColaPedidos
+        from tienda.services.estados_pedido import TransicionesPedido
+        from tienda.services.reservas import ReservasStock
+
+        ReservasStock.reservar('carrito:cola', self.talla, 2)
+        lineas = [(self.producto.pk, self.talla.pk, 2, self.producto.precio)]
+        pedido = ColaPedidos.encolar(self.usuario, lineas, 'Calle 1', 'carrito:cola')
+        TransicionesPedido.aplicar([pedido.pk], 'cancelado')
+
+        self.assertEqual(ColaPedidos.procesar_lote(), (0, 1))
+        pedido.refresh_from_db()
+        self.talla.refresh_from_db()
+        self.assertEqual((pedido.estado, pedido.itempedido_set.count()), ('cancelado', 0))
+        self.assertEqual((self.talla.stock, self.talla.reservado), (3, 0))
+        self.assertFalse(ReservaStock.objects.exists())
+        self.assertIn('ya no está pendiente', pedido.trabajo.error)
+        self.assertEqual(
+            list(CambioEstadoPedido.objects.filter(pedido=pedido).order_by('pk').values_list('estado_nuevo', flat=True)),
+            ['pendiente', 'cancelado']
+        )
+
+
+class InventarioStockTestCase(TestCase):
+    """
+    Pruebas del libro de movimientos de stock
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Short Playa", descripcion="Desc", precio=Decimal('45000.00'),
+            marca="Sun", color="Rojo", material="Poliéster", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='L', stock=5)
+        self.usuario = User.objects.create_user(username='inv', email='inv@c.com', password='x', nombre='Inv')
+
+    def test_reposiciones_pendientes_se_compactan_por_lotes(self):
+        """Las entradas solo insertan filas y la compactación las suma a Talla.stock"""
+        from tienda.services.inventario import InventarioStock
+
+        with self.assertNumQueries(1):
+            InventarioStock.reponer(self.talla.pk, 4)
+        InventarioStock.reponer(self.talla.pk, 1)
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.stock, 5)
+        self.assertEqual(InventarioStock.stock_actual(self.talla.pk), {self.talla.pk: 10})
+
+        self.assertEqual(InventarioStock.compactar(tamano_lote=1), 2)
+        self.talla.refresh_from_db()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.producto.stock_total), (10, 10))
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+    def test_ventas_ajustes_y_cancelaciones_cuadran_con_el_libro(self):
+        """Ventas, ajustes y cancelaciones quedan en el libro, que se puede consolidar y repetir"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from tienda.models import MovimientoStock
+        from tienda.services.checkout import ServicioCheckout
+        from tienda.services.inventario import InventarioStock
+
+        carrito = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=carrito, producto=self.producto, talla=self.talla, cantidad=2)
+        pedido = ServicioCheckout.confirmar(carrito, direccion='Calle 1')
+        talla = Talla.objects.get(pk=self.talla.pk)
+        talla.stock = 1
+        talla.save()
+        pedido.actualizar_estado('cancelado')
+        InventarioStock.compactar()
+
+        self.talla.refresh_from_db()
+        self.assertEqual(self.talla.stock, 3)
+        self.assertEqual(
+            list(MovimientoStock.objects.order_by('pk').values_list('tipo', 'cantidad')),
+            [('inicial', 5), ('venta', -2), ('ajuste', -2), ('cancelacion', 2)]
+        )
+        self.assertEqual(InventarioStock.consolidar(timezone.now() + timedelta(seconds=1)), 4)
+        self.assertEqual(
+            list(MovimientoStock.objects.order_by('pk').values_list('tipo', 'cantidad', 'consolidado')),
+            [('inicial', 5, True), ('venta', -2, True), ('ajuste', -2, True), ('cancelacion', 2, True),
+             ('saldo', 3, False)]
+        )
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+        # Un segundo saldo resume el anterior sin volver a contar los movimientos ya consolidados
+        talla = Talla.objects.get(pk=self.talla.pk)
+        talla.stock = 4
+        talla.save()
+        self.assertEqual(InventarioStock.consolidar(timezone.now() + timedelta(seconds=2)), 2)
+        self.assertEqual(MovimientoStock.objects.count(), 7)
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(consolidado=False).values_list('tipo', 'cantidad')), [('saldo', 4)]
+        )
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+        Talla.objects.filter(pk=self.talla.pk).update(stock=7)
+        self.assertEqual(InventarioStock.reconciliar(), [(self.talla.pk, 7, 4)])
+
+
+class StockFraccionadoTestCase(TestCase):
+    """
+    Pruebas de las tallas con el stock fraccionado
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Gorra Lanzamiento", descripcion="Desc", precio=Decimal('30000.00'),
+            marca="Sun", color="Negro", material="Algodón", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='M', stock=10)
+        self.usuario = User.objects.create_user(username='frac', email='frac@c.com', password='x', nombre='Frac')
+
+    def test_activar_y_desactivar_conservan_el_stock(self):
+        """Las unidades libres se reparten en las fracciones y las reservadas siguen retenidas"""
+        from tienda.models import FraccionStock, ProductoCatalogo
+        from tienda.services.fracciones import StockFraccionado
+        from tienda.services.inventario import InventarioStock
+        from tienda.services.reservas import ReservasStock
+
+        ReservasStock.reservar('carrito:a', self.talla, 3)
+        self.assertTrue(StockFraccionado.activar(self.talla.pk, fracciones=4))
+        self.assertEqual(
+            list(FraccionStock.objects.filter(talla=self.talla).order_by('indice').values_list('stock', flat=True)),
+            [2, 2, 2, 1]
+        )
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.reservado, self.talla.disponible), (0, 0, 7))
+        self.assertEqual(InventarioStock.stock_actual(self.talla.pk), {self.talla.pk: 10})
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+        ReservasStock.liberar('carrito:a')
+        Producto.recalcular_stock_de(self.producto.pk)
+        ProductoCatalogo.sincronizar(self.producto.pk)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_total, 10)
+        self.assertEqual(ProductoCatalogo.objects.get(pk=self.producto.pk).tallas, {'M': 10})
+
+        ReservasStock.reservar('carrito:b', self.talla, 2)
+        self.assertTrue(StockFraccionado.desactivar(self.talla.pk))
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.reservado, self.talla.fracciones), (10, 2, 0))
+        self.assertFalse(FraccionStock.objects.filter(talla=self.talla).exists())
+
+    def test_checkout_descuenta_de_las_fracciones(self):
+        """El checkout toma de las fracciones las unidades no reservadas y falla si no alcanzan"""
+        from django.db.models import Sum
+        from tienda.models import FraccionStock, ReservaStock
+        from tienda.services.checkout import ServicioCheckout, StockInsuficiente
+        from tienda.services.fracciones import StockFraccionado
+        from tienda.services.inventario import InventarioStock
+        from tienda.services.reservas import ReservasStock
+
+        StockFraccionado.activar(self.talla.pk, fracciones=4)
+        self.talla.refresh_from_db()
+        carrito = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=carrito, producto=self.producto, talla=self.talla, cantidad=6)
+        ReservasStock.reservar(carrito.clave_reservas, self.talla, 2)
+        ServicioCheckout.confirmar(carrito, direccion='Calle 1')
+
+        self.assertEqual(FraccionStock.objects.filter(talla=self.talla).aggregate(total=Sum('stock'))['total'], 4)
+        self.assertFalse(ReservaStock.objects.exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_total, 4)
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+        otro = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=otro, producto=self.producto, talla=self.talla, cantidad=5)
+        with self.assertRaises(StockInsuficiente):
+            ServicioCheckout.confirmar(otro, direccion='Calle 1')
+        self.assertEqual(FraccionStock.objects.filter(talla=self.talla).aggregate(total=Sum('stock'))['total'], 4)
+
+    def test_reducir_stock_se_registra_como_venta(self):
+        """Con o sin fracciones, reducir_stock deja una venta en el libro y el libro cuadra"""
+        from tienda.models import MovimientoStock
+        from tienda.services.fracciones import StockFraccionado
+        from tienda.services.inventario import InventarioStock
+
+        self.assertTrue(self.talla.reducir_stock(2))
+        StockFraccionado.activar(self.talla.pk, fracciones=4)
+        self.talla.refresh_from_db()
+        self.assertTrue(self.talla.reducir_stock(3))
+
+        self.assertEqual(
+            list(MovimientoStock.objects.filter(talla=self.talla).order_by('pk').values_list('tipo', 'cantidad')),
+            [('inicial', 10), ('venta', -2), ('venta', -3)],
+        )
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+    def test_tienda_y_admin_ven_el_stock_de_las_fracciones(self):
+        """La ficha, el dashboard, reducir_stock y el guardado desde el admin usan las unidades de las fracciones"""
+        from django.urls import reverse
+        from tienda.admin import TallaForm
+        from tienda.services.fracciones import StockFraccionado
+        from tienda.services.inventario import InventarioStock
+
+        StockFraccionado.activar(self.talla.pk, fracciones=4)
+        respuesta = self.client.get(reverse('tienda:producto_detalle', args=[self.producto.pk]))
+        self.assertEqual([talla.pk for talla in respuesta.context['tallas_disponibles']], [self.talla.pk])
+
+        self.talla.refresh_from_db()
+        self.assertTrue(self.talla.verificar_stock(10))
+        self.assertFalse(self.talla.verificar_stock(11))
+        self.assertTrue(self.talla.reducir_stock(3))
+        self.assertFalse(self.talla.reducir_stock(8))
+        self.assertEqual(self.talla.disponible, 7)
+
+        # El admin muestra las unidades libres y guardar otro valor las fija
+        self.assertEqual(TallaForm(instance=self.talla).initial['stock'], 7)
+        formulario = TallaForm(
+            {'talla': 'M', 'stock': 2, 'producto': self.producto.pk}, instance=Talla.objects.get(pk=self.talla.pk)
+        )
+        self.assertTrue(formulario.is_valid())
+        formulario.save()
+        self.talla.refresh_from_db()
+        self.assertEqual((self.talla.stock, self.talla.disponible), (0, 2))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock_total, 2)
+        self.assertEqual(InventarioStock.reconciliar(), [])
+
+        User.objects.create_user(username='jefe', email='jefe@c.com', password='x', nombre='Jefe', is_staff=True)
+        self.client.login(email='jefe@c.com', password='x')
+        respuesta = self.client.get(reverse('tienda:admin_dashboard'))
+        self.assertEqual(respuesta.context['productos_stock_bajo'], 1)
+        self.talla.stock = 30
+        self.talla.save()
+        respuesta = self.client.get(reverse('tienda:admin_dashboard'))
+        self.assertEqual(respuesta.context['productos_stock_bajo'], 0)
+
+
+class HistorialPedidosTestCase(TestCase):
+    """
+    Pruebas del historial de pedidos paginado y su resumen en caché
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Buzo Clásico", descripcion="Desc", precio=Decimal('80000.00'),
+            marca="Sun", color="Gris", material="Algodón", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='M', stock=100)
+        self.usuario = User.objects.create_user(username='hist', email='hist@c.com', password='x', nombre='Hist')
+
+    def _crear_pedidos(self, cantidad):
+        from tienda.models import ItemPedido, Pedido
+        for _ in range(cantidad):
+            pedido = Pedido.objects.create(
+                usuario=self.usuario, total=Decimal('160000.00'), estado='procesando', direccion_entrega='Calle 1'
+            )
+            ItemPedido.objects.bulk_create([
+                ItemPedido(pedido=pedido, producto=self.producto, talla=self.talla,
+                           cantidad=1, precio_unitario=Decimal('80000.00'))
+                for _ in range(2)
+            ])
+
+    def _consultas_historial(self, pagina=1):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from django.urls import reverse
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse('tienda:mis_pedidos'), {'page': pagina})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta, len(consultas)
+
+    def test_historial_con_consultas_constantes(self):
+        """La página no hace más consultas con más pedidos y solo muestra POR_PAGINA"""
+        from tienda.services.historial_pedidos import HistorialPedidos
+
+        self.client.login(email='hist@c.com', password='x')
+        self._crear_pedidos(2)
+        self._consultas_historial()
+        _, pocas = self._consultas_historial()
+
+        self._crear_pedidos(HistorialPedidos.POR_PAGINA * 2)
+        self._consultas_historial()
+        respuesta, muchas = self._consultas_historial(pagina=2)
+        self.assertEqual(muchas, pocas)
+        self.assertEqual(len(respuesta.context['pedidos']), HistorialPedidos.POR_PAGINA)
+        self.assertEqual(respuesta.context['resumen']['pedidos'], HistorialPedidos.POR_PAGINA * 2 + 2)
+
+    def test_resumen_se_invalida_al_crear_y_cambiar_estado(self):
+        """El resumen en caché refleja pedidos nuevos y cancelaciones sin volver a consultarse en cada visita"""
+        from tienda.models import Pedido
+        from tienda.services.historial_pedidos import HistorialPedidos
+
+        self._crear_pedidos(2)
+        self.assertEqual(HistorialPedidos.resumen(self.usuario.pk)['gastado'], Decimal('320000.00'))
+        with self.assertNumQueries(0):
+            HistorialPedidos.resumen(self.usuario.pk)
+
+        self._crear_pedidos(1)
+        self.assertEqual(HistorialPedidos.resumen(self.usuario.pk)['pedidos'], 3)
+
+        Pedido.objects.filter(usuario=self.usuario).first().actualizar_estado('cancelado')
+        resumen = HistorialPedidos.resumen(self.usuario.pk)
+        self.assertEqual((resumen['pedidos'], resumen['gastado']), (3, Decimal('320000.00')))
+
+
+class PanelPedidosTestCase(TestCase):
+    """
+    Pruebas del endpoint de datos del panel de pedidos
+    """
+
+    def setUp(self):
+        from tienda.models import Pedido
+        self.admin = User.objects.create_user(
+            username='panel', email='panel@c.com', password='x', nombre='Panel', is_staff=True
+        )
+        self.ana = User.objects.create_user(username='ana', email='ana@c.com', password='x', nombre='Ana')
+        self.beto = User.objects.create_user(username='beto', email='beto@c.com', password='x', nombre='Beto')
+        for indice in range(5):
+            Pedido.objects.create(
+                usuario=self.ana if indice % 2 else self.beto, total=Decimal('1000.00'),
+                estado='entregado' if indice < 2 else 'procesando', direccion_entrega='Calle 1'
+            )
+        self.client.login(email='panel@c.com', password='x')
+
+    def _datos(self, **parametros):
+        from django.urls import reverse
+        respuesta = self.client.get(reverse('tienda:admin_pedidos_datos'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_paginas_por_cursor_sin_repetir_filas(self):
+        """Las páginas siguen el cursor en orden descendente y solo la primera trae el total"""
+        from tienda.models import Pedido
+
+        primera = self._datos(limite=2)
+        self.assertEqual(primera['total'], 5)
+        ids = [fila[0] for fila in primera['pedidos']]
+        cursor = primera['siguiente']
+        while cursor:
+            pagina = self._datos(limite=2, cursor=cursor)
+            self.assertNotIn('total', pagina)
+            ids += [fila[0] for fila in pagina['pedidos']]
+            cursor = pagina['siguiente']
+        self.assertEqual(ids, list(Pedido.objects.order_by('-fecha_pedido', '-pk').values_list('pk', flat=True)))
+
+        fila = dict(zip(primera['columnas'], primera['pedidos'][0]))
+        self.assertEqual((fila['id'], fila['email'], fila['estado'], fila['items']), (ids[0], 'beto@c.com', 'procesando', 0))
+
+    def test_filtros_y_busqueda(self):
+        """Filtra por estado, usuario y fechas, y busca por número de pedido o email"""
+        from django.utils import timezone
+        from tienda.models import Pedido
+
+        self.assertEqual(self._datos(estado='entregado')['total'], 2)
+        self.assertEqual(self._datos(usuario=self.ana.pk)['total'], 2)
+        self.assertEqual(self._datos(q='beto@c.com')['total'], 3)
+        self.assertEqual(self._datos(q='an')['total'], 2)
+        pedido = Pedido.objects.first()
+        self.assertEqual([fila[0] for fila in self._datos(q=f'#{pedido.pk}')['pedidos']], [pedido.pk])
+
+        hoy = timezone.localdate().isoformat()
+        self.assertEqual(self._datos(desde=hoy, hasta=hoy)['total'], 5)
+        self.assertEqual(self._datos(hasta='2000-01-01')['total'], 0)
+
+    def test_solo_administradores(self):
+        """Un cliente no puede leer el listado"""
+        from django.urls import reverse
+        self.client.login(email='ana@c.com', password='x')
+        respuesta = self.client.get(reverse('tienda:admin_pedidos_datos'))
+        self.assertEqual(respuesta.status_code, 302)
+
+
+class TransicionesPedidoTestCase(TestCase):
+    """
+    Pruebas de los cambios de estado en bloque y el contador de ventas
+    """
+
+    def setUp(self):
+        from tienda.models import ItemPedido, Pedido
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.camiseta = Producto.objects.create(
+            nombre="Camiseta", descripcion="Desc", precio=Decimal('20000.00'),
+            marca="Sun", color="Azul", material="Algodón", categoria=categoria
+        )
+        self.gorra = Producto.objects.create(
+            nombre="Gorra", descripcion="Desc", precio=Decimal('15000.00'),
+            marca="Sun", color="Negro", material="Algodón", categoria=categoria
+        )
+        talla_camiseta = Talla.objects.create(producto=self.camiseta, talla='M', stock=50)
+        talla_gorra = Talla.objects.create(producto=self.gorra, talla='M', stock=50)
+        self.admin = User.objects.create_user(
+            username='bodega', email='bodega@c.com', password='x', nombre='Bodega', is_staff=True
+        )
+        self.pedidos = []
+        for estado in ('enviado', 'enviado', 'procesando', 'cancelado'):
+            pedido = Pedido.objects.create(
+                usuario=self.admin, total=Decimal('55000.00'), estado=estado, direccion_entrega='Calle 1'
+            )
+            ItemPedido.objects.bulk_create([
+                ItemPedido(pedido=pedido, producto=self.camiseta, talla=talla_camiseta,
+                           cantidad=2, precio_unitario=Decimal('20000.00')),
+                ItemPedido(pedido=pedido, producto=self.gorra, talla=talla_gorra,
+                           cantidad=1, precio_unitario=Decimal('15000.00')),
+            ])
+            self.pedidos.append(pedido)
+
+    def _vendidos(self):
+        return dict(Producto.objects.values_list('nombre', 'total_vendidos'))
+
+    def test_entregar_en_bloque_ajusta_ventas(self):
+        """Los pedidos válidos cambian juntos y las ventas suben con un UPDATE agrupado"""
+        from tienda.models import Pedido
+        from tienda.services.estados_pedido import TransicionesPedido
+
+        ids = [pedido.pk for pedido in self.pedidos]
+        resultado = TransicionesPedido.aplicar(ids + [999999], 'entregado')
+        self.assertEqual(resultado['actualizados'], ids[:3])
+        self.assertEqual(set(resultado['rechazados']), {ids[3], 999999})
+        self.assertEqual(self._vendidos(), {'Camiseta': 6, 'Gorra': 3})
+        # Un recálculo completo no encuentra nada que corregir
+        self.assertEqual(Producto.actualizar_todas_las_ventas(), 0)
+        self.assertEqual(self._vendidos(), {'Camiseta': 6, 'Gorra': 3})
+
+        # Salir de 'entregado' (devolución) resta las unidades y las devuelve al inventario
+        resultado = TransicionesPedido.aplicar(ids[:1], 'cancelado')
+        self.assertEqual(resultado['actualizados'], ids[:1])
+        self.assertEqual(self._vendidos(), {'Camiseta': 4, 'Gorra': 2})
+        self.assertEqual(Pedido.objects.get(pk=ids[0]).estado, 'cancelado')
+
+    def test_save_y_admin_pasan_por_las_transiciones(self):
+        """save() valida el cambio de estado y al cancelar devuelve el stock; el admin solo cambia con acciones"""
+        from django.db.models import Sum
+        from django.urls import reverse
+        from tienda.models import MovimientoStock, Pedido
+        from tienda.services.estados_pedido import TransicionInvalida
+
+        cancelado = Pedido.objects.get(pk=self.pedidos[3].pk)
+        cancelado.estado = 'procesando'
+        with self.assertRaises(TransicionInvalida):
+            cancelado.save()
+        self.assertEqual(Pedido.objects.get(pk=cancelado.pk).estado, 'cancelado')
+
+        pedido = Pedido.objects.get(pk=self.pedidos[2].pk)
+        pedido.estado = 'cancelado'
+        pedido.direccion_entrega = 'Calle 2'
+        pedido.save()
+        self.assertEqual(
+            Pedido.objects.filter(pk=pedido.pk).values_list('estado', 'direccion_entrega').get(),
+            ('cancelado', 'Calle 2'),
+        )
+        self.assertEqual(
+            MovimientoStock.objects.filter(pedido=pedido, tipo='cancelacion').aggregate(total=Sum('cantidad'))['total'], 3
+        )
+
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.client.login(email='bodega@c.com', password='x')
+        enviado = self.pedidos[0]
+        url = reverse('admin:tienda_pedido_change', args=[enviado.pk])
+        self.assertNotIn('estado', self.client.get(url).context['adminform'].form.fields)
+        self.client.post(reverse('admin:tienda_pedido_changelist'), {
+            'action': 'marcar_como_cancelado', '_selected_action': [enviado.pk],
+        })
+        self.assertEqual(Pedido.objects.get(pk=enviado.pk).estado, 'cancelado')
+        self.assertTrue(MovimientoStock.objects.filter(pedido=enviado, tipo='cancelacion').exists())
+
+    def test_api_de_cambio_en_bloque(self):
+        """El endpoint aplica la transición y rechaza estados inválidos"""
+        import json
+        from django.urls import reverse
+
+        self.client.login(email='bodega@c.com', password='x')
+        url = reverse('tienda:cambiar_estado_pedidos')
+        ids = [pedido.pk for pedido in self.pedidos[:2]]
+        respuesta = self.client.post(
+            url, json.dumps({'pedido_ids': ids, 'nuevo_estado': 'entregado'}), content_type='application/json'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['actualizados'], ids)
+        self.assertEqual(self._vendidos(), {'Camiseta': 4, 'Gorra': 2})
+
+        respuesta = self.client.post(
+            url, json.dumps({'pedido_ids': ids, 'nuevo_estado': 'perdido'}), content_type='application/json'
+        )
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class EventosPedidoTestCase(TestCase):
+    """
+    Pruebas del historial de estados y el contador de ventas incremental
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Chaqueta", descripcion="Desc", precio=Decimal('120000.00'),
+            marca="Sun", color="Verde", material="Nylon", categoria=categoria
+        )
+        self.talla = Talla.objects.create(producto=self.producto, talla='L', stock=10)
+        self.usuario = User.objects.create_user(username='evento', email='evento@c.com', password='x', nombre='Ev')
+
+    def _comprar(self, cantidad):
+        from tienda.services.checkout import ServicioCheckout
+        carrito = CarritoCompras.objects.create(usuario=self.usuario)
+        ItemCarrito.objects.create(carrito=carrito, producto=self.producto, talla=self.talla, cantidad=cantidad)
+        return ServicioCheckout.confirmar(carrito, direccion='Calle 1')
+
+    def test_cada_cambio_de_estado_queda_en_el_historial(self):
+        """La creación, save() y las transiciones en bloque dejan su evento"""
+        from tienda.models import Pedido
+        from tienda.services.estados_pedido import TransicionesPedido
+
+        pedido = self._comprar(1)
+        pedido = Pedido.objects.get(pk=pedido.pk)
+        pedido.estado = 'enviado'
+        pedido.save()
+        TransicionesPedido.aplicar([pedido.pk], 'entregado')
+        pedido.direccion_entrega = 'Calle 2'
+        pedido.save()
+
+        self.assertEqual(
+            list(pedido.cambios_estado.order_by('pk').values_list('estado_anterior', 'estado_nuevo')),
+            [('', 'procesando'), ('procesando', 'enviado'), ('enviado', 'entregado')]
+        )
+
+    def test_ventas_siguen_a_los_eventos_sin_recalcular(self):
+        """El contador coincide con las líneas entregadas en cada paso, también al eliminar pedidos"""
+        from django.db.models import Sum
+        from tienda.models import ItemPedido, Pedido
+
+        def entregadas():
+            return ItemPedido.objects.filter(
+                producto=self.producto, pedido__estado='entregado'
+            ).aggregate(total=Sum('cantidad'))['total'] or 0
+
+        def vendidos():
+            return Producto.objects.get(pk=self.producto.pk).total_vendidos
+
+        primero, segundo = self._comprar(2), self._comprar(3)
+        self.assertEqual(vendidos(), 0)
+        primero.actualizar_estado('entregado')
+        segundo = Pedido.objects.get(pk=segundo.pk)
+        segundo.estado = 'entregado'
+        segundo.save()
+        self.assertEqual((vendidos(), entregadas()), (5, 5))
+
+        primero.actualizar_estado('cancelado')
+        self.assertEqual((vendidos(), entregadas()), (3, 3))
+        segundo.delete()
+        self.assertEqual((vendidos(), entregadas()), (0, 0))
+
+
+class RecalculoVentasTestCase(TestCase):
+    """
+    Pruebas del recálculo por conjuntos de total_vendidos
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from tienda.models import ItemPedido, Pedido
+        cache.clear()
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.productos = []
+        self.pedidos = []
+        usuario = User.objects.create_user(username='rec', email='rec@c.com', password='x', nombre='Rec')
+        for indice in range(3):
+            producto = Producto.objects.create(
+                nombre=f"Media {indice}", descripcion="Desc", precio=Decimal('5000.00'),
+                marca="Sun", color="Blanco", material="Algodón", categoria=categoria
+            )
+            talla = Talla.objects.create(producto=producto, talla='M', stock=20)
+            pedido = Pedido.objects.create(
+                usuario=usuario, total=Decimal('10000.00'), estado='enviado', direccion_entrega='Calle 1'
+            )
+            ItemPedido.objects.create(
+                pedido=pedido, producto=producto, talla=talla, cantidad=indice + 1, precio_unitario=Decimal('5000.00')
+            )
+            pedido.actualizar_estado('entregado')
+            self.productos.append(producto)
+            self.pedidos.append(pedido)
+
+    def _vendidos(self):
+        return list(Producto.objects.order_by('pk').values_list('total_vendidos', flat=True))
+
+    def test_completo_corrige_solo_los_que_difieren(self):
+        """Un GROUP BY y escrituras por lotes solo para los contadores desviados"""
+        from tienda.models import ProductoCatalogo
+        from tienda.services.recalculo_ventas import RecalculoVentas
+
+        Producto.objects.filter(pk__in=[p.pk for p in self.productos[:2]]).update(total_vendidos=99)
+        resultado = RecalculoVentas.recalcular(tamano_lote=2)
+        self.assertEqual((resultado['modo'], resultado['revisados'], resultado['actualizados']), ('completo', 3, 2))
+        self.assertEqual(self._vendidos(), [1, 2, 3])
+        self.assertEqual(ProductoCatalogo.objects.get(pk=self.productos[0].pk).total_vendidos, 1)
+
+        with self.assertNumQueries(5):
+            # Marca, un GROUP BY por tabla (activa y archivo) y un SELECT por lote (vacío el último)
+            self.assertEqual(RecalculoVentas.recalcular()['actualizados'], 0)
+
+    def test_incremental_solo_revisa_pedidos_con_cambios(self):
+        """Desde la marca solo se recalculan los productos de pedidos que cambiaron de estado"""
+        from tienda.services.recalculo_ventas import RecalculoVentas
+
+        self.assertEqual(RecalculoVentas.recalcular(incremental=True)['modo'], 'completo')
+        Producto.objects.update(total_vendidos=50)
+        self.pedidos[1].actualizar_estado('cancelado')
+
+        resultado = RecalculoVentas.recalcular(incremental=True)
+        self.assertEqual((resultado['modo'], resultado['revisados'], resultado['actualizados']), ('incremental', 1, 1))
+        self.assertEqual(self._vendidos(), [50, 0, 50])
+        self.assertEqual(RecalculoVentas.recalcular(incremental=True)['revisados'], 0)
+
+
+class ArchivoPedidosTestCase(TestCase):
+    """
+    Pruebas del archivo de pedidos cerrados y la lectura a través de él
+    """
+
+    def setUp(self):
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        from tienda.models import ItemPedido, Pedido
+        cache.clear()
+        categoria = Categoria.objects.create(nombre="Ropa", descripcion="Ropa")
+        self.producto = Producto.objects.create(
+            nombre="Chaqueta", descripcion="Desc", precio=Decimal('100000.00'),
+            marca="Norte", color="Azul", material="Nylon", categoria=categoria
+        )
+        talla = Talla.objects.create(producto=self.producto, talla='L', stock=50)
+        self.usuario = User.objects.create_user(username='arch', email='arch@c.com', password='x', nombre='Arch')
+        self.pedidos = {}
+        # (nombre, estado final, días de antigüedad)
+        for nombre, estado, dias in [
+            ('entregado_viejo', 'entregado', 400), ('cancelado_viejo', 'cancelado', 390),
+            ('pendiente_viejo', 'pendiente', 380), ('entregado_nuevo', 'entregado', 2),
+        ]:
+            pedido = Pedido.objects.create(
+                usuario=self.usuario, total=Decimal('100000.00'), estado='pendiente', direccion_entrega='Calle 9'
+            )
+            ItemPedido.objects.create(
+                pedido=pedido, producto=self.producto, talla=talla, cantidad=1, precio_unitario=Decimal('100000.00')
+            )
+            if estado != 'pendiente':
+                pedido.actualizar_estado(estado)
+            Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.now() - timedelta(days=dias))
+            self.pedidos[nombre] = pedido.pk
+
+    def test_archivar_por_lotes_y_reanudar(self):
+        """Solo se mueven los pedidos cerrados antiguos, lote a lote, sin tocar las ventas"""
+        from tienda.models import (
+            CambioEstadoPedidoArchivado, ItemPedidoArchivado, MovimientoStock, Pedido, PedidoArchivado
+        )
+        from tienda.services.archivo_pedidos import ArchivoPedidos
+        from tienda.services.recalculo_ventas import RecalculoVentas
+
+        resultado = ArchivoPedidos.archivar(dias=365, tamano_lote=1, max_lotes=1)
+        self.assertEqual((resultado['archivados'], resultado['restantes']), (1, 1))
+        # La siguiente ejecución sigue con el pedido que quedó pendiente
+        resultado = ArchivoPedidos.archivar(dias=365, tamano_lote=1)
+        self.assertEqual((resultado['archivados'], resultado['restantes']), (1, 0))
+
+        archivados = {self.pedidos['entregado_viejo'], self.pedidos['cancelado_viejo']}
+        self.assertEqual(set(PedidoArchivado.objects.values_list('pk', flat=True)), archivados)
+        self.assertFalse(Pedido.objects.filter(pk__in=archivados).exists())
+        self.assertEqual(ItemPedidoArchivado.objects.filter(pedido_id__in=archivados).count(), 2)
+        self.assertEqual(
+            list(CambioEstadoPedidoArchivado.objects.filter(pedido_id=self.pedidos['cancelado_viejo'])
+                 .order_by('pk').values_list('estado_nuevo', flat=True)),
+            ['pendiente', 'cancelado']
+        )
+
+        # Los movimientos de stock del pedido cancelado se conservan sin pedido (SET_NULL)
+        self.assertTrue(MovimientoStock.objects.filter(tipo='cancelacion', pedido=None).exists())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.total_vendidos, 2)
+        self.assertEqual(RecalculoVentas.recalcular()['actualizados'], 0)
+        self.assertEqual(ArchivoPedidos.archivar(dias=365)['archivados'], 0)
+
+    def test_historial_y_panel_leen_el_archivo(self):
+        """Mis Pedidos y el panel mezclan ambas tablas por fecha; un rango reciente no consulta el archivo"""
+        from datetime import timedelta
+        from django.urls import reverse
+        from django.utils import timezone
+        from tienda.services.archivo_pedidos import ArchivoPedidos
+        from tienda.services.panel_pedidos import PanelPedidos
+
+        ArchivoPedidos.archivar(dias=365)
+        por_fecha = [self.pedidos[nombre] for nombre in (
+            'entregado_nuevo', 'pendiente_viejo', 'cancelado_viejo', 'entregado_viejo'
+        )]
+
+        self.client.login(email='arch@c.com', password='x')
+        respuesta = self.client.get(reverse('tienda:mis_pedidos'))
+        self.assertEqual([pedido.pk for pedido in respuesta.context['pedidos']], por_fecha)
+        self.assertEqual(respuesta.context['resumen']['pedidos'], 4)
+        self.assertContains(respuesta, 'Chaqueta', count=4)
+
+        ids, cursor = [], None
+        while True:
+            datos = PanelPedidos.pagina({'limite': '3', **({'cursor': cursor} if cursor else {})})
+            ids += [fila[0] for fila in datos['pedidos']]
+            if cursor is None:
+                self.assertEqual(datos['total'], 4)
+            cursor = datos['siguiente']
+            if not cursor:
+                break
+        self.assertEqual(ids, por_fecha)
+
+        reciente = (timezone.localdate() - timedelta(days=7)).isoformat()
+        with self.assertNumQueries(2):
+            # Página y conteo solo de la tabla en uso (la frontera ya está en caché)
+            datos = PanelPedidos.pagina({'desde': reciente})
+        self.assertEqual([fila[0] for fila in datos['pedidos']], [self.pedidos['entregado_nuevo']])
+
+    def test_pedido_archivado_no_cambia_de_estado_y_cuenta_en_reportes(self):
+        """Una transición sobre un pedido archivado se rechaza y los totales lo siguen sumando"""
+        from tienda.services.archivo_pedidos import ArchivoPedidos
+        from tienda.services.estados_pedido import TransicionesPedido
+
+        antes = ArchivoPedidos.totales(estado='entregado')
+        ArchivoPedidos.archivar(dias=365)
+        self.assertEqual(ArchivoPedidos.totales(estado='entregado'), antes)
+        self.assertEqual(antes['pedidos'], 2)
+
+        pk = self.pedidos['entregado_viejo']
+        resultado = TransicionesPedido.aplicar([pk], 'cancelado')
+        self.assertEqual(resultado['rechazados'], {pk: 'El pedido está archivado.'})
+
+
+class PlanesConsultaTestCase(TestCase):
+    """
+    Pruebas de regresión de planes de consulta
+
+    Revisan el EXPLAIN de las consultas más frecuentes de views.py y
+    api_views.py y fallan si alguna vuelve a recorrer la tabla completa
+    o a ordenar sin índice.
+    """
+
+    def assertUsaIndices(self, queryset, tabla):
+        from django.db import connection
+        import re
+
+        if connection.vendor == 'postgresql':
+            # Con tablas pequeñas PostgreSQL prefiere Seq Scan; se desactiva para
+            # comprobar que existe un índice utilizable
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertNotIn(f'Seq Scan on {tabla}', plan, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            escaneo_completo = re.search(rf'\bSCAN {tabla}\b(?! USING (COVERING )?INDEX)', plan)
+            self.assertIsNone(escaneo_completo, plan)
+            self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, plan)
+        else:
+            self.skipTest(f'Motor sin comprobación de planes: {connection.vendor}')
+
+    def test_consultas_catalogo(self):
+        """Listado, solo en stock, más vendidos, precio, color y marca usan índices"""
+        from tienda.services.catalogo import FiltrosCatalogo
+
+        self.assertUsaIndices(Producto.objects.order_by('-fecha_creacion', '-id')[:9], 'tienda_producto')
+        self.assertUsaIndices(
+            Producto.objects.filter(en_stock=True).order_by('-fecha_creacion', '-id')[:9], 'tienda_producto'
+        )
+        self.assertUsaIndices(Producto.get_top_vendidos(limit=10), 'tienda_producto')
+        self.assertUsaIndices(
+            Producto.objects.filter(precio__gte=Decimal('10000'), precio__lte=Decimal('50000')), 'tienda_producto'
+        )
+        for parametros in ({'color': 'Rojo'}, {'marca': 'Nike'}, {'talla': 'M,L'}):
+            filtros = FiltrosCatalogo.desde_parametros(parametros)
+            self.assertUsaIndices(filtros.aplicar(Producto.objects.all()), 'tienda_producto')
+
+    def test_consultas_pedidos(self):
+        """Ventas del mes, historial del usuario y pedidos recientes usan índices"""
+        from django.utils import timezone
+        from tienda.models import Pedido
+
+        self.assertUsaIndices(
+            Pedido.objects.filter(fecha_pedido__gte=timezone.now(), estado='entregado'), 'tienda_pedido'
+        )
+        self.assertUsaIndices(Pedido.objects.filter(usuario_id=1).order_by('-fecha_pedido'), 'tienda_pedido')
+        self.assertUsaIndices(Pedido.objects.order_by('-fecha_pedido')[:5], 'tienda_pedido')
+
+    def test_consultas_inventario_y_carrito(self):
+        """Stock bajo y carrito activo usan índices"""
+        self.assertUsaIndices(Talla.objects.filter(stock__lt=5), 'tienda_talla')
+        self.assertUsaIndices(
+            CarritoCompras.objects.filter(usuario_id=1, activo=True), 'tienda_carritocompras'
+        )
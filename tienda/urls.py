@@ -17,6 +17,11 @@ urlpatterns = [
     # APIs AJAX
     path('api/busqueda/', views.busqueda_ajax, name='busqueda_ajax'),
     path('api/actualizar-ventas/', views.actualizar_ventas, name='actualizar_ventas'),
+    path('api/carrito/', views.api_carrito, name='api_carrito'),
+    path('api/carrito/agregar/', views.api_carrito_agregar, name='api_carrito_agregar'),
+    path('api/carrito/actualizar/', views.api_carrito_actualizar, name='api_carrito_actualizar'),
+    path('api/carrito/quitar/', views.api_carrito_quitar, name='api_carrito_quitar'),
+    path('api/autocompletado/estadisticas/', views.estadisticas_autocompletado, name='estadisticas_autocompletado'),
 
     # Servicio Web JSON para consumo externo
     path('api/productos-en-stock/', views.api_productos_stock, name='api_productos_stock'),
@@ -34,7 +39,10 @@ urlpatterns = [
     path('admin-panel/categorias/editar/<int:categoria_id>/', views.admin_categoria_editar, name='admin_categoria_editar'),
     path('admin-panel/categorias/eliminar/<int:categoria_id>/', views.admin_categoria_eliminar, name='admin_categoria_eliminar'),
     path('admin-panel/pedidos/', views.admin_pedidos, name='admin_pedidos'),
+    path('admin-panel/pedidos/datos/', views.admin_pedidos_datos, name='admin_pedidos_datos'),
     path('admin-panel/pedidos/cambiar-estado/', views.cambiar_estado_pedido, name='cambiar_estado_pedido'),
+    path('admin-panel/pedidos/cambiar-estado-lote/', views.cambiar_estado_pedidos, name='cambiar_estado_pedidos'),
+    path('admin-panel/pedidos/cola/', views.estadisticas_cola_pedidos, name='estadisticas_cola_pedidos'),
     path('admin-panel/reportes/', views.admin_reportes, name='admin_reportes'),
 
     # Descargas de reportes (inversión de dependencias)
@@ -1,15 +1,35 @@
+import hashlib
+import uuid
 from django.shortcuts import render, redirect, get_object_or_404
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Count
 from django.views.generic import ListView
 from django.http import JsonResponse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import Producto, Categoria, CarritoCompras, Pedido, Talla, ImagenProducto, ItemPedido
+from .models import Producto, ProductoCatalogo, Categoria, CarritoCompras, Pedido, Talla, ImagenProducto, ItemPedido
 from .forms import ProductoForm, CategoriaForm, ImagenProductoForm, TallaFormSet
 from .services.reporte_interface import ReporteInterface
 from .services.reporte_pdf import ReportePDF
 from .services.reporte_excel import ReporteExcel
+from .services.catalogo import FiltrosCatalogo
+from .services.busqueda import IndiceBusqueda
+from .services.facetas import FacetasCatalogo
+from .services.paginacion import PaginadorKeyset
+from .services.autocompletado import IndiceAutocompletado
+from .services.cache_catalogo import CacheFragmentos
+from .services.checkout import ErrorCheckout
+from .services.carrito import CarritoSesion
+from .services.idempotencia import idempotente
+from .services.cola_pedidos import ColaPedidos
+from .services.historial_pedidos import HistorialPedidos
+from .services.archivo_pedidos import ArchivoPedidos
+from .services.panel_pedidos import PanelPedidos
+from .services.estados_pedido import TransicionInvalida, TransicionesPedido
+from .services.recalculo_ventas import RecalculoVentas
 
 
 def es_admin(user):
@@ -23,102 +43,94 @@ def es_admin(user):
 
 def home(request):
     """Homepage para usuarios finales"""
-    productos_destacados = Producto.objects.all()[:6]
     categorias = Categoria.objects.all()
+
+    def renderizar_destacados():
+        productos_destacados = ProductoCatalogo.objects.order_by('pk')[:6]
+        return str(render_to_string('snippets/productos_destacados.html', {
+            'productos_destacados': productos_destacados,
+        }, request))
+
+    # Bloque de destacados en caché hasta el próximo cambio del catálogo
+    destacados_html = CacheFragmentos.obtener('home_destacados', [], renderizar_destacados)
+
     return render(request, 'usuario/home.html', {
-        'productos_destacados': productos_destacados,
+        'destacados_html': mark_safe(destacados_html),
         'categorias': categorias
     })
 
 
 def productos_lista(request):
     """Catálogo de productos para usuarios finales con filtros avanzados"""
-    productos = Producto.objects.all()
-    categorias = Categoria.objects.all()
-    
-    # Obtener valores únicos para filtros
-    colores_disponibles = Producto.objects.values_list('color', flat=True).distinct().order_by('color')
-    marcas_disponibles = Producto.objects.values_list('marca', flat=True).distinct().order_by('marca')
-    tallas_disponibles = Talla.objects.values_list('talla', flat=True).distinct().order_by('talla')
-    
-    # Aplicar filtros
-    categoria_id = request.GET.get('categoria')
-    if categoria_id:
-        productos = productos.filter(categoria_id=categoria_id)
-    
-    # Filtro por rango de precio
-    precio_min = request.GET.get('precio_min')
-    precio_max = request.GET.get('precio_max')
-    if precio_min:
-        productos = productos.filter(precio__gte=precio_min)
-    if precio_max:
-        productos = productos.filter(precio__lte=precio_max)
-    
-    # Filtro por color
-    color = request.GET.get('color')
-    if color:
-        productos = productos.filter(color__iexact=color)
-    
-    # Filtro por marca
-    marca = request.GET.get('marca')
-    if marca:
-        productos = productos.filter(marca__iexact=marca)
-    
-    # Filtro por talla (productos que tienen esa talla disponible)
-    talla = request.GET.get('talla')
-    if talla:
-        productos = productos.filter(talla__talla=talla, talla__stock__gt=0).distinct()
-    
-    # Filtro solo productos en stock
-    solo_stock = request.GET.get('solo_stock')
-    if solo_stock:
-        productos_con_stock = []
-        for producto in productos:
-            if producto.stock_total() > 0:
-                productos_con_stock.append(producto.id)
-        productos = productos.filter(id__in=productos_con_stock)
-    
-    # Búsqueda de texto
-    busqueda = request.GET.get('busqueda')
-    if busqueda:
-        productos = productos.filter(
-            Q(nombre__icontains=busqueda) |
-            Q(marca__icontains=busqueda) |
-            Q(descripcion__icontains=busqueda) |
-            Q(categoria__nombre__icontains=busqueda) |
-            Q(color__icontains=busqueda) |
-            Q(material__icontains=busqueda)
-        ).distinct()
-    
-    # Ordenar por fecha de creación
-    productos = productos.order_by('-fecha_creacion')
+    filtros = FiltrosCatalogo.desde_parametros(request.GET)
 
-    # Paginación
-    paginator = Paginator(productos, 9)  # 9 productos por página (3x3 grid)
-    page = request.GET.get('page')
+    # Facetas con conteos para la barra lateral (una consulta, cacheada)
+    facetas = FacetasCatalogo.obtener(filtros)
 
-    try:
-        productos_paginados = paginator.page(page)
-    except PageNotAnInteger:
-        # Si page no es un entero, mostrar la primera página
-        productos_paginados = paginator.page(1)
-    except EmptyPage:
-        # Si page está fuera de rango, mostrar la última página
-        productos_paginados = paginator.page(paginator.num_pages)
+    # Parámetros actuales sin precio ni página, para los enlaces de rangos de precio
+    parametros_precio = request.GET.copy()
+    for clave in ('precio_min', 'precio_max', 'page', 'cursor'):
+        parametros_precio.pop(clave, None)
+
+    # El cursor recorre por fecha; una búsqueda se ordena por relevancia y se pagina por número
+    usar_keyset = (settings.CATALOGO_PAGINACION_KEYSET or 'cursor' in request.GET) and not filtros.get('busqueda')
+    if usar_keyset:
+        pagina = 'cursor-' + hashlib.md5(request.GET.get('cursor', '').encode('utf-8')).hexdigest()
+    else:
+        pagina = 'page-' + request.GET.get('page', '1')
+
+    def renderizar_grid():
+        # Aplicar filtros sobre el modelo de lectura (una sola tabla)
+        productos = filtros.aplicar(ProductoCatalogo.objects.all())
+
+        if usar_keyset:
+            # Paginación por cursor: sin COUNT(*) ni OFFSET, el total sale de las facetas
+            paginador = PaginadorKeyset(productos, 9)
+            productos_paginados = paginador.pagina(request.GET.get('cursor'), total=facetas['total'])
+        else:
+            if filtros.get('busqueda'):
+                # Resultados más relevantes primero; a igual rango, los más nuevos
+                productos = IndiceBusqueda.por_relevancia(productos, filtros.get('busqueda'))
+            else:
+                # Ordenar por fecha de creación
+                productos = productos.order_by('-fecha_creacion', '-pk')
+
+            # Paginación
+            paginator = Paginator(productos, 9)  # 9 productos por página (3x3 grid)
+            page = request.GET.get('page')
+
+            try:
+                productos_paginados = paginator.page(page)
+            except PageNotAnInteger:
+                # Si page no es un entero, mostrar la primera página
+                productos_paginados = paginator.page(1)
+            except EmptyPage:
+                # Si page está fuera de rango, mostrar la última página
+                productos_paginados = paginator.page(paginator.num_pages)
+
+        html = render_to_string('snippets/grid_productos.html', {
+            'productos': productos_paginados,
+            'parametros_pagina': filtros.querystring(),
+            'hay_filtros': bool(filtros),
+        }, request)
+        return {'html': str(html), 'cantidad': len(productos_paginados)}
+
+    # Grid renderizado en caché por filtros, página, idioma y versión del catálogo
+    grid = CacheFragmentos.obtener('grid_productos', [filtros.firma(), pagina], renderizar_grid)
 
     return render(request, 'usuario/productos.html', {
-        'productos': productos_paginados,
-        'categorias': categorias,
-        'colores_disponibles': colores_disponibles,
-        'marcas_disponibles': marcas_disponibles,
-        'tallas_disponibles': tallas_disponibles,
+        'grid_html': mark_safe(grid['html']),
+        'cantidad_productos': grid['cantidad'],
+        'facetas': facetas,
+        'parametros_precio': parametros_precio.urlencode(),
     })
 
 
 def producto_detalle(request, producto_id):
     """Detalle de producto para usuarios finales"""
     producto = get_object_or_404(Producto, id=producto_id)
-    tallas_disponibles = producto.tallas.filter(stock__gt=0)
+    # Tallas con unidades sin reservar por otros carritos (en las fraccionadas, en sus fracciones)
+    tallas_disponibles = producto.tallas.annotate(libres=Talla.stock_libre()).filter(libres__gt=0)
     
     return render(request, 'usuario/producto_detalle.html', {
         'producto': producto,
@@ -126,50 +138,41 @@ def producto_detalle(request, producto_id):
     })
 
 
-@login_required
 def carrito(request):
-    """Carrito de compras del usuario"""
-    carrito, created = CarritoCompras.objects.get_or_create(
-        usuario=request.user,
-        activo=True
-    )
-    items = carrito.itemcarrito_set.all()
+    """Carrito de compras de la sesión (visitantes y usuarios autenticados)"""
+    carrito = CarritoSesion(request)
 
     return render(request, 'usuario/carrito.html', {
         'carrito': carrito,
-        'items': items
+        'items': carrito.items()
     })
 
 
-@login_required
 def agregar_al_carrito(request, producto_id):
-    """Agregar producto al carrito"""
+    """Agregar producto al carrito de la sesión"""
     if request.method == 'POST':
-        producto = get_object_or_404(Producto, id=producto_id)
         talla_id = request.POST.get('talla_id')
-        cantidad = int(request.POST.get('cantidad', 1))
+        try:
+            cantidad = int(request.POST.get('cantidad', 1))
+        except ValueError:
+            cantidad = 0
 
         if not talla_id:
             messages.error(request, 'Debes seleccionar una talla.')
             return redirect('tienda:producto_detalle', producto_id=producto_id)
-
-        talla = get_object_or_404(Talla, id=talla_id, producto=producto)
-
-        # Verificar stock disponible
-        if talla.stock < cantidad:
-            messages.error(request, f'Solo hay {talla.stock} unidades disponibles de la talla {talla.talla}.')
+        if cantidad < 1:
+            messages.error(request, 'La cantidad debe ser un número entero mayor que cero.')
             return redirect('tienda:producto_detalle', producto_id=producto_id)
 
-        # Obtener o crear carrito
-        carrito, created = CarritoCompras.objects.get_or_create(
-            usuario=request.user,
-            activo=True
-        )
+        talla = get_object_or_404(Talla.objects.select_related('producto'), id=talla_id, producto_id=producto_id)
 
-        # Agregar producto al carrito
-        carrito.agregar_producto(producto, talla, cantidad)
+        # Reservar las unidades por unos minutos y agregarlas al carrito
+        if not CarritoSesion(request).agregar(talla, cantidad):
+            talla.refresh_from_db()
+            messages.error(request, f'Solo hay {talla.disponible} unidades disponibles de la talla {talla.talla}.')
+            return redirect('tienda:producto_detalle', producto_id=producto_id)
 
-        messages.success(request, f'¡{producto.nombre} agregado al carrito!')
+        messages.success(request, f'¡{talla.producto.nombre} agregado al carrito!')
         return redirect('tienda:carrito')
 
     return redirect('tienda:producto_detalle', producto_id=producto_id)
@@ -177,26 +180,22 @@ def agregar_al_carrito(request, producto_id):
 
 @login_required
 def mis_pedidos(request):
-    """Historial de pedidos del usuario"""
-    pedidos = Pedido.objects.filter(usuario=request.user).order_by('-fecha_pedido')
-
+    """Historial de pedidos del usuario, paginado y con las líneas precargadas"""
     return render(request, 'usuario/mis_pedidos.html', {
-        'pedidos': pedidos
+        'pedidos': HistorialPedidos.pagina(request.user, request.GET.get('page')),
+        'resumen': HistorialPedidos.resumen(request.user.pk),
     })
 
 
 @login_required
+@idempotente
 def checkout(request):
     """Vista de pago/checkout"""
-    # Obtener carrito del usuario
-    carrito, created = CarritoCompras.objects.get_or_create(
-        usuario=request.user,
-        activo=True
-    )
+    carrito = CarritoSesion(request)
 
     # Verificar que el carrito tenga items
-    items = carrito.itemcarrito_set.all()
-    if not items.exists():
+    items = carrito.items()
+    if not items:
         messages.error(request, 'Tu carrito está vacío.')
         return redirect('tienda:carrito')
 
@@ -207,39 +206,21 @@ def checkout(request):
             messages.error(request, 'Por favor ingresa una dirección de entrega.')
             return redirect('tienda:checkout')
 
-        # Crear el pedido
-        pedido = Pedido.objects.create(
-            usuario=request.user,
-            total=carrito.total,
-            estado='procesando',  # Cambiar a procesando (como si hubiera "pagado")
-            direccion_entrega=direccion
-        )
-
-        # Procesar el pedido (crear items y reducir stock)
-        for item_carrito in items:
-            ItemPedido.objects.create(
-                pedido=pedido,
-                producto=item_carrito.producto,
-                talla=item_carrito.talla,
-                cantidad=item_carrito.cantidad,
-                precio_unitario=item_carrito.producto.precio
-            )
-            # Reducir stock
-            item_carrito.talla.reducir_stock(item_carrito.cantidad)
-            # Actualizar contador de vendidos
-            item_carrito.producto.total_vendidos += item_carrito.cantidad
-            item_carrito.producto.save()
-
-        # Marcar carrito como inactivo
-        carrito.activo = False
-        carrito.save()
+        # Crear el pedido, sus líneas y descontar stock en una sola transacción
+        try:
+            pedido = carrito.confirmar(direccion)
+        except ErrorCheckout as error:
+            messages.error(request, str(error))
+            return redirect('tienda:carrito')
 
         # Redirigir a página de éxito
         return redirect('tienda:pago_exitoso', pedido_id=pedido.id)
 
     return render(request, 'usuario/checkout.html', {
         'carrito': carrito,
-        'items': items
+        'items': items,
+        # Un reenvío del mismo formulario no crea un segundo pedido
+        'clave_idempotencia': uuid.uuid4().hex
     })
 
 
@@ -247,7 +228,7 @@ def checkout(request):
 def pago_exitoso(request, pedido_id):
     """Página de confirmación de compra/gracias"""
     pedido = get_object_or_404(Pedido, id=pedido_id, usuario=request.user)
-    items = pedido.itempedido_set.all()
+    items = pedido.itempedido_set.select_related('producto', 'talla')
 
     return render(request, 'usuario/pago_exitoso.html', {
         'pedido': pedido,
@@ -262,27 +243,8 @@ def busqueda_ajax(request):
     if len(query) < 2:
         return JsonResponse({'productos': [], 'count': 0})
     
-    productos = Producto.objects.filter(
-        Q(nombre__icontains=query) |
-        Q(marca__icontains=query) |
-        Q(descripcion__icontains=query) |
-        Q(categoria__nombre__icontains=query) |
-        Q(color__icontains=query) |
-        Q(material__icontains=query)
-    ).distinct()[:10]  # Limitar a 10 resultados
-    
-    productos_data = []
-    for producto in productos:
-        productos_data.append({
-            'id': producto.id,
-            'nombre': producto.nombre,
-            'marca': producto.marca,
-            'precio': str(producto.precio),
-            'categoria': producto.categoria.nombre,
-            'color': producto.color,
-            'stock_total': producto.stock_total(),
-            'url': f'/producto/{producto.id}/',
-        })
+    # Respuesta precalculada desde el índice en memoria (sin consultas a la BD)
+    productos_data = IndiceAutocompletado.buscar(query, limite=10)  # Limitar a 10 resultados
     
     return JsonResponse({
         'productos': productos_data,
@@ -291,6 +253,84 @@ def busqueda_ajax(request):
     })
 
 
+# ================================
+# API JSON DEL CARRITO
+# ================================
+
+def _respuesta_carrito(carrito, talla_id=None, mensaje=None, status=200):
+    """Respuesta con la línea que cambió y los totales del carrito"""
+    datos = {'success': status == 200, 'carrito': carrito.resumen()}
+    if talla_id is not None:
+        linea = carrito.linea(talla_id)
+        datos['linea'] = linea.como_dict() if linea else None
+    if mensaje:
+        datos['message'] = mensaje
+    return JsonResponse(datos, status=status)
+
+
+def _leer_linea(request):
+    """Talla y cantidad enviadas por POST; la talla es None si no existe"""
+    try:
+        talla_id = int(request.POST.get('talla_id', ''))
+        cantidad = int(request.POST.get('cantidad', 1))
+    except ValueError:
+        return None, None
+    return Talla.objects.filter(pk=talla_id).first(), cantidad
+
+
+def api_carrito(request):
+    """Líneas y totales del carrito de la sesión"""
+    carrito = CarritoSesion(request)
+    return JsonResponse({
+        'success': True,
+        'carrito': carrito.resumen(),
+        'lineas': [item.como_dict() for item in carrito.items()],
+    })
+
+
+def api_carrito_agregar(request):
+    """Agregar unidades de una talla y devolver solo la línea y los totales"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    carrito = CarritoSesion(request)
+    talla, cantidad = _leer_linea(request)
+    if talla is None or cantidad < 1:
+        return _respuesta_carrito(carrito, mensaje='Talla o cantidad no válida.', status=400)
+    if not carrito.agregar(talla, cantidad):
+        talla.refresh_from_db()
+        return _respuesta_carrito(
+            carrito, talla.pk, f'Solo hay {talla.disponible} unidades disponibles de la talla {talla.talla}.', status=409
+        )
+    return _respuesta_carrito(carrito, talla.pk)
+
+
+def api_carrito_actualizar(request):
+    """Cambiar la cantidad de una línea (0 la quita)"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    carrito = CarritoSesion(request)
+    talla, cantidad = _leer_linea(request)
+    if talla is None or talla.pk not in carrito.lineas:
+        return _respuesta_carrito(carrito, mensaje='La talla no está en el carrito.', status=404)
+    if not carrito.actualizar(talla, cantidad):
+        talla.refresh_from_db()
+        return _respuesta_carrito(
+            carrito, talla.pk, f'Solo hay {talla.disponible} unidades disponibles de la talla {talla.talla}.', status=409
+        )
+    return _respuesta_carrito(carrito, talla.pk)
+
+
+def api_carrito_quitar(request):
+    """Quitar una línea del carrito"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+    carrito = CarritoSesion(request)
+    talla, _ = _leer_linea(request)
+    if talla is not None:
+        carrito.quitar(talla.pk)
+    return _respuesta_carrito(carrito, talla.pk if talla else None)
+
+
 # ================================
 # VISTAS ADMINISTRADOR
 # ================================
@@ -298,19 +338,18 @@ def busqueda_ajax(request):
 @user_passes_test(es_admin)
 def admin_dashboard(request):
     """Dashboard principal para administradores"""
-    from django.db.models import Sum
     from django.utils import timezone
     from datetime import timedelta
     
     # Estadísticas básicas
     total_productos = Producto.objects.count()
-    total_pedidos = Pedido.objects.count()
+    total_pedidos = ArchivoPedidos.totales()['pedidos']
     total_categorias = Categoria.objects.count()
     
-    # Productos con stock bajo (menos de 5 unidades)
-    productos_stock_bajo = Producto.objects.filter(
-        tallas__stock__lt=5
-    ).distinct().count()
+    # Productos con stock bajo (alguna talla con menos de 5 unidades, contando sus fracciones)
+    productos_stock_bajo = Talla.objects.annotate(
+        fisico=Talla.stock_fisico()
+    ).filter(fisico__lt=5).values('producto').distinct().count()
     
     # Top 3 productos más vendidos (dinámico)
     top_productos = Producto.get_top_vendidos(limit=3)
@@ -318,18 +357,11 @@ def admin_dashboard(request):
     # Pedidos recientes (últimos 5)
     pedidos_recientes = Pedido.objects.order_by('-fecha_pedido')[:5]
     
-    # Ventas del mes actual
+    # Ventas y pedidos completados del mes actual (incluye el archivo si el mes llega hasta él)
     primer_dia_mes = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    ventas_mes = Pedido.objects.filter(
-        fecha_pedido__gte=primer_dia_mes,
-        estado='entregado'
-    ).aggregate(Sum('total'))['total__sum'] or 0
-    
-    # Pedidos completados del mes
-    pedidos_completados_mes = Pedido.objects.filter(
-        fecha_pedido__gte=primer_dia_mes,
-        estado='entregado'
-    ).count()
+    entregados_mes = ArchivoPedidos.totales(desde=primer_dia_mes, estado='entregado')
+    ventas_mes = entregados_mes['total']
+    pedidos_completados_mes = entregados_mes['pedidos']
     
     return render(request, 'admin/dashboard.html', {
         'total_productos': total_productos,
@@ -346,7 +378,7 @@ def admin_dashboard(request):
 @user_passes_test(es_admin)
 def admin_productos(request):
     """CRUD de productos para administradores"""
-    productos = Producto.objects.all().order_by('-fecha_creacion')
+    productos = Producto.objects.select_related('categoria').order_by('-fecha_creacion')
     
     return render(request, 'admin/productos_crud.html', {
         'productos': productos
@@ -640,15 +672,20 @@ def admin_categoria_eliminar(request, categoria_id):
 
 @user_passes_test(es_admin)
 def admin_pedidos(request):
-    """Gestión de pedidos para administradores"""
-    pedidos = Pedido.objects.all().order_by('-fecha_pedido')
-
+    """Gestión de pedidos para administradores (la tabla se carga desde admin_pedidos_datos)"""
     return render(request, 'admin/pedidos.html', {
-        'pedidos': pedidos
+        'estados': Pedido.ESTADOS_PEDIDO,
     })
 
 
 @user_passes_test(es_admin)
+def admin_pedidos_datos(request):
+    """API: página de pedidos filtrada para la tabla del panel (paginación por cursor)"""
+    return JsonResponse({'success': True, **PanelPedidos.pagina(request.GET)})
+
+
+@user_passes_test(es_admin)
+@idempotente
 def cambiar_estado_pedido(request):
     """API para cambiar estado de un pedido"""
     if request.method == 'POST':
@@ -670,7 +707,10 @@ def cambiar_estado_pedido(request):
                 }, status=400)
 
             # Actualizar estado
-            pedido.actualizar_estado(nuevo_estado)
+            try:
+                pedido.actualizar_estado(nuevo_estado)
+            except TransicionInvalida as error:
+                return JsonResponse({'success': False, 'message': str(error)}, status=400)
 
             return JsonResponse({
                 'success': True,
@@ -693,17 +733,51 @@ def cambiar_estado_pedido(request):
     return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
 
 
+@user_passes_test(es_admin)
+@idempotente
+def cambiar_estado_pedidos(request):
+    """
+    API para cambiar el estado de muchos pedidos en una transacción
+
+    Recibe {"pedido_ids": [...], "nuevo_estado": "..."}; los pedidos cuya
+    transición no está permitida se informan en "rechazados" y no se tocan.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método no permitido'}, status=405)
+
+    import json
+
+    try:
+        data = json.loads(request.body)
+        pedido_ids = [int(pedido_id) for pedido_id in data.get('pedido_ids', [])]
+        resultado = TransicionesPedido.aplicar(pedido_ids, data.get('nuevo_estado'))
+    except (json.JSONDecodeError, TypeError, ValueError, AttributeError):
+        return JsonResponse({'success': False, 'message': 'JSON inválido'}, status=400)
+    except TransicionInvalida as error:
+        return JsonResponse({'success': False, 'message': str(error)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'message': f'{len(resultado["actualizados"])} pedido(s) actualizados, {len(resultado["rechazados"])} rechazados',
+        **resultado,
+    })
+
+
 @user_passes_test(es_admin)
 def admin_reportes(request):
     """Reportes y estadísticas para administradores"""
-    from django.db.models import Sum, Count
+    from django.db.models import Sum, Count, F, DecimalField
     from django.utils import timezone
     from datetime import timedelta
 
     # Actualizar contadores si se solicita
     if request.GET.get('actualizar') == 'ventas':
-        productos_actualizados = Producto.actualizar_todas_las_ventas()
-        messages.success(request, f'Se actualizaron los contadores de {productos_actualizados} productos.')
+        resultado = RecalculoVentas.recalcular(incremental=True)
+        messages.success(
+            request,
+            f'Recálculo {resultado["modo"]}: {resultado["revisados"]} productos revisados, '
+            f'{resultado["actualizados"]} corregidos en {resultado["segundos"]}s.'
+        )
 
     # Top productos más vendidos (completo)
     top_productos = Producto.objects.filter(total_vendidos__gt=0).order_by('-total_vendidos')[:10]
@@ -726,31 +800,27 @@ def admin_reportes(request):
 
     productos = Producto.objects.all()
     productos_count = productos.count()
-    total_vendidos = sum(p.total_vendidos for p in productos)
+    totales_productos = productos.aggregate(
+        total_vendidos=Sum('total_vendidos'),
+        valor_inventario=Sum(F('precio') * F('stock_total'), output_field=DecimalField()),
+    )
+    total_vendidos = totales_productos['total_vendidos'] or 0
 
-    # Ventas del mes
+    # Ventas del mes (incluye el archivo si el mes llega hasta él)
     primer_dia_mes = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    ventas_mes = Pedido.objects.filter(
-        fecha_pedido__gte=primer_dia_mes,
-        estado='entregado'
-    ).aggregate(Sum('total'))['total__sum'] or 0
-
-    pedidos_completados_mes = Pedido.objects.filter(
-        fecha_pedido__gte=primer_dia_mes,
-        estado='entregado'
-    ).count()
+    entregados_mes = ArchivoPedidos.totales(desde=primer_dia_mes, estado='entregado')
+    ventas_mes = entregados_mes['total']
+    pedidos_completados_mes = entregados_mes['pedidos']
 
     # Productos sin stock
-    productos_sin_stock = productos.filter(
-        tallas__stock=0
-    ).distinct().count()
+    productos_sin_stock = productos.filter(en_stock=False).count()
 
     # Valor total inventario
-    valor_inventario = sum(p.precio * p.stock_total() for p in productos)
+    valor_inventario = totales_productos['valor_inventario'] or 0
 
-    # Ticket promedio
-    tickets = Pedido.objects.filter(total__gt=0)
-    ticket_promedio = sum(p.total for p in tickets) / tickets.count() if tickets.count() > 0 else 0
+    # Ticket promedio de todos los pedidos, activos y archivados
+    tickets = ArchivoPedidos.totales(total__gt=0)
+    ticket_promedio = tickets['total'] / tickets['pedidos'] if tickets['pedidos'] else 0
 
     return render(request, 'admin/reportes.html', {
         'productos': productos,
@@ -770,16 +840,36 @@ def admin_reportes(request):
 def actualizar_ventas(request):
     """Vista para actualizar contadores de ventas manualmente"""
     if request.method == 'POST':
-        productos_actualizados = Producto.actualizar_todas_las_ventas()
+        resultado = RecalculoVentas.recalcular(incremental=request.POST.get('modo') == 'incremental')
         return JsonResponse({
             'success': True,
-            'productos_actualizados': productos_actualizados,
-            'message': f'Se actualizaron {productos_actualizados} productos.'
+            'productos_actualizados': resultado['actualizados'],
+            'resultado': resultado,
+            'message': f'Se actualizaron {resultado["actualizados"]} productos.'
         })
 
     return JsonResponse({'success': False, 'message': 'Método no permitido'})
 
 
+@user_passes_test(es_admin)
+def estadisticas_autocompletado(request):
+    """Tamaño y tasa de aciertos del índice de autocompletado de este worker"""
+    return JsonResponse({
+        'success': True,
+        'estadisticas': IndiceAutocompletado.estadisticas()
+    })
+
+
+@user_passes_test(es_admin)
+def estadisticas_cola_pedidos(request):
+    """Profundidad y latencia de la cola de pedidos (modo CHECKOUT_EN_COLA)"""
+    return JsonResponse({
+        'success': True,
+        'activo': settings.CHECKOUT_EN_COLA,
+        'estadisticas': ColaPedidos.estadisticas()
+    })
+
+
 # ======================
 # SERVICIO WEB JSON API
 # ======================
@@ -797,27 +887,22 @@ def api_productos_stock(request):
     Método: GET
     Formato de respuesta: JSON
     """
-    # Obtener solo productos que tienen stock disponible
-    productos_con_stock = Producto.objects.filter(
-        tallas__stock__gt=0
-    ).distinct().select_related('categoria').prefetch_related('tallas')
+    # Obtener solo productos que tienen stock disponible (modelo de lectura, sin JOIN)
+    productos_con_stock = ProductoCatalogo.objects.filter(en_stock=True).order_by('pk')
 
     # Construir lista de productos en formato JSON
     productos_data = []
     for producto in productos_con_stock:
         # Obtener URL completa del producto
-        producto_url = request.build_absolute_uri(f'/producto/{producto.id}/')
-
-        # Obtener tallas disponibles con stock
-        tallas_disponibles = []
-        for talla in producto.tallas.filter(stock__gt=0):
-            tallas_disponibles.append({
-                'talla': talla.talla,
-                'stock': talla.stock
-            })
+        producto_url = request.build_absolute_uri(f'/producto/{producto.pk}/')
+
+        # Tallas disponibles con stock (guardadas en la propia fila)
+        tallas_disponibles = [
+            {'talla': talla, 'stock': stock} for talla, stock in producto.tallas_disponibles()
+        ]
 
         productos_data.append({
-            'id': producto.id,
+            'id': producto.pk,
             'nombre': producto.nombre,
             'descripcion': producto.descripcion,
             'precio': float(producto.precio),
@@ -825,14 +910,14 @@ def api_productos_stock(request):
             'color': producto.color,
             'material': producto.material,
             'categoria': {
-                'id': producto.categoria.id,
-                'nombre': producto.categoria.nombre
+                'id': producto.categoria_id,
+                'nombre': producto.categoria_nombre
             },
-            'stock_total': producto.stock_total(),
+            'stock_total': producto.stock_total,
             'tallas_disponibles': tallas_disponibles,
             'total_vendidos': producto.total_vendidos,
             'url': producto_url,
-            'imagen_principal': producto.imagen_principal.url if producto.imagen_principal else None
+            'imagen_principal': producto.obtener_imagen_principal()
         })
 
     # Respuesta JSON
@@ -868,7 +953,7 @@ def _generar_reporte_productos(generador_reporte: ReporteInterface, formato: str
         HttpResponse con el reporte generado
     """
     # Obtener productos con sus datos
-    productos = Producto.objects.select_related('categoria').prefetch_related('tallas').all()
+    productos = Producto.objects.select_related('categoria').all()
 
     # Preparar datos para el reporte
     datos_reporte = []
@@ -881,7 +966,7 @@ def _generar_reporte_productos(generador_reporte: ReporteInterface, formato: str
             'Precio': float(producto.precio),
             'Color': producto.color,
             'Material': producto.material,
-            'Stock': producto.stock_total(),
+            'Stock': producto.stock_total,
             'Vendidos': producto.total_vendidos
         })
 